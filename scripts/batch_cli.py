@@ -4,14 +4,19 @@ from __future__ import annotations
 import argparse
 import json
 import sys
+from collections.abc import Iterator
 from dataclasses import asdict
 from pathlib import Path
 
+from ai_headshot_studio.config import get_settings
 from ai_headshot_studio.processing import (
     ProcessingError,
     ProcessRequest,
-    process_image,
-    to_bytes,
+    Rendition,
+    encode_result,
+    parse_renditions,
+    process_images_with_warnings,
+    process_renditions,
 )
 
 
@@ -29,6 +34,12 @@ def parse_args(argv: list[str]) -> argparse.Namespace:
         help="Continue processing after failures and write errors.json.",
     )
     parser.add_argument("--limit", type=int, default=0, help="Optional max images to process.")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=0,
+        help="Images per background-removal batch (default: AI_HEADSHOT_MATTING_BATCH_SIZE).",
+    )
 
     # Core processing options (subset of API fields).
     parser.add_argument("--remove-bg", action="store_true", help="Run local background removal.")
@@ -44,6 +55,47 @@ def parse_args(argv: list[str]) -> argparse.Namespace:
     parser.add_argument("--soften", type=float, default=0.0)
     parser.add_argument("--jpeg-quality", type=int, default=92)
     parser.add_argument("--format", default="png", help="png|jpeg|webp")
+    parser.add_argument(
+        "--resize-quality", default="high", help="high|balanced|fast (preset resize speed tier)"
+    )
+    parser.add_argument(
+        "--matte-quality",
+        default="full",
+        help="full|balanced|fast (background-removal inference resolution)",
+    )
+    parser.add_argument(
+        "--matting-backend",
+        default=None,
+        help="rembg|grabcut|none (defaults to AI_HEADSHOT_MATTING_BACKEND)",
+    )
+    parser.add_argument(
+        "--encode-profile",
+        default="smallest",
+        help="fast|balanced|smallest (encoder speed vs output size)",
+    )
+    parser.add_argument(
+        "--max-bytes",
+        type=int,
+        default=0,
+        help="Cap each JPEG/WebP output at this many bytes by lowering quality (0 = off)",
+    )
+    parser.add_argument(
+        "--progressive", action="store_true", help="Write progressive JPEGs (faster first paint)"
+    )
+    parser.add_argument(
+        "--subsampling", default=None, help="4:4:4|4:2:2|4:2:0 JPEG chroma subsampling"
+    )
+    parser.add_argument(
+        "--qtables", default=None, help="standard|robidoux JPEG quantization tables"
+    )
+    parser.add_argument(
+        "--renditions",
+        default=None,
+        help=(
+            "Comma-separated preset:format pairs (e.g. avatar-400:jpeg,avatar-400:webp). "
+            "Overrides --preset/--format and decodes each input once."
+        ),
+    )
     return parser.parse_args(argv)
 
 
@@ -70,6 +122,61 @@ def safe_stem(path: Path) -> str:
     return cleaned[:80]
 
 
+def iter_outputs(
+    paths: list[Path],
+    req: ProcessRequest,
+    renditions: list[Rendition] | None,
+    *,
+    batch_size: int,
+) -> Iterator[tuple[Path, list[tuple[str, bytes]] | Exception]]:
+    """Yield encoded outputs (or the failure) per input path, in order.
+
+    Single-preset runs read and process `batch_size` files at a time so background
+    removal can batch inference; rendition runs fan each file out individually.
+    """
+
+    if renditions is not None:
+        for path in paths:
+            try:
+                data = path.read_bytes()
+                outputs = []
+                for item in process_renditions(data, req, renditions):
+                    fmt = item.rendition.output_format
+                    payload, _quality = encode_result(item.image, req, fmt)
+                    outputs.append(
+                        (f"{safe_stem(path)}-{item.rendition.preset}{output_suffix(fmt)}", payload)
+                    )
+            except (ProcessingError, OSError, ValueError) as exc:
+                yield path, exc
+                continue
+            yield path, outputs
+        return
+
+    for start in range(0, len(paths), max(1, batch_size)):
+        reads: list[tuple[Path, bytes | OSError]] = []
+        for path in paths[start : start + max(1, batch_size)]:
+            try:
+                reads.append((path, path.read_bytes()))
+            except OSError as exc:
+                reads.append((path, exc))
+        datas = [read for _path, read in reads if isinstance(read, bytes)]
+        processed = iter(process_images_with_warnings(datas, req, batch_size=batch_size))
+        for path, read in reads:
+            if isinstance(read, OSError):
+                yield path, read
+                continue
+            outcome = next(processed)
+            if isinstance(outcome, ProcessingError):
+                yield path, outcome
+                continue
+            try:
+                payload, _quality = encode_result(outcome[0], req)
+            except ProcessingError as exc:
+                yield path, exc
+                continue
+            yield path, [(safe_stem(path) + output_suffix(req.output_format), payload)]
+
+
 def write_zip(zip_path: Path, files: list[Path], *, errors_path: Path | None) -> None:
     import zipfile
 
@@ -109,8 +216,24 @@ def main(argv: list[str]) -> int:
         soften=float(args.soften),
         jpeg_quality=int(args.jpeg_quality),
         output_format=str(args.format),
+        resize_quality=str(args.resize_quality),
+        matte_quality=str(args.matte_quality),
+        matting_backend=args.matting_backend,
+        encode_profile=str(args.encode_profile),
+        max_bytes=int(args.max_bytes) or None,
+        jpeg_progressive=bool(args.progressive),
+        jpeg_subsampling=args.subsampling,
+        jpeg_qtables=args.qtables,
     )
 
+    renditions = None
+    if args.renditions:
+        try:
+            renditions = parse_renditions(str(args.renditions))
+        except ProcessingError as exc:
+            print(f"Invalid --renditions: {exc}", file=sys.stderr)
+            return 2
+
     report: dict[str, object] = {
         "total": len(images),
         "succeeded": 0,
@@ -118,21 +241,23 @@ def main(argv: list[str]) -> int:
         "errors": [],
         "settings": asdict(req),
     }
+    if renditions is not None:
+        report["renditions"] = [asdict(item) for item in renditions]
 
     written: list[Path] = []
     had_error = False
 
-    for path in images:
+    batch_size = int(args.batch_size) or (get_settings().matting_batch_size if req.remove_bg else 1)
+    for path, outputs in iter_outputs(images, req, renditions, batch_size=batch_size):
         try:
-            data = path.read_bytes()
-            result = process_image(data, req)
-            payload = to_bytes(result, req.output_format, req.jpeg_quality)
-            out_name = safe_stem(path) + output_suffix(req.output_format)
-            out_path = output_dir / out_name
-            out_path.write_bytes(payload)
-            written.append(out_path)
+            if isinstance(outputs, Exception):
+                raise outputs
+            for out_name, payload in outputs:
+                out_path = output_dir / out_name
+                out_path.write_bytes(payload)
+                written.append(out_path)
+                print(f"ok  {path.name} -> {out_path.name}")
             report["succeeded"] = int(report["succeeded"]) + 1
-            print(f"ok  {path.name} -> {out_path.name}")
         except (ProcessingError, OSError, ValueError) as exc:
             had_error = True
             report["failed"] = int(report["failed"]) + 1
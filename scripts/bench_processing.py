@@ -3,6 +3,7 @@ from __future__ import annotations
 
 import argparse
 import io
+import json
 import statistics
 import sys
 import time
@@ -25,6 +26,178 @@ def _make_png(width: int, height: int) -> bytes:
     return buf.getvalue()
 
 
+def _make_textured(width: int, height: int):
+    from PIL import Image, ImageChops
+
+    # Gradient + noise gives the resampling filters real high-frequency detail.
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 48)
+    red = ImageChops.add(gradient, noise, scale=2.0)
+    return Image.merge("RGB", (red, gradient, noise))
+
+
+def bench_resize(width: int, height: int, iters: int) -> None:
+    from PIL import ImageChops, ImageStat
+
+    from ai_headshot_studio.processing import RESIZE_QUALITIES, resize_if_needed
+
+    source = _make_textured(width, height)
+    reference = resize_if_needed(source, 400, 400, quality="high")
+    for quality in RESIZE_QUALITIES:
+        times_ms: list[float] = []
+        for _ in range(iters):
+            start = time.perf_counter()
+            result = resize_if_needed(source, 400, 400, quality=quality)
+            times_ms.append((time.perf_counter() - start) * 1000.0)
+        diff = ImageStat.Stat(ImageChops.difference(reference, result)).mean
+        print(
+            "bench_resize:",
+            f"{width}x{height}->400x400",
+            f"quality={quality}",
+            f"p50_ms={statistics.median(times_ms):.1f}",
+            f"mean_abs_diff={sum(diff) / len(diff):.3f}",
+            sep=" ",
+        )
+
+
+def bench_matte(width: int, height: int, iters: int) -> None:
+    from ai_headshot_studio.matting import MATTE_QUALITIES
+    from ai_headshot_studio.processing import remove_background
+
+    source = _make_textured(width, height)
+    for quality in MATTE_QUALITIES:
+        times_ms: list[float] = []
+        for _ in range(iters):
+            start = time.perf_counter()
+            remove_background(source, quality=quality)
+            times_ms.append((time.perf_counter() - start) * 1000.0)
+        print(
+            "bench_matte:",
+            f"{width}x{height}",
+            f"quality={quality}",
+            f"p50_ms={statistics.median(times_ms):.1f}",
+            sep=" ",
+        )
+
+
+def bench_encode(width: int, height: int, iters: int) -> None:
+    from PIL import ImageFilter
+
+    from ai_headshot_studio.processing import ENCODE_PROFILES, to_bytes
+
+    # Softened texture compresses more like a photo than raw noise does.
+    source = _make_textured(width, height).filter(ImageFilter.GaussianBlur(2))
+    print(f"bench_encode: {width}x{height} iters={iters}")
+    print(f"{'format':<6} {'profile':<9} {'p50_ms':>9} {'bytes':>10} {'vs_smallest':>11}")
+    for fmt in ("png", "jpeg", "webp"):
+        rows: list[tuple[str, float, int]] = []
+        for profile in ENCODE_PROFILES:
+            times_ms: list[float] = []
+            payload = b""
+            for _ in range(iters):
+                start = time.perf_counter()
+                payload = to_bytes(source, fmt, 92, profile=profile)
+                times_ms.append((time.perf_counter() - start) * 1000.0)
+            rows.append((profile, statistics.median(times_ms), len(payload)))
+        smallest = dict((name, size) for name, _ms, size in rows)["smallest"]
+        for profile, p50, size in rows:
+            print(f"{fmt:<6} {profile:<9} {p50:>9.1f} {size:>10} {size / smallest:>10.2f}x")
+
+
+def bench_jpeg(width: int, height: int, iters: int, quality: int) -> None:
+    import itertools
+
+    from PIL import Image, ImageChops, ImageFilter, ImageStat
+
+    from ai_headshot_studio.processing import JPEG_QTABLES, JPEG_SUBSAMPLING, encode_image
+
+    source = _make_textured(width, height).filter(ImageFilter.GaussianBlur(2))
+    print(f"bench_jpeg: {width}x{height} quality={quality} iters={iters}")
+    header = f"{'mode':<12} {'chroma':<6} {'qtables':<9} {'p50_ms':>8} {'bytes':>9}"
+    print(f"{header} {'mean_abs_diff':>13}")
+    combos = itertools.product((False, True), JPEG_SUBSAMPLING, JPEG_QTABLES)
+    for progressive, chroma, tables in combos:
+        times_ms: list[float] = []
+        payload = b""
+        for _ in range(iters):
+            start = time.perf_counter()
+            payload, _quality = encode_image(
+                source,
+                "jpeg",
+                quality,
+                progressive=progressive,
+                subsampling=chroma,
+                qtables=tables,
+            )
+            times_ms.append((time.perf_counter() - start) * 1000.0)
+        with Image.open(io.BytesIO(payload)) as decoded:
+            diff = ImageStat.Stat(ImageChops.difference(source, decoded.convert("RGB"))).mean
+        mode = "progressive" if progressive else "baseline"
+        print(
+            f"{mode:<12} {chroma:<6} {tables:<9} {statistics.median(times_ms):>8.1f} "
+            f"{len(payload):>9} {sum(diff) / len(diff):>13.3f}"
+        )
+
+
+def _iou(a: tuple[int, int, int, int], b: tuple[int, int, int, int]) -> float:
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    inter_w = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    inter_h = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = inter_w * inter_h
+    union = aw * ah + bw * bh - inter
+    return inter / union if union else 0.0
+
+
+def bench_faces(fixtures: Path, iters: int, scale_factor: float | None) -> None:
+    from PIL import Image
+
+    from ai_headshot_studio.faces import detect_face
+    from ai_headshot_studio.processing import load_image
+
+    # Every fixture is expected to contain one face. An optional labels.json
+    # ({"name.jpg": [x, y, w, h]}) makes a hit require IoU >= 0.3 with the label.
+    labels_path = fixtures / "labels.json"
+    labels = json.loads(labels_path.read_text()) if labels_path.exists() else {}
+    paths = sorted(
+        p
+        for p in fixtures.iterdir()
+        if p.suffix.lower() in {".jpg", ".jpeg", ".png", ".webp"} and p.is_file()
+    )
+    if not paths:
+        raise SystemExit(f"No fixture images found in {fixtures}")
+    images: list[tuple[str, Image.Image]] = [(p.name, load_image(p.read_bytes())) for p in paths]
+
+    modes = {
+        # The previous detector: one full-frame pass at 900px.
+        "single-900": {"detect_size": 900, "refine_size": 0},
+        "pyramid": {},
+    }
+    for mode, kwargs in modes.items():
+        times_ms: list[float] = []
+        hits = 0
+        for name, image in images:
+            found = None
+            for _ in range(iters):
+                start = time.perf_counter()
+                found = detect_face(image, scale_factor=scale_factor, **kwargs)
+                times_ms.append((time.perf_counter() - start) * 1000.0)
+            label = labels.get(name)
+            if found is not None and (label is None or _iou(found, tuple(label)) >= 0.3):
+                hits += 1
+        times_ms.sort()
+        p95 = times_ms[max(0, int(round(len(times_ms) * 0.95)) - 1)]
+        print(
+            "bench_faces:",
+            f"mode={mode}",
+            f"images={len(images)}",
+            f"recall={hits / len(images):.3f}",
+            f"p50_ms={statistics.median(times_ms):.1f}",
+            f"p95_ms={p95:.1f}",
+            sep=" ",
+        )
+
+
 def main() -> int:
     parser = argparse.ArgumentParser(description="Local processing micro-benchmark (best-effort).")
     parser.add_argument("--width", type=int, default=1800)
@@ -32,6 +205,42 @@ def main() -> int:
     parser.add_argument("--iters", type=int, default=12)
     parser.add_argument("--warmup", type=int, default=2)
     parser.add_argument("--format", choices=["png", "jpeg", "webp"], default="jpeg")
+    parser.add_argument("--preset", default="portrait-4x5")
+    parser.add_argument("--resize-quality", choices=["high", "balanced", "fast"], default="high")
+    parser.add_argument(
+        "--compare-resize",
+        action="store_true",
+        help="Time preset resizing per quality tier and report difference vs `high`.",
+    )
+    parser.add_argument(
+        "--encode-profile", choices=["fast", "balanced", "smallest"], default="smallest"
+    )
+    parser.add_argument(
+        "--compare-encode",
+        action="store_true",
+        help="Table of encode time vs output bytes per format and encode profile.",
+    )
+    parser.add_argument(
+        "--compare-jpeg",
+        action="store_true",
+        help="JPEG size/time/error per progressive mode, chroma subsampling and qtables.",
+    )
+    parser.add_argument("--jpeg-quality", type=int, default=92)
+    parser.add_argument("--remove-bg", action="store_true", help="Include background removal.")
+    parser.add_argument("--matte-quality", choices=["full", "balanced", "fast"], default="full")
+    parser.add_argument(
+        "--compare-matte",
+        action="store_true",
+        help="Time background removal per matte quality tier (requires rembg).",
+    )
+    parser.add_argument(
+        "--compare-faces",
+        type=Path,
+        default=None,
+        metavar="DIR",
+        help="Face-detection recall/latency on a local fixture folder (requires OpenCV).",
+    )
+    parser.add_argument("--face-scale-factor", type=float, default=None)
     args = parser.parse_args()
 
     if args.iters <= 0:
@@ -39,14 +248,30 @@ def main() -> int:
 
     _ensure_import_path()
 
+    if args.compare_resize:
+        bench_resize(args.width, args.height, args.iters)
+        return 0
+    if args.compare_encode:
+        bench_encode(args.width, args.height, args.iters)
+        return 0
+    if args.compare_jpeg:
+        bench_jpeg(args.width, args.height, args.iters, args.jpeg_quality)
+        return 0
+    if args.compare_matte:
+        bench_matte(args.width, args.height, args.iters)
+        return 0
+    if args.compare_faces is not None:
+        bench_faces(args.compare_faces, args.iters, args.face_scale_factor)
+        return 0
+
     from ai_headshot_studio.processing import ProcessRequest, process_image, to_bytes
 
     data = _make_png(args.width, args.height)
     req = ProcessRequest(
-        remove_bg=False,
+        remove_bg=bool(args.remove_bg),
         background="white",
         background_hex=None,
-        preset="portrait-4x5",
+        preset=args.preset,
         style="classic",
         top_bias=0.2,
         brightness=1.0,
@@ -56,6 +281,9 @@ def main() -> int:
         soften=0.0,
         jpeg_quality=92,
         output_format=args.format,
+        resize_quality=args.resize_quality,
+        matte_quality=args.matte_quality,
+        encode_profile=args.encode_profile,
     )
 
     times_ms: list[float] = []
@@ -65,7 +293,7 @@ def main() -> int:
     for i in range(total):
         start = time.perf_counter()
         result = process_image(data, req)
-        payload = to_bytes(result, args.format, req.jpeg_quality)
+        payload = to_bytes(result, args.format, req.jpeg_quality, profile=req.encode_profile)
         elapsed_ms = (time.perf_counter() - start) * 1000.0
         if i >= args.warmup:
             times_ms.append(elapsed_ms)
@@ -79,8 +307,12 @@ def main() -> int:
     print(
         "bench_processing:",
         f"{args.width}x{args.height}",
-        "preset=portrait-4x5",
+        f"preset={args.preset}",
+        f"resize_quality={args.resize_quality}",
+        f"remove_bg={bool(args.remove_bg)}",
+        f"matte_quality={args.matte_quality}",
         f"format={args.format}",
+        f"encode_profile={args.encode_profile}",
         f"iters={args.iters}",
         f"p50_ms={p50:.1f}",
         f"p95_ms={p95:.1f}",
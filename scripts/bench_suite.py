@@ -0,0 +1,620 @@
+#!/usr/bin/env python3
+"""Scenario benchmark for the processing pipeline on photo-like fixtures.
+
+Fixtures are generated procedurally (no files to download): smooth gradients,
+sensor-style noise, a synthetic portrait with skin tones, the same portrait as an
+alpha-matted RGBA PNG, and an EXIF-rotated JPEG, at 1-20 MP. Each scenario runs
+`process_image_with_warnings` plus encoding and reports total and per-stage
+latency (stage boundaries are the pipeline's cancellation checkpoints).
+Background removal uses the `none` matting backend so no model is needed.
+
+`--save-baseline PATH` stores the results; `--compare PATH` checks a run (or an
+existing `--results` file) against that baseline and exits 1 on a regression.
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import itertools
+import json
+import math
+import platform
+import statistics
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+
+def _ensure_import_path() -> None:
+    root = Path(__file__).resolve().parents[1]
+    src = root / "src"
+    if str(src) not in sys.path:
+        sys.path.insert(0, str(src))
+
+
+FIXTURES = ("gradient", "noise", "face", "alpha", "exif")
+DEFAULT_SIZES = (1.0, 4.0)
+# EXIF Orientation 6: stored rotated, displayed 90 degrees clockwise.
+_EXIF_ORIENTATION = 0x0112
+
+
+@dataclass(frozen=True)
+class Scenario:
+    fixture: str
+    megapixels: float
+    preset: str = "portrait-4x5"
+    style: str | None = None
+    output_format: str = "jpeg"
+    remove_bg: bool = False
+
+    @property
+    def name(self) -> str:
+        parts = [
+            self.fixture,
+            f"{self.megapixels:g}mp",
+            self.preset,
+            self.style or "plain",
+            self.output_format,
+        ]
+        if self.remove_bg:
+            parts.append("matte")
+        return "-".join(parts)
+
+
+def _dimensions(megapixels: float) -> tuple[int, int]:
+    from ai_headshot_studio.processing import MAX_PIXELS
+
+    # 3:4 portrait frame, kept under the upload pixel limit.
+    pixels = min(megapixels * 1_000_000, MAX_PIXELS)
+    width = max(16, int(math.sqrt(pixels * 3 / 4)))
+    return width, max(16, int(width * 4 / 3))
+
+
+def _backdrop(width: int, height: int) -> Any:
+    from PIL import Image, ImageOps
+
+    gradient = Image.linear_gradient("L").resize((width, height))
+    return ImageOps.colorize(gradient, (38, 58, 88), (176, 192, 210))
+
+
+def _with_noise(image: Any, sigma: float, seed: int = 0) -> Any:
+    """Blend in seeded uniform noise with roughly `sigma` standard deviation.
+
+    `Image.effect_noise` is unseeded; fixtures must be identical run to run so
+    output bytes are comparable against a baseline.
+    """
+
+    import random
+
+    from PIL import Image
+
+    raw = random.Random(seed).randbytes(image.width * image.height)
+    scale = sigma / 73.9  # std of uniform 0..255
+    noise = Image.frombytes("L", image.size, raw).point(
+        lambda value: int(128 + (value - 128) * scale)
+    )
+    return Image.blend(image, noise.convert("RGB"), 0.18)
+
+
+def _portrait(width: int, height: int) -> tuple[Any, Any]:
+    """A studio-style portrait (skin-toned head, neck, shoulders) and its matte."""
+
+    from PIL import Image, ImageDraw, ImageFilter
+
+    image = _with_noise(_backdrop(width, height), 32)
+    mask = Image.new("L", (width, height), 0)
+    draw = ImageDraw.Draw(image)
+    matte = ImageDraw.Draw(mask)
+
+    def both(shape: str, box: tuple[float, float, float, float], fill: tuple[int, ...]) -> None:
+        getattr(draw, shape)(box, fill=fill)
+        getattr(matte, shape)(box, fill=255)
+
+    cx = width / 2
+    head_w, head_h = width * 0.34, height * 0.30
+    head_top = height * 0.16
+    both("ellipse", (0, height * 0.72, width, height * 1.25), (44, 52, 70))  # shoulders
+    both(
+        "rectangle",
+        (cx - head_w * 0.2, head_top + head_h * 0.8, cx + head_w * 0.2, height * 0.76),
+        (208, 154, 124),
+    )
+    both(
+        "ellipse", (cx - head_w / 2, head_top, cx + head_w / 2, head_top + head_h), (222, 171, 140)
+    )
+    # Hair behind the top of the head, then the face drawn back over it.
+    both(
+        "ellipse",
+        (
+            cx - head_w * 0.55,
+            head_top - head_h * 0.08,
+            cx + head_w * 0.55,
+            head_top + head_h * 0.35,
+        ),
+        (58, 40, 30),
+    )
+    draw.ellipse(
+        (cx - head_w * 0.45, head_top + head_h * 0.2, cx + head_w * 0.45, head_top + head_h),
+        fill=(222, 171, 140),
+    )
+    eye_y = head_top + head_h * 0.45
+    for side in (-1, 1):
+        ex = cx + side * head_w * 0.2
+        draw.ellipse(
+            (ex - head_w * 0.07, eye_y - head_h * 0.03, ex + head_w * 0.07, eye_y + head_h * 0.03),
+            fill=(40, 32, 30),
+        )
+    mouth_y = head_top + head_h * 0.75
+    draw.ellipse(
+        (
+            cx - head_w * 0.14,
+            mouth_y - head_h * 0.025,
+            cx + head_w * 0.14,
+            mouth_y + head_h * 0.025,
+        ),
+        fill=(160, 84, 80),
+    )
+
+    # Skin texture and soft edges, like a real photo and a real matte.
+    image = Image.blend(image, _with_noise(image, 20, seed=1), 0.5)
+    image = image.filter(ImageFilter.GaussianBlur(1))
+    return image, mask.filter(ImageFilter.GaussianBlur(2))
+
+
+def make_fixture(kind: str, megapixels: float) -> bytes:
+    """Encode one procedural fixture the way a client would upload it."""
+
+    from PIL import Image
+
+    width, height = _dimensions(megapixels)
+    buffer = io.BytesIO()
+    if kind == "gradient":
+        _backdrop(width, height).save(buffer, format="JPEG", quality=90)
+    elif kind == "noise":
+        _with_noise(_backdrop(width, height), 48).save(buffer, format="JPEG", quality=90)
+    elif kind == "face":
+        _portrait(width, height)[0].save(buffer, format="JPEG", quality=90)
+    elif kind == "alpha":
+        image, mask = _portrait(width, height)
+        image.putalpha(mask)
+        image.save(buffer, format="PNG", compress_level=1)
+    elif kind == "exif":
+        image = _portrait(width, height)[0].transpose(Image.Transpose.ROTATE_90)
+        exif = Image.Exif()
+        exif[_EXIF_ORIENTATION] = 6
+        image.save(buffer, format="JPEG", quality=90, exif=exif.tobytes())
+    else:
+        raise ValueError(f"Unknown fixture: {kind}")
+    return buffer.getvalue()
+
+
+def build_matrix(fixtures: list[str], sizes: list[float], matrix: str) -> list[Scenario]:
+    if matrix == "full":
+        return [
+            Scenario(fixture, size, preset, style, fmt, remove_bg)
+            for fixture, size, preset, style, fmt, remove_bg in itertools.product(
+                fixtures,
+                sizes,
+                ("portrait-4x5", "avatar-400", "passport-2x2"),
+                (None, "classic"),
+                ("png", "jpeg", "webp"),
+                (False, True),
+            )
+        ]
+    scenarios: list[Scenario] = []
+    for fixture, size in itertools.product(fixtures, sizes):
+        scenarios.append(Scenario(fixture, size))
+        if fixture in {"face", "alpha"}:
+            # The expensive paths: matting, retouch + skin check, resize, lossless output.
+            scenarios.append(Scenario(fixture, size, "avatar-400", "classic", "webp", True))
+            scenarios.append(Scenario(fixture, size, "passport-2x2", "studio", "png", True))
+    return scenarios
+
+
+def _request(scenario: Scenario) -> Any:
+    from ai_headshot_studio.processing import ProcessRequest
+
+    return ProcessRequest(
+        remove_bg=scenario.remove_bg,
+        background="white",
+        background_hex=None,
+        preset=scenario.preset,
+        style=scenario.style,
+        top_bias=0.2,
+        brightness=1.0,
+        contrast=1.0,
+        color=1.0,
+        sharpness=1.0,
+        soften=0.0,
+        jpeg_quality=92,
+        output_format=scenario.output_format,
+        matting_backend="none" if scenario.remove_bg else None,
+    )
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile (`pct` in 0-100)."""
+
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class RssSampler:
+    """Peak resident set size while the block runs, polled from a side thread.
+
+    Falls back to the process-lifetime `ru_maxrss` where /proc is unavailable.
+    """
+
+    def __init__(self, interval_s: float = 0.002) -> None:
+        self.interval_s = interval_s
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self) -> None:
+        from ai_headshot_studio.profiling import current_rss
+
+        rss = current_rss()
+        if rss is not None:
+            self.peak = max(self.peak, rss)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            self._sample()
+
+    def __enter__(self) -> RssSampler:
+        self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        if self.peak == 0:
+            import resource
+
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.peak = maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def _spread(values: list[float]) -> float:
+    """Robust standard deviation estimate (scaled median absolute deviation)."""
+
+    if len(values) < 2:
+        return 0.0
+    center = statistics.median(values)
+    return 1.4826 * statistics.median(abs(value - center) for value in values)
+
+
+def profile_memory(scenario: Scenario, data: bytes) -> dict[str, Any]:
+    """One extra, untimed run with per-stage Python-heap and RSS peaks."""
+
+    from ai_headshot_studio.pipeline import PipelineContext
+    from ai_headshot_studio.processing import encode_result, process_image_with_warnings
+    from ai_headshot_studio.profiling import MemoryProfiler
+
+    req = _request(scenario)
+    with MemoryProfiler() as profiler:
+        ctx = PipelineContext(memory=profiler)
+        result, _warnings = process_image_with_warnings(data, req, ctx=ctx)
+        ctx.checkpoint("encode")
+        encode_result(result, req)
+        del result
+    return {"stages": profiler.stages(), "peak_rss_bytes": profiler.peak_rss}
+
+
+def run_scenario(
+    scenario: Scenario, data: bytes, *, iters: int, warmup: int, memory: bool = False
+) -> dict[str, Any]:
+    from ai_headshot_studio.pipeline import PipelineContext
+    from ai_headshot_studio.processing import encode_result, process_image_with_warnings
+
+    req = _request(scenario)
+    totals: list[float] = []
+    stages: dict[str, list[float]] = {}
+    payload = b""
+    for _ in range(warmup):
+        result, _warnings = process_image_with_warnings(data, req)
+        encode_result(result, req)
+    with RssSampler() as rss:
+        for _ in range(iters):
+            ctx = PipelineContext()
+            start = time.perf_counter()
+            result, _warnings = process_image_with_warnings(data, req, ctx=ctx)
+            ctx.checkpoint("encode")
+            payload, _quality = encode_result(result, req)
+            totals.append((time.perf_counter() - start) * 1000.0)
+            for stage, ms in ctx.stage_timings().items():
+                stages.setdefault(stage, []).append(ms)
+    mean_ms = statistics.fmean(totals)
+    report: dict[str, Any] = {
+        "name": scenario.name,
+        "scenario": asdict(scenario),
+        "input_bytes": len(data),
+        "iters": iters,
+        "total_ms": {
+            "p50": statistics.median(totals),
+            "p95": percentile(totals, 95),
+            "p99": percentile(totals, 99),
+            "mean": mean_ms,
+            "spread": _spread(totals),
+        },
+        "samples_ms": totals,
+        "throughput_ips": 1000.0 / mean_ms if mean_ms > 0 else 0.0,
+        "stages_ms": {stage: statistics.median(values) for stage, values in stages.items()},
+        "peak_rss_bytes": rss.peak,
+        "output_bytes": len(payload),
+    }
+    if memory:
+        report["memory"] = profile_memory(scenario, data)
+    return report
+
+
+def run_suite(
+    scenarios: list[Scenario],
+    *,
+    iters: int,
+    warmup: int,
+    memory: bool = False,
+    log: Any = None,
+) -> dict[str, Any]:
+    import PIL
+
+    fixtures: dict[tuple[str, float], bytes] = {}
+    results = []
+    for scenario in scenarios:
+        key = (scenario.fixture, scenario.megapixels)
+        if key not in fixtures:
+            fixtures[key] = make_fixture(*key)
+        result = run_scenario(scenario, fixtures[key], iters=iters, warmup=warmup, memory=memory)
+        results.append(result)
+        if log is not None:
+            log(result)
+    return {
+        "meta": {
+            "created": datetime.now(UTC).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pillow": PIL.__version__,
+            "platform": platform.platform(),
+            "iters": iters,
+            "warmup": warmup,
+        },
+        "scenarios": results,
+    }
+
+
+def _print_row(result: dict[str, Any]) -> None:
+    total = result["total_ms"]
+    stages = " ".join(f"{stage}={ms:.1f}" for stage, ms in result["stages_ms"].items())
+    print(
+        f"{result['name']:<52} p50_ms={total['p50']:>8.1f} p95_ms={total['p95']:>8.1f} "
+        f"bytes={result['output_bytes']:>9}  {stages}",
+        flush=True,
+    )
+    if "memory" in result:
+        mib = 1024 * 1024
+        per_stage = " ".join(
+            f"{stage}={values['py_bytes'] / mib:.1f}/{values['rss_bytes'] / mib:.1f}"
+            for stage, values in result["memory"]["stages"].items()
+        )
+        peak = result["memory"]["peak_rss_bytes"] / mib
+        print(f"{'':<52} memory_mib(py/rss) peak_rss={peak:.1f}  {per_stage}", flush=True)
+
+
+@dataclass(frozen=True)
+class Thresholds:
+    """When a scenario counts as regressed against its baseline.
+
+    Latency regresses when the p50 grows by more than the largest of
+    `max_slowdown` (relative), `min_delta_ms`, and `noise_k` times the wider of the
+    two runs' sample spreads, so jittery scenarios need a bigger move to fail.
+    """
+
+    max_slowdown: float = 0.10
+    min_delta_ms: float = 2.0
+    noise_k: float = 3.0
+    max_bytes_growth: float = 0.02
+    max_rss_growth: float = 0.20
+
+
+def _growth(base: float, new: float) -> float:
+    return (new - base) / base if base > 0 else 0.0
+
+
+def compare_reports(
+    baseline: dict[str, Any], current: dict[str, Any], thresholds: Thresholds
+) -> list[dict[str, Any]]:
+    """One row per scenario in either report; `status` is ok/faster/regressed/new/missing."""
+
+    base_by_name = {item["name"]: item for item in baseline.get("scenarios", [])}
+    rows: list[dict[str, Any]] = []
+    seen: set[str] = set()
+    for item in current.get("scenarios", []):
+        name = item["name"]
+        seen.add(name)
+        base = base_by_name.get(name)
+        if base is None:
+            rows.append({"name": name, "status": "new", "reasons": []})
+            continue
+        base_p50, new_p50 = base["total_ms"]["p50"], item["total_ms"]["p50"]
+        noise = thresholds.noise_k * max(
+            base["total_ms"].get("spread", 0.0), item["total_ms"].get("spread", 0.0)
+        )
+        allowed_ms = max(thresholds.max_slowdown * base_p50, thresholds.min_delta_ms, noise)
+        reasons: list[str] = []
+        if new_p50 - base_p50 > allowed_ms:
+            reasons.append("latency")
+        bytes_growth = _growth(base["output_bytes"], item["output_bytes"])
+        if bytes_growth > thresholds.max_bytes_growth:
+            reasons.append("bytes")
+        rss_growth = _growth(base.get("peak_rss_bytes", 0), item.get("peak_rss_bytes", 0))
+        if rss_growth > thresholds.max_rss_growth:
+            reasons.append("rss")
+        if reasons:
+            status = "regressed"
+        elif base_p50 - new_p50 > allowed_ms:
+            status = "faster"
+        else:
+            status = "ok"
+        rows.append(
+            {
+                "name": name,
+                "status": status,
+                "reasons": reasons,
+                "base_p50": base_p50,
+                "new_p50": new_p50,
+                "allowed_ms": allowed_ms,
+                "base_p95": base["total_ms"]["p95"],
+                "new_p95": item["total_ms"]["p95"],
+                "p50_change": _growth(base_p50, new_p50),
+                "bytes_change": bytes_growth,
+                "rss_change": rss_growth,
+            }
+        )
+    for name in base_by_name:
+        if name not in seen:
+            rows.append({"name": name, "status": "missing", "reasons": []})
+    return rows
+
+
+def print_diff(rows: list[dict[str, Any]]) -> None:
+    print(
+        f"{'scenario':<52} {'base_p50':>9} {'new_p50':>9} {'change':>8} {'allowed':>8} "
+        f"{'base_p95':>9} {'new_p95':>9} {'bytes':>7} {'rss':>7}  status"
+    )
+    for row in rows:
+        if "base_p50" not in row:
+            print(f"{row['name']:<52} {'':>80}  {row['status']}")
+            continue
+        status = row["status"]
+        if row["reasons"]:
+            status += f" ({','.join(row['reasons'])})"
+        print(
+            f"{row['name']:<52} {row['base_p50']:>9.1f} {row['new_p50']:>9.1f} "
+            f"{row['p50_change']:>+7.1%} {row['allowed_ms']:>8.1f} "
+            f"{row['base_p95']:>9.1f} {row['new_p95']:>9.1f} "
+            f"{row['bytes_change']:>+6.1%} {row['rss_change']:>+6.1%}  {status}"
+        )
+
+
+def _csv(value: str) -> list[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--fixtures", default=",".join(FIXTURES), help=f"Comma-separated: {','.join(FIXTURES)}"
+    )
+    parser.add_argument(
+        "--sizes",
+        default=",".join(f"{size:g}" for size in DEFAULT_SIZES),
+        help="Comma-separated megapixel sizes (up to 20)",
+    )
+    parser.add_argument("--matrix", choices=["default", "full"], default="default")
+    parser.add_argument("--filter", default="", help="Only run scenarios whose name contains this")
+    parser.add_argument("--iters", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--json", dest="json_path", default=None, help="Write results to PATH")
+    parser.add_argument(
+        "--memory",
+        action="store_true",
+        help="Add an untimed run per scenario with per-stage tracemalloc/RSS peaks",
+    )
+    parser.add_argument(
+        "--save-baseline", default=None, metavar="PATH", help="Write results as a baseline"
+    )
+    parser.add_argument(
+        "--compare",
+        default=None,
+        metavar="PATH",
+        help="Compare against a baseline; exit 1 on regression",
+    )
+    parser.add_argument(
+        "--results",
+        default=None,
+        metavar="PATH",
+        help="With --compare: use these saved results instead of running the suite",
+    )
+    defaults = Thresholds()
+    parser.add_argument("--max-slowdown", type=float, default=defaults.max_slowdown)
+    parser.add_argument("--min-delta-ms", type=float, default=defaults.min_delta_ms)
+    parser.add_argument("--noise-k", type=float, default=defaults.noise_k)
+    parser.add_argument("--max-bytes-growth", type=float, default=defaults.max_bytes_growth)
+    parser.add_argument("--max-rss-growth", type=float, default=defaults.max_rss_growth)
+    args = parser.parse_args(argv)
+    thresholds = Thresholds(
+        max_slowdown=args.max_slowdown,
+        min_delta_ms=args.min_delta_ms,
+        noise_k=args.noise_k,
+        max_bytes_growth=args.max_bytes_growth,
+        max_rss_growth=args.max_rss_growth,
+    )
+
+    if args.results:
+        if not args.compare:
+            raise SystemExit("--results requires --compare")
+        return _compare(args.compare, _load(args.results), thresholds)
+
+    if args.iters <= 0:
+        raise SystemExit("--iters must be > 0")
+    fixtures = _csv(args.fixtures)
+    unknown = sorted(set(fixtures) - set(FIXTURES))
+    if unknown:
+        raise SystemExit(f"Unknown fixtures: {', '.join(unknown)}")
+    try:
+        sizes = [float(size) for size in _csv(args.sizes)]
+    except ValueError as exc:
+        raise SystemExit(f"Invalid --sizes: {exc}") from exc
+
+    _ensure_import_path()
+    scenarios = [
+        scenario
+        for scenario in build_matrix(fixtures, sizes, args.matrix)
+        if args.filter in scenario.name
+    ]
+    if not scenarios:
+        raise SystemExit("No scenarios selected")
+
+    report = run_suite(
+        scenarios,
+        iters=args.iters,
+        warmup=max(0, args.warmup),
+        memory=args.memory,
+        log=_print_row,
+    )
+    for path in (args.json_path, args.save_baseline):
+        if path:
+            Path(path).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    if args.compare:
+        return _compare(args.compare, report, thresholds)
+    return 0
+
+
+def _load(path: str) -> dict[str, Any]:
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError) as exc:
+        raise SystemExit(f"Cannot read {path}: {exc}") from exc
+
+
+def _compare(baseline_path: str, report: dict[str, Any], thresholds: Thresholds) -> int:
+    rows = compare_reports(_load(baseline_path), report, thresholds)
+    print()
+    print_diff(rows)
+    regressed = [row["name"] for row in rows if row["status"] == "regressed"]
+    if regressed:
+        print(f"\n{len(regressed)} scenario(s) regressed vs {baseline_path}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
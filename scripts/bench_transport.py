@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""Shared-memory vs pickling transport to process-pool workers.
+
+`echo` isolates the transport: each task ships an upload-sized buffer to a
+worker, which copies it and sends back a result of the same size. `render` runs
+the real pipeline through `ProcessPoolRenderer` with each transport, so the
+transport's share of an end-to-end render is visible. Reports p50/p95 ms per
+task; leftover `/dev/shm` segments are counted afterwards (expected 0).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+from bench_suite import FIXTURES, Scenario, _request, make_fixture, percentile
+
+
+def _ensure_import_path() -> None:
+    root = Path(__file__).resolve().parents[1]
+    src = root / "src"
+    if str(src) not in sys.path:
+        sys.path.insert(0, str(src))
+
+
+_ensure_import_path()
+
+from ai_headshot_studio import transport  # noqa: E402
+
+
+def echo_pickle(data: bytes) -> bytes:
+    return bytes(data)
+
+
+def echo_shm(ref: transport.ShmRef, prefix: str) -> transport.ShmRef:
+    shm, out = transport.put_bytes(transport.read_bytes(ref), prefix=prefix)
+    shm.close()
+    return out
+
+
+def _summary(samples: list[float]) -> dict[str, float]:
+    return {
+        "p50_ms": round(percentile(samples, 50), 2),
+        "p95_ms": round(percentile(samples, 95), 2),
+        "mean_ms": round(statistics.fmean(samples), 2),
+    }
+
+
+def bench_echo(size_mb: float, *, iters: int, workers: int) -> dict[str, Any]:
+    data = bytes(int(size_mb * 1024 * 1024))
+    prefix = "ahs-bench"
+    results: dict[str, Any] = {"size_mb": size_mb}
+    with transport.process_pool(workers) as pool:
+        pool.submit(echo_pickle, b"").result()  # start the workers
+        samples = []
+        for _ in range(iters):
+            start = time.perf_counter()
+            pool.submit(echo_pickle, data).result()
+            samples.append((time.perf_counter() - start) * 1000.0)
+        results["pickle"] = _summary(samples)
+
+        samples = []
+        for _ in range(iters):
+            start = time.perf_counter()
+            shm, ref = transport.put_bytes(data, prefix=prefix)
+            try:
+                out = pool.submit(echo_shm, ref, prefix).result()
+            finally:
+                shm.close()
+                shm.unlink()
+            transport.take_bytes(out)
+            samples.append((time.perf_counter() - start) * 1000.0)
+        results["shm"] = _summary(samples)
+    results["leftover_segments"] = transport.sweep(prefix)
+    return results
+
+
+def bench_render(fixture: str, megapixels: float, *, fmt: str, iters: int) -> dict[str, Any]:
+    data = make_fixture(fixture, megapixels)
+    req = _request(Scenario(fixture, megapixels, output_format=fmt))
+    results: dict[str, Any] = {"fixture": fixture, "megapixels": megapixels, "format": fmt}
+    for name in transport.TRANSPORTS:
+        with transport.ProcessPoolRenderer(1, transport=name) as renderer:
+            rendered = renderer.render(data, req)  # warm-up
+            samples = []
+            for _ in range(iters):
+                start = time.perf_counter()
+                renderer.render(data, req)
+                samples.append((time.perf_counter() - start) * 1000.0)
+            prefix = renderer.prefix
+        results[name] = _summary(samples)
+        results["input_bytes"] = len(data)
+        results["output_bytes"] = len(rendered.payload)
+        results.setdefault("leftover_segments", 0)
+        results["leftover_segments"] += transport.sweep(prefix)
+    return results
+
+
+def _print_row(label: str, row: dict[str, Any]) -> None:
+    pickled, shared = row["pickle"], row["shm"]
+    speedup = pickled["p50_ms"] / shared["p50_ms"] if shared["p50_ms"] else float("inf")
+    print(
+        f"{label:<28} pickle p50={pickled['p50_ms']:>8.2f} p95={pickled['p95_ms']:>8.2f}  "
+        f"shm p50={shared['p50_ms']:>8.2f} p95={shared['p95_ms']:>8.2f}  "
+        f"x{speedup:.2f}  leftover={row['leftover_segments']}"
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1,4,12", help="Echo payload sizes in MB")
+    parser.add_argument("--iters", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--render", action="store_true", help="Also benchmark full renders")
+    parser.add_argument("--fixture", default="face", choices=FIXTURES)
+    parser.add_argument("--megapixels", type=float, default=12.0)
+    parser.add_argument("--format", default="png", choices=("png", "jpeg", "webp"))
+    parser.add_argument("--render-iters", type=int, default=3)
+    parser.add_argument("--json", dest="json_path", default=None, help="Write results to PATH")
+    args = parser.parse_args()
+
+    report: dict[str, Any] = {"echo": []}
+    for size in (float(item) for item in args.sizes.split(",") if item.strip()):
+        row = bench_echo(size, iters=args.iters, workers=args.workers)
+        report["echo"].append(row)
+        _print_row(f"echo {size:g} MB", row)
+    if args.render:
+        row = bench_render(args.fixture, args.megapixels, fmt=args.format, iters=args.render_iters)
+        report["render"] = row
+        _print_row(f"render {args.fixture} {args.megapixels:g}MP {args.format}", row)
+
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
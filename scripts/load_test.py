@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""HTTP load generator for `/api/process` and `/api/batch`.
+
+Drives the app in-process through httpx's ASGI transport (default) or a running
+server (`--url http://127.0.0.1:8000`). Closed-loop mode keeps `--concurrency`
+clients busy back to back; open-loop mode (`--rate`) starts requests on a
+Poisson schedule regardless of how fast they finish, and measures latency from
+the scheduled start so queueing shows up. Reports throughput, latency
+percentiles per request kind, status/error codes and event-loop lag (the app's
+own loop in-process; only the generator's loop with `--url`).
+
+Requires httpx (`pip install -e ".[dev]"`).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import statistics
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from bench_suite import FIXTURES, make_fixture, percentile
+
+# How often the lag monitor wakes; lag is how late each wake-up is.
+_LAG_INTERVAL_S = 0.01
+
+
+def _ensure_import_path() -> None:
+    root = Path(__file__).resolve().parents[1]
+    src = root / "src"
+    if str(src) not in sys.path:
+        sys.path.insert(0, str(src))
+
+
+@dataclass(frozen=True)
+class RequestKind:
+    """One entry of the request mix: `process:PRESET:FORMAT` or `batchN:PRESET:FORMAT`."""
+
+    endpoint: str
+    preset: str
+    output_format: str
+    batch_size: int = 1
+    weight: int = 1
+
+    @property
+    def label(self) -> str:
+        name = "process" if self.endpoint == "process" else f"batch{self.batch_size}"
+        return f"{name}:{self.preset}:{self.output_format}"
+
+
+def parse_mix(value: str) -> list[RequestKind]:
+    """Parse `process:portrait-4x5:jpeg=6,batch4:avatar-400:webp=1` (weights optional)."""
+
+    kinds: list[RequestKind] = []
+    for item in (part.strip() for part in value.split(",")):
+        if not item:
+            continue
+        spec, _, weight = item.partition("=")
+        parts = spec.split(":")
+        if len(parts) != 3:
+            raise ValueError(f"Expected endpoint:preset:format, got {spec!r}")
+        endpoint, preset, output_format = parts
+        if endpoint == "process":
+            batch_size = 1
+        elif endpoint.startswith("batch") and endpoint[5:].isdigit() and int(endpoint[5:]) > 0:
+            batch_size = int(endpoint[5:])
+            endpoint = "batch"
+        else:
+            raise ValueError(f"Unknown endpoint {endpoint!r} (use process or batchN)")
+        kinds.append(RequestKind(endpoint, preset, output_format, batch_size, int(weight or 1)))
+    if not kinds:
+        raise ValueError("Empty request mix")
+    return kinds
+
+
+@dataclass
+class Results:
+    latencies_ms: dict[str, list[float]] = field(default_factory=dict)
+    statuses: dict[str, int] = field(default_factory=dict)
+    error_codes: dict[str, int] = field(default_factory=dict)
+    lag_ms: list[float] = field(default_factory=list)
+    images: int = 0
+
+    def record(self, kind: RequestKind, latency_ms: float, status: int, code: str | None) -> None:
+        self.latencies_ms.setdefault(kind.label, []).append(latency_ms)
+        self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+        if code is not None:
+            self.error_codes[code] = self.error_codes.get(code, 0) + 1
+        elif status == 200:
+            self.images += kind.batch_size
+
+
+class LoadTest:
+    def __init__(
+        self,
+        client: Any,
+        kinds: list[RequestKind],
+        upload: bytes,
+        *,
+        unique_uploads: bool,
+        seed: int,
+    ) -> None:
+        self.client = client
+        self.kinds = kinds
+        self.upload = upload
+        self.unique_uploads = unique_uploads
+        self.random = random.Random(seed)
+        self.results = Results()
+        self._counter = itertools.count()
+
+    def _pick(self) -> RequestKind:
+        return self.random.choices(self.kinds, weights=[kind.weight for kind in self.kinds])[0]
+
+    def _image(self) -> bytes:
+        if not self.unique_uploads:
+            return self.upload
+        # Trailing bytes after the image end marker are ignored by decoders but
+        # change the content hash, so identical uploads are not coalesced.
+        return self.upload + f"load-test-{next(self._counter)}".encode()
+
+    async def request(self, kind: RequestKind, started: float) -> None:
+        data = {"preset": kind.preset, "format": kind.output_format, "remove_bg": "false"}
+        if kind.endpoint == "process":
+            url = "/api/process"
+            files: list[tuple[str, tuple[str, bytes, str]]] = [
+                ("image", ("load.jpg", self._image(), "image/jpeg"))
+            ]
+        else:
+            url = "/api/batch"
+            data["continue_on_error"] = "true"
+            files = [
+                ("images", (f"load-{index}.jpg", self._image(), "image/jpeg"))
+                for index in range(kind.batch_size)
+            ]
+        code: str | None = None
+        try:
+            response = await self.client.post(url, data=data, files=files)
+            status = response.status_code
+            if status != 200:
+                try:
+                    code = str(response.json()["detail"]["code"])
+                except Exception:
+                    code = f"http_{status}"
+        except Exception as exc:
+            status, code = 0, type(exc).__name__
+        self.results.record(kind, (time.perf_counter() - started) * 1000.0, status, code)
+
+    async def closed_loop(self, concurrency: int, deadline: float, limit: int | None) -> None:
+        issued = itertools.count()
+
+        async def worker() -> None:
+            while time.perf_counter() < deadline and (limit is None or next(issued) < limit):
+                await self.request(self._pick(), time.perf_counter())
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    async def open_loop(
+        self, rate: float, deadline: float, limit: int | None, max_inflight: int
+    ) -> None:
+        inflight: set[asyncio.Task[None]] = set()
+        next_start = time.perf_counter()
+        sent = 0
+        while next_start < deadline and (limit is None or sent < limit):
+            delay = next_start - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(inflight) >= max_inflight:
+                self.results.error_codes["client_overloaded"] = (
+                    self.results.error_codes.get("client_overloaded", 0) + 1
+                )
+            else:
+                task = asyncio.create_task(self.request(self._pick(), next_start))
+                inflight.add(task)
+                task.add_done_callback(inflight.discard)
+            sent += 1
+            next_start += self.random.expovariate(rate)
+        if inflight:
+            await asyncio.gather(*inflight)
+
+    async def monitor_lag(self, stop: asyncio.Event) -> None:
+        loop = asyncio.get_running_loop()
+        while not stop.is_set():
+            expected = loop.time() + _LAG_INTERVAL_S
+            await asyncio.sleep(_LAG_INTERVAL_S)
+            self.results.lag_ms.append(max(0.0, (loop.time() - expected) * 1000.0))
+
+
+def _summary(values: list[float]) -> dict[str, float]:
+    if not values:
+        return {}
+    return {
+        "count": len(values),
+        "p50": statistics.median(values),
+        "p90": percentile(values, 90),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values),
+    }
+
+
+def build_report(results: Results, elapsed_s: float, settings: dict[str, Any]) -> dict[str, Any]:
+    completed = sum(len(values) for values in results.latencies_ms.values())
+    all_latencies = list(itertools.chain.from_iterable(results.latencies_ms.values()))
+    return {
+        "settings": settings,
+        "elapsed_s": elapsed_s,
+        "requests": completed,
+        "throughput_rps": completed / elapsed_s if elapsed_s > 0 else 0.0,
+        "images_per_s": results.images / elapsed_s if elapsed_s > 0 else 0.0,
+        "latency_ms": _summary(all_latencies),
+        "latency_ms_by_kind": {
+            label: _summary(values) for label, values in sorted(results.latencies_ms.items())
+        },
+        "statuses": dict(sorted(results.statuses.items())),
+        "error_codes": dict(sorted(results.error_codes.items())),
+        "event_loop_lag_ms": _summary(results.lag_ms),
+    }
+
+
+def print_report(report: dict[str, Any]) -> None:
+    def row(label: str, stats: dict[str, float]) -> str:
+        if not stats:
+            return f"  {label:<34} -"
+        return (
+            f"  {label:<34} n={int(stats['count']):>6} p50={stats['p50']:>8.1f} "
+            f"p95={stats['p95']:>8.1f} p99={stats['p99']:>8.1f} max={stats['max']:>8.1f}"
+        )
+
+    print(
+        f"requests={report['requests']} elapsed_s={report['elapsed_s']:.1f} "
+        f"throughput_rps={report['throughput_rps']:.2f} images_per_s={report['images_per_s']:.2f}"
+    )
+    print("latency_ms:")
+    print(row("all", report["latency_ms"]))
+    for label, stats in report["latency_ms_by_kind"].items():
+        print(row(label, stats))
+    print("event_loop_lag_ms:")
+    print(row("lag", report["event_loop_lag_ms"]))
+    print(f"statuses: {json.dumps(report['statuses'])}")
+    if report["error_codes"]:
+        print(f"error_codes: {json.dumps(report['error_codes'])}")
+
+
+async def run(args: argparse.Namespace, kinds: list[RequestKind]) -> dict[str, Any]:
+    import httpx
+
+    upload = make_fixture(args.fixture, args.megapixels)
+    timeout = httpx.Timeout(args.timeout)
+    if args.url:
+        limits = httpx.Limits(max_connections=max(args.concurrency, args.max_inflight))
+        client = httpx.AsyncClient(base_url=args.url, timeout=timeout, limits=limits)
+    else:
+        from ai_headshot_studio.app import app
+
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://load-test", timeout=timeout
+        )
+
+    async with client:
+        test = LoadTest(
+            client, kinds, upload, unique_uploads=not args.identical_uploads, seed=args.seed
+        )
+        stop = asyncio.Event()
+        monitor = asyncio.create_task(test.monitor_lag(stop))
+        started = time.perf_counter()
+        deadline = started + args.duration
+        limit = args.requests or None
+        if args.rate:
+            await test.open_loop(args.rate, deadline, limit, args.max_inflight)
+        else:
+            await test.closed_loop(args.concurrency, deadline, limit)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await monitor
+
+    settings = {
+        "target": args.url or "asgi",
+        "mode": f"open@{args.rate}rps" if args.rate else f"closed@{args.concurrency}",
+        "mix": [kind.label + f"={kind.weight}" for kind in kinds],
+        "fixture": args.fixture,
+        "megapixels": args.megapixels,
+        "unique_uploads": not args.identical_uploads,
+    }
+    return build_report(test.results, elapsed, settings)
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--url", default=None, help="Target server; default drives the app in-process"
+    )
+    parser.add_argument("--concurrency", type=int, default=8, help="Closed-loop clients")
+    parser.add_argument(
+        "--rate", type=float, default=0.0, help="Open-loop arrivals per second (0 = closed loop)"
+    )
+    parser.add_argument(
+        "--max-inflight",
+        type=int,
+        default=256,
+        help="Open-loop cap on outstanding requests; arrivals beyond it count as errors",
+    )
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to generate load")
+    parser.add_argument("--requests", type=int, default=0, help="Stop after this many (0 = no cap)")
+    parser.add_argument(
+        "--mix",
+        default="process:portrait-4x5:jpeg=6,process:avatar-400:webp=3,batch4:avatar-400:jpeg=1",
+        help="Weighted request mix: endpoint:preset:format=weight, endpoint is process or batchN",
+    )
+    parser.add_argument("--fixture", choices=FIXTURES, default="face")
+    parser.add_argument("--megapixels", type=float, default=1.0)
+    parser.add_argument(
+        "--identical-uploads",
+        action="store_true",
+        help="Send byte-identical uploads (exercises request coalescing)",
+    )
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", default=None, help="Write the report to PATH")
+    args = parser.parse_args(argv)
+
+    if args.concurrency <= 0 or args.duration <= 0 or args.rate < 0 or args.max_inflight <= 0:
+        raise SystemExit("--concurrency, --duration and --max-inflight must be > 0")
+    try:
+        kinds = parse_mix(args.mix)
+    except ValueError as exc:
+        raise SystemExit(f"Invalid --mix: {exc}") from exc
+
+    _ensure_import_path()
+    report = asyncio.run(run(args, kinds))
+    print_report(report)
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""Memory of a multi-worker server: preload-and-fork vs `uvicorn --workers`.
+
+For each mode the server is started with `--workers N`, warmed up (`/api/ready`,
+then a few `/api/process` requests with background removal so every worker has
+built its pipeline state), and the whole process tree is measured from
+`/proc/<pid>/smaps_rollup`:
+
+- RSS counts shared pages once per process, so it overstates a forked tree.
+- PSS splits each shared page between the processes mapping it; the tree's PSS
+  sum is what the server really costs.
+- USS (private pages) is what a single worker would free if it exited.
+
+`--pid` measures an already running server's tree instead. Linux only; starting
+servers needs uvicorn and httpx (`pip install -e ".[dev]"`).
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+_ROOT = Path(__file__).resolve().parents[1]
+
+MODES = {
+    "fork": ["-m", "ai_headshot_studio.serve"],
+    "uvicorn": ["-m", "uvicorn", "ai_headshot_studio.app:app"],
+}
+_FIELDS = {"Rss": "rss", "Pss": "pss", "Private_Clean": "uss", "Private_Dirty": "uss"}
+
+
+def smaps_rollup(pid: int) -> dict[str, int]:
+    """RSS, PSS and USS of one process in bytes (zeros if it has exited)."""
+
+    totals = {"rss": 0, "pss": 0, "uss": 0}
+    try:
+        text = Path(f"/proc/{pid}/smaps_rollup").read_text(encoding="ascii")
+    except OSError:
+        return totals
+    for line in text.splitlines():
+        key, _, value = line.partition(":")
+        field = _FIELDS.get(key)
+        if field is not None:
+            totals[field] += int(value.split()[0]) * 1024
+    return totals
+
+
+def process_tree(pid: int) -> list[int]:
+    """`pid` and all of its descendants."""
+
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        for children in Path(f"/proc/{current}/task").glob("*/children"):
+            try:
+                pending.extend(int(child) for child in children.read_text().split())
+            except OSError:
+                continue
+    return tree
+
+
+def measure_tree(pid: int) -> dict[str, Any]:
+    processes = {child: smaps_rollup(child) for child in process_tree(pid)}
+    total = {
+        field: sum(values[field] for values in processes.values()) for field in _FIELDS.values()
+    }
+    return {"processes": len(processes), **total, "per_process": processes}
+
+
+def _upload() -> bytes:
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from bench_suite import make_fixture
+
+    return make_fixture("face", 0.5)
+
+
+def _warm_server(base_url: str, *, requests: int, timeout_s: float) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout_s
+    with httpx.Client(base_url=base_url, timeout=60.0) as client:
+        while True:
+            try:
+                if client.get("/api/ready").status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                raise SystemExit(f"server at {base_url} not ready after {timeout_s:.0f}s")
+            time.sleep(0.25)
+        data = _upload()
+        for _ in range(requests):
+            response = client.post(
+                "/api/process",
+                files={"image": ("face.jpg", io.BytesIO(data), "image/jpeg")},
+                data={"remove_bg": "true", "preset": "avatar-400", "format": "jpeg"},
+            )
+            response.raise_for_status()
+
+
+def run_mode(
+    mode: str, *, workers: int, port: int, requests: int, settle_s: float
+) -> dict[str, Any]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(_ROOT / "src"), env.get("PYTHONPATH")]))
+    command = [sys.executable, *MODES[mode], "--workers", str(workers), "--port", str(port)]
+    server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL)
+    try:
+        _warm_server(f"http://127.0.0.1:{port}", requests=requests, timeout_s=120.0)
+        time.sleep(settle_s)
+        return {"mode": mode, "workers": workers, **measure_tree(server.pid)}
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def _mib(value: int) -> str:
+    return f"{value / (1024 * 1024):>9.1f}"
+
+
+def print_rows(rows: list[dict[str, Any]]) -> None:
+    print(f"{'mode':<10} {'procs':>5} {'rss_mib':>9} {'pss_mib':>9} {'uss_mib':>9}")
+    for row in rows:
+        label = row.get("mode", f"pid {row.get('pid')}")
+        print(
+            f"{label:<10} {row['processes']:>5} {_mib(row['rss'])} {_mib(row['pss'])} "
+            f"{_mib(row['uss'])}"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", default="fork,uvicorn", help="Comma list of: fork, uvicorn")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--requests", type=int, default=0, help="Warm-up requests per mode (default 3 per worker)"
+    )
+    parser.add_argument(
+        "--settle", type=float, default=1.0, help="Seconds to wait before measuring"
+    )
+    parser.add_argument("--pid", type=int, default=None, help="Only measure this process tree")
+    parser.add_argument("--json", dest="json_path", default=None, help="Write results to PATH")
+    args = parser.parse_args()
+
+    if args.pid is not None:
+        rows = [{"pid": args.pid, **measure_tree(args.pid)}]
+    else:
+        requests = args.requests or 3 * args.workers
+        rows = []
+        for mode in filter(None, (item.strip() for item in args.modes.split(","))):
+            if mode not in MODES:
+                parser.error(f"unknown mode {mode!r}")
+            rows.append(
+                run_mode(
+                    mode,
+                    workers=args.workers,
+                    port=args.port,
+                    requests=requests,
+                    settle_s=args.settle,
+                )
+            )
+    print_rows(rows)
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(rows, indent=2) + "\n", encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
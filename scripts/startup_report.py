@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""Cold-start report: where `import ai_headshot_studio.app` and warm-up spend time.
+
+Each measurement runs in a fresh interpreter so nothing is already imported:
+
+- import: `python -X importtime` of the app, listing the slowest modules by
+  cumulative and by self time, plus every `ai_headshot_studio` module.
+- warm-up: the startup warm-up steps (Pillow plugins, face detector, matting
+  backend, diagnostics) run one by one with the current `AI_HEADSHOT_*`
+  settings, as `/api/ready` would report them.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+_ROOT = Path(__file__).resolve().parents[1]
+_PACKAGE = "ai_headshot_studio"
+
+_WARMUP_PROBE = """
+import json, time
+start = time.perf_counter()
+from ai_headshot_studio import app
+import_ms = (time.perf_counter() - start) * 1000.0
+from ai_headshot_studio.warmup import Warmup, default_steps
+warmup = Warmup()
+warmup.run([*default_steps(), ("diagnostics", app.warm_diagnostics)])
+print(json.dumps({"import_ms": import_ms, **warmup.snapshot()}))
+"""
+
+
+@dataclass(frozen=True)
+class ImportTiming:
+    module: str
+    depth: int
+    self_us: int
+    cumulative_us: int
+
+
+def _env() -> dict[str, str]:
+    env = dict(os.environ)
+    src = str(_ROOT / "src")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [src, env.get("PYTHONPATH")]))
+    return env
+
+
+def parse_importtime(output: str) -> list[ImportTiming]:
+    """Parse `-X importtime` stderr lines: `import time: self | cumulative | name`."""
+
+    timings: list[ImportTiming] = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:") :].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # the header row
+        name = fields[2].rstrip()
+        module = name.lstrip()
+        timings.append(
+            ImportTiming(
+                module=module,
+                depth=(len(name) - len(module) - 1) // 2,
+                self_us=int(fields[0]),
+                cumulative_us=int(fields[1]),
+            )
+        )
+    return timings
+
+
+def measure_imports(module: str) -> list[ImportTiming]:
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=_env(),
+        check=True,
+    )
+    return parse_importtime(completed.stderr)
+
+
+def measure_warmup() -> dict[str, Any]:
+    completed = subprocess.run(
+        [sys.executable, "-c", _WARMUP_PROBE],
+        capture_output=True,
+        text=True,
+        env=_env(),
+        check=True,
+    )
+    return dict(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+
+def build_report(timings: list[ImportTiming], *, top: int) -> dict[str, Any]:
+    def row(item: ImportTiming) -> dict[str, Any]:
+        return {
+            "module": item.module,
+            "self_ms": round(item.self_us / 1000.0, 1),
+            "cumulative_ms": round(item.cumulative_us / 1000.0, 1),
+        }
+
+    top_level = [item for item in timings if item.depth == 0]
+    return {
+        "total_ms": round(sum(item.cumulative_us for item in top_level) / 1000.0, 1),
+        "modules": len(timings),
+        "top_cumulative": [
+            row(item)
+            for item in sorted(top_level, key=lambda item: item.cumulative_us, reverse=True)[:top]
+        ],
+        "top_self": [
+            row(item) for item in sorted(timings, key=lambda item: item.self_us, reverse=True)[:top]
+        ],
+        "package": [row(item) for item in timings if item.module.startswith(_PACKAGE)],
+    }
+
+
+def _print_rows(title: str, rows: list[dict[str, Any]]) -> None:
+    print(f"\n{title}")
+    for row in rows:
+        cumulative, own = row["cumulative_ms"], row["self_ms"]
+        print(f"  {cumulative:>8.1f} ms cum  {own:>7.1f} ms self  {row['module']}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default=f"{_PACKAGE}.app", help="Module to import")
+    parser.add_argument("--top", type=int, default=15, help="Rows per table")
+    parser.add_argument("--warmup", action="store_true", help="Also time each startup warm-up step")
+    parser.add_argument("--json", dest="json_path", default=None, help="Write results to PATH")
+    args = parser.parse_args()
+
+    report: dict[str, Any] = {"import": build_report(measure_imports(args.module), top=args.top)}
+    imports = report["import"]
+    print(f"import {args.module}: {imports['total_ms']:.1f} ms, {imports['modules']} modules")
+    _print_rows("Slowest top-level imports (cumulative):", imports["top_cumulative"])
+    _print_rows("Slowest modules (self):", imports["top_self"])
+    _print_rows(f"{_PACKAGE} modules:", imports["package"])
+
+    if args.warmup:
+        warmup = measure_warmup()
+        report["warmup"] = warmup
+        elapsed, imported = warmup["elapsed_ms"], warmup["import_ms"]
+        print(f"\nwarm-up: {elapsed:.1f} ms (after a {imported:.1f} ms import)")
+        for name, step in warmup["steps"].items():
+            status = "ok" if step["ok"] else f"failed ({step['error']})"
+            print(f"  {step['ms']:>8.1f} ms  {name}  {status}")
+
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,106 @@
+"""Memory-budget admission control for image processing.
+
+Every request reserves an estimate of its peak pipeline memory (decoded pixels x
+bytes per pixel x live copies) before the image is decoded. When the global
+budget is exhausted, callers wait up to a timeout and are then rejected with a
+`server_busy` error, which the API maps to HTTP 503.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from ai_headshot_studio.config import get_settings
+from ai_headshot_studio.errors import ProcessingError
+
+# Working images are RGBA (4 bytes/pixel). Peak live copies in the pipeline:
+# decoded source, to_rgba, background composite, pre-retouch copy and two
+# ImageEnhance intermediates.
+_BYTES_PER_PIXEL = 4
+_PIPELINE_COPIES = 6
+# Background removal adds the matte plus the RGBA copy it is applied to.
+_MATTING_COPIES = 2
+
+
+def estimate_pipeline_bytes(width: int, height: int, *, remove_bg: bool = False) -> int:
+    copies = _PIPELINE_COPIES + (_MATTING_COPIES if remove_bg else 0)
+    return max(0, width) * max(0, height) * _BYTES_PER_PIXEL * copies
+
+
+class MemoryBudget:
+    """Counting budget of reserved bytes shared by all worker threads.
+
+    A reservation larger than the whole budget is clamped to it, so an oversized
+    (but MAX_PIXELS-valid) image still runs, just alone. `limit_bytes=0` disables
+    admission control.
+    """
+
+    def __init__(self, limit_bytes: int, *, timeout_s: float = 10.0) -> None:
+        self.limit_bytes = max(0, limit_bytes)
+        self.timeout_s = max(0.0, timeout_s)
+        self._reserved = 0
+        self._active = 0
+        self._waiting = 0
+        self._rejected = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, nbytes: int, *, timeout_s: float | None = None) -> int:
+        """Reserve `nbytes` (clamped to the budget) and return the amount held."""
+
+        if self.limit_bytes <= 0:
+            return 0
+        amount = min(max(0, nbytes), self.limit_bytes)
+        timeout = self.timeout_s if timeout_s is None else max(0.0, timeout_s)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._waiting += 1
+            try:
+                while self._reserved + amount > self.limit_bytes:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._rejected += 1
+                        raise ProcessingError(
+                            "Server is busy. Please retry shortly.", code="server_busy"
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+            self._reserved += amount
+            self._active += 1
+        return amount
+
+    def release(self, amount: int) -> None:
+        if self.limit_bytes <= 0:
+            return
+        with self._cond:
+            self._reserved = max(0, self._reserved - amount)
+            self._active = max(0, self._active - 1)
+            self._cond.notify_all()
+
+    @contextmanager
+    def reserve(self, nbytes: int, *, timeout_s: float | None = None) -> Iterator[int]:
+        amount = self.acquire(nbytes, timeout_s=timeout_s)
+        try:
+            yield amount
+        finally:
+            self.release(amount)
+
+    def stats(self) -> dict[str, int | float]:
+        with self._cond:
+            return {
+                "limit_bytes": self.limit_bytes,
+                "reserved_bytes": self._reserved,
+                "active": self._active,
+                "waiting": self._waiting,
+                "rejected": self._rejected,
+                "timeout_s": self.timeout_s,
+            }
+
+
+MEMORY_BUDGET = MemoryBudget(
+    get_settings().memory_budget_mb * 1024 * 1024,
+    timeout_s=get_settings().admission_timeout_s,
+)
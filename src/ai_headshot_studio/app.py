@@ -1,34 +1,63 @@
 from __future__ import annotations
 
+import asyncio
+import hmac
+import io
 import json
+import math
 import re
 import tempfile
 import time
+import uuid
 import zipfile
-from collections.abc import Iterator, Sequence
+from collections.abc import AsyncIterator, Iterator, Sequence
+from contextlib import asynccontextmanager, nullcontext
 from datetime import UTC, datetime
-from functools import lru_cache
-from importlib import metadata, util
+from functools import lru_cache, partial
+from importlib import util
 from pathlib import Path
 from typing import IO
 
-from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
 from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from PIL import Image
 from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 
+from ai_headshot_studio.admission import MEMORY_BUDGET
+from ai_headshot_studio.config import get_settings
+from ai_headshot_studio.faces import active_detector, validate_detector
+from ai_headshot_studio.matting import MATTE_CACHE, backends_diagnostics, get_backend
+from ai_headshot_studio.metrics import METRICS
+from ai_headshot_studio.pipeline import PipelineContext
 from ai_headshot_studio.processing import (
     MAX_PIXELS,
+    MAX_RENDITIONS,
     MAX_UPLOAD_BYTES,
     MAX_UPLOAD_MB,
     ProcessingError,
     ProcessRequest,
+    ProcessWarning,
+    Rendition,
+    RenditionResult,
     available_presets,
     available_styles,
+    clamp_request,
+    encode_result,
+    ensure_preset,
+    normalize_request,
+    parse_renditions,
     process_image_with_warnings,
-    to_bytes,
+    process_images_with_warnings,
+    process_renditions,
+    request_fingerprint,
+    upload_digest,
 )
+from ai_headshot_studio.ratelimit import RATE_LIMITER, client_key, image_work
+from ai_headshot_studio.scheduler import SCHEDULER
+from ai_headshot_studio.singleflight import SingleFlight
+from ai_headshot_studio.warmup import WARMUP, WARMUP_MODES, default_steps
 
 PACKAGE_DIR = Path(__file__).resolve().parent
 STATIC_DIR = PACKAGE_DIR / "static"
@@ -38,7 +67,19 @@ if not STATIC_DIR.is_dir():
     if legacy_static.is_dir():
         STATIC_DIR = legacy_static
 
-app = FastAPI(title="AI Headshot Studio", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    mode = get_settings().warmup
+    steps = [
+        (name, partial(SCHEDULER.call, "background", step))
+        for name, step in [*default_steps(), ("diagnostics", warm_diagnostics)]
+    ]
+    WARMUP.start(steps, mode if mode in WARMUP_MODES else "background")
+    yield
+
+
+app = FastAPI(title="AI Headshot Studio", version="0.1.0", lifespan=lifespan)
 
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
@@ -46,6 +87,18 @@ _SAFE_NAME_RE = re.compile(r"[^a-zA-Z0-9._-]+")
 MAX_BATCH_IMAGES = 24
 MAX_BATCH_TOTAL_MB = 72
 MAX_BATCH_TOTAL_BYTES = MAX_BATCH_TOTAL_MB * 1024 * 1024
+# Seconds clients are told to back off when the memory budget is exhausted.
+BUSY_RETRY_AFTER_S = 2
+# Identical concurrent renders (same bytes + normalized settings) share one run.
+ProcessOutcome = tuple[Image.Image, list[ProcessWarning], bytes, int | None, dict[str, str]]
+PROCESS_FLIGHTS: SingleFlight[ProcessOutcome] = SingleFlight("process")
+RENDITION_FLIGHTS: SingleFlight[tuple[list[RenditionResult], list[bytes]]] = SingleFlight(
+    "renditions"
+)
+# How often in-flight requests check whether the client is still connected.
+DISCONNECT_POLL_S = 0.25
+# Non-standard "client closed request" status; nobody reads it, but logs do.
+CLIENT_CLOSED_STATUS = 499
 
 
 def api_detail(code: str, message: str, **extra: object) -> dict[str, object]:
@@ -54,6 +107,84 @@ def api_detail(code: str, message: str, **extra: object) -> dict[str, object]:
     return payload
 
 
+def processing_http_error(exc: ProcessingError) -> HTTPException:
+    if exc.code == "server_busy":
+        return HTTPException(
+            status_code=503,
+            detail=api_detail(exc.code, str(exc)),
+            headers={"Retry-After": str(BUSY_RETRY_AFTER_S)},
+        )
+    if exc.code == "request_cancelled":
+        return HTTPException(
+            status_code=CLIENT_CLOSED_STATUS, detail=api_detail(exc.code, str(exc))
+        )
+    if exc.code == "deadline_exceeded":
+        return HTTPException(status_code=504, detail=api_detail(exc.code, str(exc)))
+    return HTTPException(status_code=400, detail=api_detail(exc.code, str(exc)))
+
+
+def validate_settings(req: ProcessRequest) -> None:
+    """Reject invalid settings up front, before the client is charged for the work."""
+
+    try:
+        ensure_preset(clamp_request(normalize_request(req)).preset)
+    except ProcessingError as exc:
+        raise processing_http_error(exc) from exc
+
+
+def client_id(request: Request) -> str:
+    """Rate-limit and fair-queuing identity: the `X-API-Key` header, else the client IP."""
+
+    host = request.client.host if request.client else None
+    return client_key(request.headers.get("x-api-key"), host)
+
+
+async def charge_client(
+    request: Request, endpoint: str, files: Sequence[IO[bytes]], *, remove_bg: bool
+) -> str:
+    """Charge the estimated work of `files` to the caller's bucket; 429 if it can't pay yet."""
+
+    client = client_id(request)
+    if not RATE_LIMITER.enabled:
+        return client
+    cost = await run_in_threadpool(lambda: sum(image_work(fp, remove_bg=remove_bg) for fp in files))
+    retry_after = RATE_LIMITER.acquire(client, cost)
+    if retry_after > 0:
+        METRICS.inc("rate_limited_total", labels={"endpoint": endpoint})
+        raise HTTPException(
+            status_code=429,
+            detail=api_detail(
+                "rate_limited",
+                "Rate limit exceeded. Please retry later.",
+                retry_after_s=round(retry_after, 1),
+            ),
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+    return client
+
+
+async def _watch_disconnect(request: Request, ctx: PipelineContext) -> None:
+    while not ctx.cancelled:
+        if await request.is_disconnected():
+            ctx.cancel("client_disconnected")
+            return
+        await asyncio.sleep(DISCONNECT_POLL_S)
+
+
+@asynccontextmanager
+async def cancel_on_disconnect(
+    request: Request, *, timeout_s: float | None = None
+) -> AsyncIterator[PipelineContext]:
+    """Yield a pipeline context that is cancelled if the client goes away."""
+
+    ctx = PipelineContext(timeout_s=timeout_s)
+    watcher = asyncio.create_task(_watch_disconnect(request, ctx))
+    try:
+        yield ctx
+    finally:
+        watcher.cancel()
+
+
 def _safe_basename(filename: str | None) -> str:
     raw = (filename or "").strip()
     if not raw:
@@ -90,15 +221,23 @@ def parse_bool(value: str | None, default: bool = False) -> bool:
 
 
 def build_output_headers(
-    image: Image.Image, output_format: str, elapsed_ms: int, payload_bytes: int
+    image: Image.Image,
+    output_format: str,
+    elapsed_ms: int,
+    payload_bytes: int,
+    *,
+    quality: int | None = None,
 ) -> dict[str, str]:
-    return {
+    headers = {
         "X-Output-Width": str(image.width),
         "X-Output-Height": str(image.height),
         "X-Output-Format": output_format,
         "X-Processing-Ms": str(max(0, elapsed_ms)),
         "X-Output-Bytes": str(max(0, payload_bytes)),
     }
+    if quality is not None:
+        headers["X-Output-Quality"] = str(quality)
+    return headers
 
 
 def add_warning_headers(headers: dict[str, str], warnings: Sequence[object]) -> dict[str, str]:
@@ -153,6 +292,60 @@ async def read_upload_limited(
             )
 
 
+def _process_chunk(
+    payloads: Sequence[bytes], req: ProcessRequest, chunk_size: int, ctx: PipelineContext
+) -> list[tuple[Image.Image, list[ProcessWarning]] | ProcessingError]:
+    with ctx.activate():
+        return process_images_with_warnings(payloads, req, batch_size=chunk_size)
+
+
+async def _iter_batch_outcomes(
+    images: Sequence[UploadFile],
+    req: ProcessRequest,
+    *,
+    total_counter: list[int],
+    ctx: PipelineContext,
+    client: str = "",
+) -> AsyncIterator[
+    tuple[int, str, tuple[Image.Image, list[ProcessWarning]] | ProcessingError | HTTPException]
+]:
+    """Read and process batch uploads chunk by chunk, yielding outcomes in order.
+
+    With background removal enabled, uploads are grouped into chunks of the
+    configured matting batch size so inference runs once per chunk; otherwise
+    items are handled one at a time to keep memory flat.
+    """
+
+    chunk_size = get_settings().matting_batch_size if req.remove_bg else 1
+    for chunk_start in range(0, len(images), chunk_size):
+        reads: list[tuple[int, str, bytes | HTTPException]] = []
+        chunk = images[chunk_start : chunk_start + chunk_size]
+        for idx, upload in enumerate(chunk, start=chunk_start + 1):
+            filename = _safe_basename(upload.filename)
+            try:
+                data = await read_upload_limited(
+                    upload,
+                    MAX_UPLOAD_BYTES,
+                    total_counter=total_counter,
+                    total_limit=MAX_BATCH_TOTAL_BYTES,
+                )
+            except HTTPException as exc:
+                reads.append((idx, filename, exc))
+                continue
+            reads.append((idx, filename, data))
+
+        payloads = [read for _idx, _filename, read in reads if isinstance(read, bytes)]
+        ctx.checkpoint("batch_item")
+        async with SCHEDULER.run("batch", client):
+            outcomes = await run_in_threadpool(_process_chunk, payloads, req, chunk_size, ctx)
+        processed = iter(outcomes)
+        for idx, filename, read in reads:
+            if isinstance(read, HTTPException):
+                yield idx, filename, read
+            else:
+                yield idx, filename, next(processed)
+
+
 @app.get("/")
 async def index() -> FileResponse:
     return FileResponse(STATIC_DIR / "index.html")
@@ -171,16 +364,27 @@ async def health() -> dict[str, object]:
             "max_batch_images": MAX_BATCH_IMAGES,
             "max_batch_total_mb": MAX_BATCH_TOTAL_MB,
             "max_batch_total_bytes": MAX_BATCH_TOTAL_BYTES,
+            "max_renditions": MAX_RENDITIONS,
         },
         "features": {
-            "background_removal": background_removal_diagnostics(),
+            "background_removal": {
+                **background_removal_diagnostics(),
+                "fallback": get_settings().matting_fallback or None,
+                "backends": backends_diagnostics(),
+            },
             "face_framing": face_framing_diagnostics(),
         },
+        "caches": {
+            "matte": MATTE_CACHE.stats(),
+        },
+        "memory_budget": MEMORY_BUDGET.stats(),
     }
 
 
 @lru_cache(maxsize=1)
 def package_version() -> str:
+    from importlib import metadata
+
     try:
         return metadata.version("ai-headshot-studio")
     except metadata.PackageNotFoundError:
@@ -189,14 +393,29 @@ def package_version() -> str:
 
 @lru_cache(maxsize=1)
 def background_removal_diagnostics() -> dict[str, str | bool]:
+    backend_name = get_settings().matting_backend
     details: dict[str, str | bool] = {
         "mode": "local",
+        "backend": backend_name,
         "provider": "rembg",
         "available": False,
     }
+    if backend_name != "rembg":
+        try:
+            backend = get_backend(backend_name)
+        except ProcessingError:
+            details["error"] = "unknown_backend"
+            return details
+        details["provider"] = backend.provider
+        details["available"] = backend.is_available()
+        if not details["available"]:
+            details["error"] = "missing_dependency"
+        return details
     if util.find_spec("rembg") is None:
         details["error"] = "missing_dependency"
         return details
+    from importlib import metadata
+
     details["available"] = True
     try:
         details["version"] = metadata.version("rembg")
@@ -207,8 +426,10 @@ def background_removal_diagnostics() -> dict[str, str | bool]:
 
 @lru_cache(maxsize=1)
 def face_framing_diagnostics() -> dict[str, str | bool]:
+    settings = get_settings()
     details: dict[str, str | bool] = {
         "mode": "local",
+        "detector": "haar",
         "provider": "opencv-haarcascade",
         "available": False,
     }
@@ -216,6 +437,23 @@ def face_framing_diagnostics() -> dict[str, str | bool]:
         details["error"] = "missing_dependency"
         return details
     details["available"] = True
+    try:
+        validate_detector(settings.face_detector)
+    except ProcessingError as exc:
+        # Framing still runs with Haar; surface the misconfiguration.
+        details["fallback"] = True
+        details["error"] = exc.code
+    if settings.face_detector == "yunet":
+        details["model"] = Path(settings.face_model).name if settings.face_model else ""
+        if active_detector() == "yunet":
+            details["detector"] = "yunet"
+            details["provider"] = "opencv-yunet"
+        else:
+            # Haar keeps framing working; surface why the configured model isn't used.
+            details["fallback"] = True
+            details["error"] = "model_unavailable"
+    from importlib import metadata
+
     try:
         details["version"] = metadata.version("opencv-python-headless")
     except metadata.PackageNotFoundError:
@@ -226,13 +464,94 @@ def face_framing_diagnostics() -> dict[str, str | bool]:
     return details
 
 
+def warm_diagnostics() -> None:
+    # Cached `metadata.version`/`find_spec` probes, so the first health check is cheap.
+    package_version()
+    background_removal_diagnostics()
+    face_framing_diagnostics()
+
+
+@app.get("/api/ready")
+async def ready() -> JSONResponse:
+    """Readiness: 503 until the startup warm-up has finished, unlike `/api/health`."""
+
+    warmup = WARMUP.snapshot()
+    if not WARMUP.ready:
+        return JSONResponse(
+            {"status": "warming_up", "warmup": warmup},
+            status_code=503,
+            headers={"Retry-After": "1"},
+        )
+    return JSONResponse({"status": "ready", "warmup": warmup})
+
+
+@app.get("/api/metrics")
+async def metrics() -> dict[str, object]:
+    return {
+        "counters": METRICS.snapshot(),
+        "scheduler": SCHEDULER.stats(),
+        "rate_limit": RATE_LIMITER.stats(),
+    }
+
+
 @app.get("/api/presets")
 async def presets() -> JSONResponse:
     return JSONResponse({"presets": available_presets(), "styles": available_styles()})
 
 
+def request_id(request: Request) -> str:
+    """The caller's `X-Request-Id`, made safe for use as a file name, or a fresh one."""
+
+    raw = request.headers.get("x-request-id", "")
+    safe = _SAFE_NAME_RE.sub("-", raw.strip())[:64].strip(".-")
+    return safe or uuid.uuid4().hex
+
+
+def profile_path(request: Request) -> Path | None:
+    """Where to save this request's profile, when profiling is configured and asked for."""
+
+    settings = get_settings()
+    if not settings.profile_dir or not settings.profile_token:
+        return None
+    token = request.headers.get("x-profile-token")
+    if token is None or not hmac.compare_digest(token.encode(), settings.profile_token.encode()):
+        return None
+    return Path(settings.profile_dir) / f"{request_id(request)}.prof"
+
+
+def _process_and_encode(
+    data: bytes,
+    digest: str,
+    req: ProcessRequest,
+    ctx: PipelineContext,
+    profile_to: Path | None = None,
+) -> ProcessOutcome:
+    profiler = call_profiler = None
+    if get_settings().debug_memory or profile_to is not None:
+        # Imported on demand: profiling is off in normal serving.
+        from ai_headshot_studio.profiling import CallProfiler, MemoryProfiler
+
+        profiler = MemoryProfiler() if get_settings().debug_memory else None
+        call_profiler = CallProfiler(profile_to) if profile_to is not None else None
+    with call_profiler or nullcontext():
+        with profiler or nullcontext():
+            ctx.memory = profiler
+            with ctx.activate():
+                result, warnings = process_image_with_warnings(data, req, digest=digest)
+            ctx.checkpoint("encode")
+            payload, quality = encode_result(result, req)
+    debug: dict[str, str] = {}
+    if profiler is not None and profiler.active:
+        # Left off when another request held the profiler: its peaks would be mixed in.
+        debug["X-Debug-Memory"] = profiler.header_value()
+    if call_profiler is not None and call_profiler.saved:
+        debug["X-Profile"] = call_profiler.path.name
+    return result, warnings, payload, quality, debug
+
+
 @app.post("/api/process")
 async def process(
+    request: Request,
     image: UploadFile = File(...),  # noqa: B008
     remove_bg: str | None = Form(None),
     background: str = Form("white"),
@@ -246,6 +565,14 @@ async def process(
     sharpness: float = Form(1.0),
     soften: float = Form(0.0),
     jpeg_quality: int = Form(92),
+    resize_quality: str = Form("high"),
+    matte_quality: str = Form("full"),
+    matting_backend: str | None = Form(None),
+    encode_profile: str = Form("smallest"),
+    max_bytes: int | None = Form(None),
+    jpeg_progressive: str | None = Form(None),
+    jpeg_subsampling: str | None = Form(None),
+    jpeg_qtables: str | None = Form(None),
     format: str = Form("png"),
 ) -> StreamingResponse:
     data = await read_upload_limited(image, MAX_UPLOAD_BYTES)
@@ -264,16 +591,40 @@ async def process(
         soften=soften,
         jpeg_quality=jpeg_quality,
         output_format=output_format,
+        resize_quality=resize_quality,
+        matte_quality=matte_quality,
+        matting_backend=matting_backend,
+        encode_profile=encode_profile,
+        max_bytes=max_bytes,
+        jpeg_progressive=parse_bool(jpeg_progressive),
+        jpeg_subsampling=jpeg_subsampling,
+        jpeg_qtables=jpeg_qtables,
     )
+
+    validate_settings(req)
+    client = await charge_client(request, "process", [io.BytesIO(data)], remove_bg=req.remove_bg)
+    profile_to = profile_path(request)
+
+    async def render() -> ProcessOutcome:
+        async with cancel_on_disconnect(request, timeout_s=get_settings().request_timeout_s) as ctx:
+            async with SCHEDULER.run("interactive", client):
+                return await run_in_threadpool(
+                    _process_and_encode, data, digest, req, ctx, profile_to
+                )
+
     try:
         start = time.perf_counter()
-        result, warnings = process_image_with_warnings(data, req)
-        payload = to_bytes(result, output_format, req.jpeg_quality)
+        digest = await run_in_threadpool(upload_digest, data)
+        # A profiled request always does its own work, so the profile shows it.
+        key = None if profile_to else request_fingerprint(digest, req)
+        if key is None:
+            result, warnings, payload, quality, debug = await render()
+        else:
+            (result, warnings, payload, quality, debug), _coalesced = await PROCESS_FLIGHTS.run(
+                key, render
+            )
     except ProcessingError as exc:
-        raise HTTPException(
-            status_code=400,
-            detail=api_detail(exc.code, str(exc)),
-        ) from exc
+        raise processing_http_error(exc) from exc
 
     media_type_map = {
         "png": "image/png",
@@ -282,8 +633,8 @@ async def process(
     }
     media_type = media_type_map.get(output_format, "application/octet-stream")
     elapsed_ms = int((time.perf_counter() - start) * 1000)
-    headers = build_output_headers(result, output_format, elapsed_ms, len(payload))
-    headers = add_warning_headers(headers, warnings)
+    headers = build_output_headers(result, output_format, elapsed_ms, len(payload), quality=quality)
+    headers = add_warning_headers(headers, warnings) | debug
     return StreamingResponse(
         iter([payload]),
         media_type=media_type,
@@ -293,6 +644,7 @@ async def process(
 
 @app.post("/api/batch")
 async def batch(
+    request: Request,
     images: list[UploadFile] = File(...),  # noqa: B008
     remove_bg: str | None = Form(None),
     background: str = Form("white"),
@@ -306,6 +658,14 @@ async def batch(
     sharpness: float = Form(1.0),
     soften: float = Form(0.0),
     jpeg_quality: int = Form(92),
+    resize_quality: str = Form("high"),
+    matte_quality: str = Form("full"),
+    matting_backend: str | None = Form(None),
+    encode_profile: str = Form("smallest"),
+    max_bytes: int | None = Form(None),
+    jpeg_progressive: str | None = Form(None),
+    jpeg_subsampling: str | None = Form(None),
+    jpeg_qtables: str | None = Form(None),
     format: str = Form("png"),
     folder: str | None = Form(None),
     continue_on_error: str | None = Form(None),
@@ -338,8 +698,20 @@ async def batch(
         soften=soften,
         jpeg_quality=jpeg_quality,
         output_format=output_format,
+        resize_quality=resize_quality,
+        matte_quality=matte_quality,
+        matting_backend=matting_backend,
+        encode_profile=encode_profile,
+        max_bytes=max_bytes,
+        jpeg_progressive=parse_bool(jpeg_progressive),
+        jpeg_subsampling=jpeg_subsampling,
+        jpeg_qtables=jpeg_qtables,
     )
 
+    validate_settings(req)
+    client = await charge_client(
+        request, "batch", [upload.file for upload in images], remove_bg=req.remove_bg
+    )
     started = time.perf_counter()
     spool = tempfile.SpooledTemporaryFile(max_size=48 * 1024 * 1024)
     total_counter: list[int] = [0]
@@ -347,19 +719,22 @@ async def batch(
     warning_items: list[dict[str, object]] = []
     warning_count = 0
     succeeded = 0
+    # The deadline scales with the number of images in the batch.
+    ctx = PipelineContext(timeout_s=get_settings().request_timeout_s * len(images))
+    watcher = asyncio.create_task(_watch_disconnect(request, ctx))
     try:
         with zipfile.ZipFile(spool, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
-            for idx, upload in enumerate(images, start=1):
-                filename = _safe_basename(upload.filename)
+            async for idx, filename, outcome in _iter_batch_outcomes(
+                images, req, total_counter=total_counter, ctx=ctx, client=client
+            ):
                 try:
-                    data = await read_upload_limited(
-                        upload,
-                        MAX_UPLOAD_BYTES,
-                        total_counter=total_counter,
-                        total_limit=MAX_BATCH_TOTAL_BYTES,
-                    )
-                    result, item_warnings = process_image_with_warnings(data, req)
-                    payload = to_bytes(result, output_format, req.jpeg_quality)
+                    if isinstance(outcome, HTTPException | ProcessingError):
+                        raise outcome
+                    result, item_warnings = outcome
+                    async with SCHEDULER.run("batch", client):
+                        payload, _quality = await run_in_threadpool(
+                            encode_result, result, req, output_format
+                        )
                 except HTTPException as exc:
                     detail = exc.detail
                     if isinstance(detail, dict):
@@ -461,12 +836,18 @@ async def batch(
     except HTTPException:
         spool.close()
         raise
+    except ProcessingError as exc:
+        # Whole-batch conditions (busy, cancelled, deadline) rather than item failures.
+        spool.close()
+        raise processing_http_error(exc) from exc
     except Exception as exc:
         spool.close()
         raise HTTPException(
             status_code=500,
             detail=api_detail("internal_error", "Batch processing failed."),
         ) from exc
+    finally:
+        watcher.cancel()
 
     elapsed_ms = int((time.perf_counter() - started) * 1000)
     timestamp = datetime.now(UTC).strftime("%Y%m%d-%H%M%S")
@@ -486,3 +867,159 @@ async def batch(
         headers=headers,
         background=BackgroundTask(spool.close),
     )
+
+
+def _render_and_encode(
+    data: bytes,
+    digest: str,
+    req: ProcessRequest,
+    requested: Sequence[Rendition],
+    ctx: PipelineContext,
+) -> tuple[list[RenditionResult], list[bytes]]:
+    with ctx.activate():
+        results = process_renditions(data, req, requested, digest=digest)
+    payloads: list[bytes] = []
+    for item in results:
+        ctx.checkpoint("encode")
+        payload, _quality = encode_result(item.image, req, item.rendition.output_format)
+        payloads.append(payload)
+    return results, payloads
+
+
+@app.post("/api/renditions")
+async def renditions(
+    request: Request,
+    image: UploadFile = File(...),  # noqa: B008
+    renditions: str = Form(...),
+    remove_bg: str | None = Form(None),
+    background: str = Form("white"),
+    background_hex: str | None = Form(None),
+    style: str | None = Form(None),
+    top_bias: float = Form(0.2),
+    brightness: float = Form(1.0),
+    contrast: float = Form(1.0),
+    color: float = Form(1.0),
+    sharpness: float = Form(1.0),
+    soften: float = Form(0.0),
+    jpeg_quality: int = Form(92),
+    resize_quality: str = Form("high"),
+    matte_quality: str = Form("full"),
+    matting_backend: str | None = Form(None),
+    encode_profile: str = Form("smallest"),
+    max_bytes: int | None = Form(None),
+    jpeg_progressive: str | None = Form(None),
+    jpeg_subsampling: str | None = Form(None),
+    jpeg_qtables: str | None = Form(None),
+    folder: str | None = Form(None),
+) -> StreamingResponse:
+    data = await read_upload_limited(image, MAX_UPLOAD_BYTES)
+    zip_folder = _safe_zip_folder(folder)
+    stem = Path(_safe_basename(image.filename)).stem
+    try:
+        requested = parse_renditions(renditions)
+        req = ProcessRequest(
+            remove_bg=parse_bool(remove_bg),
+            background=background,
+            background_hex=background_hex,
+            preset=requested[0].preset,
+            style=style,
+            top_bias=top_bias,
+            brightness=brightness,
+            contrast=contrast,
+            color=color,
+            sharpness=sharpness,
+            soften=soften,
+            jpeg_quality=jpeg_quality,
+            output_format=requested[0].output_format,
+            resize_quality=resize_quality,
+            matte_quality=matte_quality,
+            matting_backend=matting_backend,
+            encode_profile=encode_profile,
+            max_bytes=max_bytes,
+            jpeg_progressive=parse_bool(jpeg_progressive),
+            jpeg_subsampling=jpeg_subsampling,
+            jpeg_qtables=jpeg_qtables,
+        )
+    except ProcessingError as exc:
+        raise processing_http_error(exc) from exc
+    validate_settings(req)
+
+    # Charged only once the request is valid. The renditions share one decode and
+    # matte, so the source image is charged once.
+    client = await charge_client(request, "renditions", [io.BytesIO(data)], remove_bg=req.remove_bg)
+    try:
+        started = time.perf_counter()
+
+        async def render() -> tuple[list[RenditionResult], list[bytes]]:
+            async with cancel_on_disconnect(
+                request, timeout_s=get_settings().request_timeout_s
+            ) as ctx:
+                async with SCHEDULER.run("batch", client):
+                    return await run_in_threadpool(
+                        _render_and_encode, data, digest, req, requested, ctx
+                    )
+
+        digest = await run_in_threadpool(upload_digest, data)
+        key = request_fingerprint(digest, req)
+        if key is None:
+            results, payloads = await render()
+        else:
+            key += ":" + ",".join(f"{item.preset}:{item.output_format}" for item in requested)
+            (results, payloads), _coalesced = await RENDITION_FLIGHTS.run(key, render)
+    except ProcessingError as exc:
+        raise processing_http_error(exc) from exc
+
+    ext_map = {"png": "png", "jpeg": "jpg", "webp": "webp"}
+    warning_items: list[dict[str, object]] = []
+    warning_count = 0
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for item, payload in zip(results, payloads, strict=True):
+            fmt = item.rendition.output_format
+            out_name = f"{stem}-{item.rendition.preset}.{ext_map.get(fmt, 'bin')}"
+            if zip_folder:
+                out_name = f"{zip_folder}/{out_name}"
+            archive.writestr(out_name, payload)
+            if item.warnings:
+                warning_items.append(
+                    {
+                        "name": out_name,
+                        "preset": item.rendition.preset,
+                        "output_format": fmt,
+                        "codes": [warning.code for warning in item.warnings],
+                        "messages": [warning.message for warning in item.warnings],
+                    }
+                )
+                warning_count += len(item.warnings)
+        if warning_items:
+            report_name = "warnings.json"
+            if zip_folder:
+                report_name = f"{zip_folder}/{report_name}"
+            archive.writestr(
+                report_name,
+                json.dumps(
+                    {
+                        "total": len(results),
+                        "items_with_warnings": len(warning_items),
+                        "warning_count": warning_count,
+                        "warnings": warning_items,
+                    },
+                    indent=2,
+                    sort_keys=True,
+                ).encode("utf-8"),
+            )
+
+    elapsed_ms = int((time.perf_counter() - started) * 1000)
+    timestamp = datetime.now(UTC).strftime("%Y%m%d-%H%M%S")
+    filename = f"headshot-renditions-{timestamp}.zip"
+    headers = {
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "X-Renditions-Count": str(len(results)),
+        "X-Renditions-Warnings": str(warning_count),
+        "X-Processing-Ms": str(max(0, elapsed_ms)),
+    }
+    return StreamingResponse(
+        iter([buffer.getvalue()]),
+        media_type="application/zip",
+        headers=headers,
+    )
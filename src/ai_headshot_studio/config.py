@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+
+_ENV_PREFIX = "AI_HEADSHOT_"
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Runtime knobs read once from `AI_HEADSHOT_*` environment variables."""
+
+    matting_backend: str = "rembg"
+    matting_fallback: str = ""
+    matting_model: str = "u2net"
+    matte_cache_mb: int = 64
+    matte_cache_compress: bool = False
+    matting_batch_size: int = 4
+    matting_threads: int = 0
+    face_detector: str = "haar"
+    face_model: str = ""
+    face_detect_size: int = 400
+    face_refine_size: int = 900
+    face_scale_factor: float = 1.1
+    memory_budget_mb: int = 1024
+    admission_timeout_s: float = 10.0
+    request_timeout_s: float = 120.0
+    debug_memory: bool = False
+    profile_dir: str = ""
+    profile_token: str = ""
+    warmup: str = "background"
+    worker_slots: int = 0
+    lane_weights: str = "interactive=8,batch=2,background=1"
+    rate_limit_rate: float = 0.0
+    rate_limit_burst: float = 60.0
+    rate_limit_clients: int = 10_000
+
+
+def _env(name: str) -> str | None:
+    value = os.environ.get(_ENV_PREFIX + name)
+    if value is None or not value.strip():
+        return None
+    return value.strip()
+
+
+def _env_str(name: str, default: str) -> str:
+    value = _env(name)
+    return default if value is None else value
+
+
+def _env_int(name: str, default: int, *, minimum: int = 0) -> int:
+    value = _env(name)
+    if value is None:
+        return default
+    try:
+        return max(minimum, int(value))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float, *, minimum: float = 0.0) -> float:
+    value = _env(name)
+    if value is None:
+        return default
+    try:
+        return max(minimum, float(value))
+    except ValueError:
+        return default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = _env(name)
+    if value is None:
+        return default
+    return value.lower() in {"1", "true", "yes", "on"}
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    return Settings(
+        matting_backend=_env_str("MATTING_BACKEND", Settings.matting_backend).lower(),
+        matting_fallback=_env_str("MATTING_FALLBACK", Settings.matting_fallback).lower(),
+        matting_model=_env_str("MATTING_MODEL", Settings.matting_model),
+        matte_cache_mb=_env_int("MATTE_CACHE_MB", Settings.matte_cache_mb),
+        matte_cache_compress=_env_bool("MATTE_CACHE_COMPRESS", Settings.matte_cache_compress),
+        matting_batch_size=_env_int("MATTING_BATCH_SIZE", Settings.matting_batch_size, minimum=1),
+        matting_threads=_env_int("MATTING_THREADS", Settings.matting_threads),
+        face_detector=_env_str("FACE_DETECTOR", Settings.face_detector).lower(),
+        face_model=_env_str("FACE_MODEL", Settings.face_model),
+        face_detect_size=_env_int("FACE_DETECT_SIZE", Settings.face_detect_size, minimum=64),
+        face_refine_size=_env_int("FACE_REFINE_SIZE", Settings.face_refine_size),
+        face_scale_factor=_env_float("FACE_SCALE_FACTOR", Settings.face_scale_factor, minimum=1.01),
+        memory_budget_mb=_env_int("MEMORY_BUDGET_MB", Settings.memory_budget_mb),
+        admission_timeout_s=_env_float("ADMISSION_TIMEOUT_S", Settings.admission_timeout_s),
+        request_timeout_s=_env_float("REQUEST_TIMEOUT_S", Settings.request_timeout_s),
+        debug_memory=_env_bool("DEBUG_MEMORY", Settings.debug_memory),
+        profile_dir=_env_str("PROFILE_DIR", Settings.profile_dir),
+        profile_token=_env_str("PROFILE_TOKEN", Settings.profile_token),
+        warmup=_env_str("WARMUP", Settings.warmup).lower(),
+        worker_slots=_env_int("WORKER_SLOTS", Settings.worker_slots),
+        lane_weights=_env_str("LANE_WEIGHTS", Settings.lane_weights),
+        rate_limit_rate=_env_float("RATE_LIMIT_RATE", Settings.rate_limit_rate),
+        rate_limit_burst=_env_float("RATE_LIMIT_BURST", Settings.rate_limit_burst),
+        rate_limit_clients=_env_int("RATE_LIMIT_CLIENTS", Settings.rate_limit_clients, minimum=1),
+    )
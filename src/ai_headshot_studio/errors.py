@@ -0,0 +1,14 @@
+from __future__ import annotations
+
+
+class ProcessingError(ValueError):
+    def __init__(self, message: str, code: str = "processing_error") -> None:
+        super().__init__(message)
+        self.code = code
+
+
+class RequestCancelled(ProcessingError):
+    """Raised at a pipeline checkpoint once the client is gone or the deadline passed.
+
+    Batch helpers re-raise it instead of recording it as a per-item failure.
+    """
@@ -0,0 +1,285 @@
+"""Face detection used for crop framing.
+
+Two OpenCV detectors are supported. The default Haar cascade runs on a
+luminance pyramid: a small full-frame pass finds the face, then a second pass
+re-checks only a region around it at higher resolution. YuNet
+(`cv2.FaceDetectorYN`) handles profile and tilted faces better and is used when
+`AI_HEADSHOT_FACE_DETECTOR=yunet` and `AI_HEADSHOT_FACE_MODEL` points at a local
+ONNX model; it falls back to Haar when the model can't be loaded. An unknown
+`AI_HEADSHOT_FACE_DETECTOR` also runs Haar, and is reported by the warm-up and
+`/api/health` as `unknown_detector`. OpenCV is optional; every entry point
+returns None when it is missing.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from typing import Any
+
+from PIL import Image
+
+from ai_headshot_studio.config import get_settings
+from ai_headshot_studio.errors import ProcessingError
+
+FaceBox = tuple[int, int, int, int]
+
+# Haar cascades can't see faces smaller than their 24px training window.
+_MIN_FACE_PX = 24
+_MIN_FACE_FRACTION = 0.06
+# Region re-checked around a coarse hit, as a multiple of the face size per side.
+_ROI_MARGIN = 0.5
+_YUNET_SCORE_THRESHOLD = 0.6
+_YUNET_NMS_THRESHOLD = 0.3
+_YUNET_TOP_K = 50
+
+FACE_DETECTORS = ("haar", "yunet")
+
+_local = threading.local()
+
+
+def _cv2() -> Any | None:
+    try:
+        import cv2
+    except Exception:
+        return None
+    return cv2
+
+
+def _haar_cascade() -> Any | None:
+    """Load the frontal-face cascade once per thread (classifiers aren't shareable)."""
+
+    cached = getattr(_local, "haar", None)
+    if cached is not None:
+        return cached if cached is not False else None
+    cascade = None
+    cv2 = _cv2()
+    if cv2 is not None:
+        try:
+            cascade_path = getattr(getattr(cv2, "data", object()), "haarcascades", "")
+            cascade = cv2.CascadeClassifier(
+                str(cascade_path) + "haarcascade_frontalface_default.xml"
+            )
+            if cascade.empty():
+                cascade = None
+        except Exception:
+            cascade = None
+    _local.haar = cascade if cascade is not None else False
+    return cascade
+
+
+def _yunet(model_path: str) -> Any | None:
+    """Load the YuNet detector once per thread; None when it can't be created."""
+
+    cache: dict[str, Any] = getattr(_local, "yunet", None) or {}
+    _local.yunet = cache
+    if model_path in cache:
+        return cache[model_path] or None
+    detector = None
+    factory = getattr(_cv2(), "FaceDetectorYN", None)
+    if factory is not None and model_path and os.path.isfile(model_path):
+        try:
+            detector = factory.create(
+                model_path,
+                "",
+                (320, 320),
+                _YUNET_SCORE_THRESHOLD,
+                _YUNET_NMS_THRESHOLD,
+                _YUNET_TOP_K,
+            )
+        except Exception:
+            detector = None
+    cache[model_path] = detector if detector is not None else False
+    return detector
+
+
+def validate_detector(name: str) -> str:
+    """Return `name` if it is one of `FACE_DETECTORS`; raise `unknown_detector` otherwise."""
+
+    if name not in FACE_DETECTORS:
+        raise ProcessingError(
+            f"Unknown face detector {name!r}; expected one of {', '.join(FACE_DETECTORS)}.",
+            code="unknown_detector",
+        )
+    return name
+
+
+def active_detector() -> str:
+    """Name of the detector `detect_face` will use with the current settings."""
+
+    settings = get_settings()
+    if settings.face_detector == "yunet" and _yunet(settings.face_model) is not None:
+        return "yunet"
+    return "haar"
+
+
+def _scaled(image: Image.Image, max_dim: int) -> tuple[Image.Image, float]:
+    longest = max(image.size)
+    if max_dim <= 0 or longest <= max_dim:
+        return image, 1.0
+    scale = max_dim / float(longest)
+    size = (max(1, int(round(image.width * scale))), max(1, int(round(image.height * scale))))
+    return image.resize(size, Image.BILINEAR, reducing_gap=2.0), scale
+
+
+def _detect(
+    cascade: Any,
+    gray: Image.Image,
+    *,
+    scale_factor: float,
+    min_size: int,
+    max_size: int = 0,
+) -> FaceBox | None:
+    import numpy as np
+
+    min_size = max(_MIN_FACE_PX, min_size)
+    if min(gray.size) < min_size:
+        return None
+    kwargs: dict[str, Any] = {}
+    if max_size > min_size:
+        kwargs["maxSize"] = (max_size, max_size)
+    try:
+        faces = cascade.detectMultiScale(
+            np.asarray(gray),
+            scaleFactor=scale_factor,
+            minNeighbors=5,
+            flags=getattr(_cv2(), "CASCADE_SCALE_IMAGE", 0),
+            minSize=(min_size, min_size),
+            **kwargs,
+        )
+    except Exception:
+        return None
+    if faces is None or len(faces) == 0:
+        return None
+    # Choose the largest face as the primary subject.
+    x, y, w, h = max(faces, key=lambda item: int(item[2]) * int(item[3]))
+    return int(x), int(y), int(w), int(h)
+
+
+def _detect_yunet(detector: Any, image: Image.Image) -> FaceBox | None:
+    import numpy as np
+
+    try:
+        # YuNet expects 3-channel BGR input at the exact size it was told.
+        bgr = np.ascontiguousarray(np.asarray(image.convert("RGB"))[:, :, ::-1])
+        detector.setInputSize((image.width, image.height))
+        _, faces = detector.detect(bgr)
+    except Exception:
+        return None
+    if faces is None or len(faces) == 0:
+        return None
+    x, y, w, h = max((face[:4] for face in faces), key=lambda box: float(box[2] * box[3]))
+    left, top = max(0, int(round(x))), max(0, int(round(y)))
+    right = min(image.width, int(round(x + w)))
+    bottom = min(image.height, int(round(y + h)))
+    if right <= left or bottom <= top:
+        return None
+    return left, top, right - left, bottom - top
+
+
+def _to_source(face: FaceBox, scale: float, offset: tuple[int, int] = (0, 0)) -> FaceBox:
+    inv = 1.0 / scale
+    x, y, w, h = face
+    return (
+        offset[0] + int(round(x * inv)),
+        offset[1] + int(round(y * inv)),
+        int(round(w * inv)),
+        int(round(h * inv)),
+    )
+
+
+def detect_face(
+    image: Image.Image,
+    *,
+    detect_size: int | None = None,
+    refine_size: int | None = None,
+    scale_factor: float | None = None,
+) -> FaceBox | None:
+    """Return the largest face as (x, y, w, h) in `image` pixels, or None.
+
+    The coarse pass runs on a `detect_size` luminance copy and exits early when it
+    finds a face: only a region around the hit is re-run at `refine_size` scale to
+    tighten the box. When the coarse pass misses (small or distant faces), one
+    full-frame pass at `refine_size` keeps recall. `refine_size=0` disables both.
+    The YuNet detector, when configured, runs a full-frame pass at each size.
+    """
+
+    settings = get_settings()
+    detect_size = settings.face_detect_size if detect_size is None else detect_size
+    refine_size = settings.face_refine_size if refine_size is None else refine_size
+    scale_factor = settings.face_scale_factor if scale_factor is None else scale_factor
+
+    width, height = image.size
+    if width <= 0 or height <= 0:
+        return None
+
+    if settings.face_detector == "yunet":
+        detector = _yunet(settings.face_model)
+        if detector is not None:
+            # YuNet is scale-robust, so one pass at each pyramid level is enough.
+            for max_dim in (detect_size, refine_size):
+                if max_dim <= 0:
+                    continue
+                try:
+                    scaled, scale = _scaled(image, max_dim)
+                except Exception:
+                    return None
+                face = _detect_yunet(detector, scaled)
+                if face is not None:
+                    return _to_source(face, scale)
+                if scale == 1.0:
+                    break
+            return None
+
+    cascade = _haar_cascade()
+    if cascade is None:
+        return None
+
+    try:
+        # Luminance straight from the decoded image: no RGB copy, a third of the
+        # bytes to resample for each pyramid level.
+        gray = image if image.mode == "L" else image.convert("L")
+    except Exception:
+        return None
+
+    coarse, coarse_scale = _scaled(gray, detect_size)
+    min_face = int(min(coarse.size) * _MIN_FACE_FRACTION)
+    face = _detect(cascade, coarse, scale_factor=scale_factor, min_size=min_face)
+
+    refine_scale = min(1.0, refine_size / float(max(width, height))) if refine_size > 0 else 0.0
+    if face is None:
+        if refine_scale <= coarse_scale:
+            return None
+        fine, fine_scale = _scaled(gray, refine_size)
+        min_face = int(min(fine.size) * _MIN_FACE_FRACTION)
+        face = _detect(cascade, fine, scale_factor=scale_factor, min_size=min_face)
+        return None if face is None else _to_source(face, fine_scale)
+
+    found = _to_source(face, coarse_scale)
+    if refine_scale <= coarse_scale:
+        return found
+
+    x, y, w, h = found
+    margin_x = int(round(w * _ROI_MARGIN))
+    margin_y = int(round(h * _ROI_MARGIN))
+    left, top = max(0, x - margin_x), max(0, y - margin_y)
+    right, bottom = min(width, x + w + margin_x), min(height, y + h + margin_y)
+    roi = gray.crop((left, top, right, bottom))
+    roi_size = (
+        max(1, int(round(roi.width * refine_scale))),
+        max(1, int(round(roi.height * refine_scale))),
+    )
+    if roi_size != roi.size:
+        roi = roi.resize(roi_size, Image.BILINEAR, reducing_gap=2.0)
+    # The face is already known to fill most of the ROI; bound the search to it.
+    face_px = min(w, h) * refine_scale
+    refined = _detect(
+        cascade,
+        roi,
+        scale_factor=scale_factor,
+        min_size=int(face_px * 0.6),
+        max_size=int(face_px * 1.6),
+    )
+    if refined is None:
+        return found
+    return _to_source(refined, refine_scale, (left, top))
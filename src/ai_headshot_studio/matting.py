@@ -0,0 +1,659 @@
+"""Background matting backends.
+
+Every backend turns an image into an `L`-mode alpha matte at the image's size.
+Backends are looked up by name from a small registry so requests (or config)
+can trade quality for speed: `rembg` (ONNX models, best quality), `grabcut`
+(classical OpenCV segmentation seeded from a subject box) and `none` (opaque
+matte, for tests and benchmarks).
+"""
+
+from __future__ import annotations
+
+import importlib
+import io
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import Callable, Sequence
+from functools import lru_cache
+from importlib import util
+from typing import Any, cast
+
+from PIL import Image, ImageFilter
+
+from ai_headshot_studio.config import get_settings
+from ai_headshot_studio.errors import ProcessingError
+from ai_headshot_studio.metrics import METRICS
+
+# Long-edge cap for matte inference per quality tier. The u2net family works at
+# 320-1024px internally, so bounded tiers infer on a downscaled copy and refine
+# the upsampled mask against the full-resolution image. `None` runs at full size.
+MATTE_QUALITIES: dict[str, int | None] = {
+    "full": None,
+    "balanced": 1024,
+    "fast": 640,
+}
+_MATTE_GUIDE_RADIUS = 4
+_MATTE_GUIDE_EPS = 1e-3
+# rembg models sharing u2net's 320px input and ImageNet normalization; these can
+# be run as one stacked tensor per batch.
+_U2NET_FAMILY = {"u2net", "u2netp", "u2net_human_seg", "silueta"}
+_U2NET_INPUT_SIZE = (320, 320)
+_U2NET_MEAN = (0.485, 0.456, 0.406)
+_U2NET_STD = (0.229, 0.224, 0.225)
+
+
+def _rembg_remove() -> Callable[..., object]:
+    try:
+        rembg = importlib.import_module("rembg")
+        remove = getattr(rembg, "remove", None)
+        if remove is None:
+            raise ProcessingError(
+                "Background removal model unavailable.", code="background_removal_unavailable"
+            )
+    except SystemExit as exc:  # pragma: no cover - runtime dependency
+        # Some `rembg` installs call `sys.exit(1)` when an ONNX backend is missing.
+        raise ProcessingError(
+            "Background removal model unavailable.", code="background_removal_unavailable"
+        ) from exc
+    except ProcessingError:
+        raise
+    except Exception as exc:  # pragma: no cover - runtime dependency
+        raise ProcessingError(
+            "Background removal model unavailable.", code="background_removal_unavailable"
+        ) from exc
+    return cast(Callable[..., object], remove)
+
+
+def _call_rembg(remove: Callable[..., object], image: Image.Image, **kwargs: object) -> Image.Image:
+    try:
+        result = remove(image, **kwargs)
+    except SystemExit as exc:  # pragma: no cover - runtime dependency
+        raise ProcessingError(
+            "Background removal model unavailable.", code="background_removal_unavailable"
+        ) from exc
+    except Exception as exc:  # pragma: no cover - runtime dependency
+        raise ProcessingError(
+            "Background removal model unavailable.", code="background_removal_unavailable"
+        ) from exc
+    if isinstance(result, Image.Image):
+        return result
+    return Image.open(io.BytesIO(cast(bytes, result)))
+
+
+def _box_mean(values: Any, radius: int) -> Any:
+    """Mean over a (2r+1)^2 window with edge clamping, via summed-area tables."""
+
+    import numpy as np
+
+    padded = np.pad(values, radius + 1, mode="edge").astype(np.float64)
+    table = padded.cumsum(axis=0).cumsum(axis=1)
+    size = 2 * radius + 1
+    window = (
+        table[size:, size:] - table[:-size, size:] - table[size:, :-size] + table[:-size, :-size]
+    )
+    return (window[: values.shape[0], : values.shape[1]] / float(size * size)).astype(np.float32)
+
+
+def _refine_matte(mask: Image.Image, image: Image.Image) -> Image.Image:
+    """Upsample a low-resolution matte to `image.size` with edge-aware refinement.
+
+    Uses the fast guided filter: linear coefficients relating the matte to the
+    guide's luminance are fitted at the matte's resolution, upsampled, and applied
+    to the full-resolution luminance so edges snap to real image detail. Falls back
+    to bilinear upsampling when numpy is unavailable.
+    """
+
+    try:
+        import numpy as np
+    except Exception:  # pragma: no cover - numpy ships with rembg
+        return mask.resize(image.size, Image.BILINEAR)
+
+    guide_small = image.convert("L").resize(mask.size, Image.BILINEAR)
+    guide = np.asarray(guide_small, dtype=np.float32) / 255.0
+    target = np.asarray(mask, dtype=np.float32) / 255.0
+    mean_i = _box_mean(guide, _MATTE_GUIDE_RADIUS)
+    mean_p = _box_mean(target, _MATTE_GUIDE_RADIUS)
+    var_i = _box_mean(guide * guide, _MATTE_GUIDE_RADIUS) - mean_i * mean_i
+    cov_ip = _box_mean(guide * target, _MATTE_GUIDE_RADIUS) - mean_i * mean_p
+    coef_a = cov_ip / (var_i + _MATTE_GUIDE_EPS)
+    coef_b = mean_p - coef_a * mean_i
+    coef_a = _box_mean(coef_a, _MATTE_GUIDE_RADIUS)
+    coef_b = _box_mean(coef_b, _MATTE_GUIDE_RADIUS)
+
+    full_a = np.asarray(Image.fromarray(coef_a, mode="F").resize(image.size, Image.BILINEAR))
+    full_b = np.asarray(Image.fromarray(coef_b, mode="F").resize(image.size, Image.BILINEAR))
+    refined = np.asarray(image.convert("L"), dtype=np.float32)
+    refined *= full_a
+    refined += full_b * 255.0
+    np.clip(refined, 0.0, 255.0, out=refined)
+    return Image.fromarray(refined.astype(np.uint8), mode="L")
+
+
+@lru_cache(maxsize=4)
+def _rembg_session(model: str) -> object | None:
+    """Create (once per worker) the rembg session for `model`.
+
+    Without an explicit session `rembg.remove` rebuilds the ONNX session on every
+    call. Returns None for rembg builds without `new_session`.
+    """
+
+    try:
+        # Inside the try: some `rembg` installs call `sys.exit(1)` on import.
+        new_session = getattr(importlib.import_module("rembg"), "new_session", None)
+        if new_session is None:
+            return None
+        kwargs: dict[str, object] = {}
+        threads = get_settings().matting_threads
+        if threads > 0:
+            options = importlib.import_module("onnxruntime").SessionOptions()
+            options.intra_op_num_threads = threads
+            kwargs["sess_opts"] = options
+        return cast(object, new_session(model, **kwargs))
+    except SystemExit as exc:  # pragma: no cover - runtime dependency
+        raise ProcessingError(
+            "Background removal model unavailable.", code="background_removal_unavailable"
+        ) from exc
+    except Exception as exc:  # pragma: no cover - runtime dependency
+        raise ProcessingError(
+            "Background removal model unavailable.", code="background_removal_unavailable"
+        ) from exc
+
+
+def compute_alpha_matte(
+    image: Image.Image, *, quality: str = "full", model: str | None = None
+) -> Image.Image:
+    """Return the foreground matte (mode `L`, same size as `image`) from rembg."""
+
+    remove = _rembg_remove()
+    session = _rembg_session(model or get_settings().matting_model)
+    kwargs: dict[str, object] = {} if session is None else {"session": session}
+    max_edge = MATTE_QUALITIES.get(quality)
+    if max_edge is None:
+        cutout = _call_rembg(remove, image, **kwargs)
+        if "A" in cutout.getbands():
+            return cutout.getchannel("A")
+        return cutout.convert("L")
+
+    source = image
+    if max(image.width, image.height) > max_edge:
+        scale = max_edge / float(max(image.width, image.height))
+        source = image.resize(
+            (max(1, int(round(image.width * scale))), max(1, int(round(image.height * scale)))),
+            Image.BILINEAR,
+        )
+    mask = _call_rembg(remove, source, only_mask=True, **kwargs).convert("L")
+    if mask.size != image.size:
+        mask = _refine_matte(mask, image)
+    return mask
+
+
+def _onnx_shape_errors() -> tuple[type[Exception], ...]:
+    """ONNX Runtime's error for inputs that don't match the model's declared shape."""
+
+    try:
+        state = importlib.import_module("onnxruntime.capi.onnxruntime_pybind11_state")
+    except ImportError:  # pragma: no cover - runtime dependency
+        return ()
+    invalid_argument = getattr(state, "InvalidArgument", None)
+    return (invalid_argument,) if isinstance(invalid_argument, type) else ()
+
+
+def _batch_session(session: object | None) -> Any | None:
+    """The ONNX session behind a rembg session, if it can take a stacked NCHW batch.
+
+    `inner_session` is not public rembg API (it is the `onnxruntime.InferenceSession`
+    on rembg 2.x sessions), so it is only used when it looks like one: `run`,
+    `get_inputs` and a 4-d, 3-channel input. Anything else gets None and goes
+    through `rembg.remove` per image.
+    """
+
+    inner: Any = getattr(session, "inner_session", None)
+    if not callable(getattr(inner, "run", None)) or not callable(
+        getattr(inner, "get_inputs", None)
+    ):
+        return None
+    try:
+        shape = list(inner.get_inputs()[0].shape)
+    except (AttributeError, IndexError, TypeError):
+        return None
+    if len(shape) != 4 or shape[1] != 3:
+        return None
+    return inner
+
+
+def _run_u2net_batch(
+    inner_session: Any, images: Sequence[Image.Image], *, quality: str
+) -> list[Image.Image]:
+    import numpy as np
+
+    reducing_gap = None if MATTE_QUALITIES.get(quality) is None else 3.0
+    tensors = []
+    for image in images:
+        resized = image.convert("RGB").resize(
+            _U2NET_INPUT_SIZE, Image.LANCZOS, reducing_gap=reducing_gap
+        )
+        array = np.asarray(resized, dtype=np.float32)
+        array /= max(float(array.max()), 1e-6)
+        array -= np.asarray(_U2NET_MEAN, dtype=np.float32)
+        array /= np.asarray(_U2NET_STD, dtype=np.float32)
+        tensors.append(array.transpose((2, 0, 1)))
+    batch = np.stack(tensors).astype(np.float32)
+    model_input = inner_session.get_inputs()[0]
+    # A model exported with a fixed batch dimension (an int, usually 1) can't take
+    # the stack; keep the shared session and feed it one image at a time.
+    fixed_batch = model_input.shape[0] if isinstance(model_input.shape[0], int) else None
+
+    def run_singly(reason: str) -> Any:
+        METRICS.inc("matting_batch_fallback_total", labels={"reason": reason})
+        return np.concatenate(
+            [
+                inner_session.run(None, {model_input.name: batch[index : index + 1]})[0]
+                for index in range(len(images))
+            ]
+        )
+
+    try:
+        if fixed_batch is not None and fixed_batch != len(images):
+            predictions = run_singly("fixed_batch")
+        else:
+            try:
+                predictions = inner_session.run(None, {model_input.name: batch})[0]
+            except _onnx_shape_errors():
+                # Symbolic batch dimension that still rejects this batch size.
+                predictions = run_singly("invalid_argument")
+    except Exception as exc:  # pragma: no cover - runtime dependency
+        raise ProcessingError(
+            "Background removal model unavailable.", code="background_removal_unavailable"
+        ) from exc
+
+    mattes: list[Image.Image] = []
+    for image, prediction in zip(images, predictions, strict=True):
+        pred = prediction[0]
+        low, high = float(pred.min()), float(pred.max())
+        pred = (pred - low) / max(high - low, 1e-6)
+        mask = Image.fromarray((pred.clip(0, 1) * 255).astype("uint8"), mode="L")
+        if reducing_gap is None:
+            mattes.append(mask.resize(image.size, Image.LANCZOS))
+        else:
+            mattes.append(_refine_matte(mask, image))
+    return mattes
+
+
+def compute_alpha_mattes(
+    images: Sequence[Image.Image],
+    *,
+    quality: str = "full",
+    model: str | None = None,
+    batch_size: int | None = None,
+) -> list[Image.Image]:
+    """Return one matte per image, batching ONNX inference where the model allows.
+
+    u2net-family models run as a single stacked tensor per `batch_size` chunk on a
+    shared session; other models (or rembg builds without an exposed ONNX session)
+    fall back to `compute_alpha_matte` per image.
+    """
+
+    if not images:
+        return []
+    model = model or get_settings().matting_model
+    _rembg_remove()
+    inner_session = _batch_session(_rembg_session(model))
+    if inner_session is None or model not in _U2NET_FAMILY:
+        return [compute_alpha_matte(image, quality=quality, model=model) for image in images]
+
+    size = max(1, batch_size or get_settings().matting_batch_size)
+    mattes: list[Image.Image] = []
+    for start in range(0, len(images), size):
+        mattes.extend(
+            _run_u2net_batch(inner_session, images[start : start + size], quality=quality)
+        )
+    return mattes
+
+
+def apply_matte(image: Image.Image, matte: Image.Image) -> Image.Image:
+    """Cut out `image` with `matte`, leaving fully transparent pixels black (like rembg)."""
+
+    empty = Image.new("RGBA", image.size, (0, 0, 0, 0))
+    rgba = image if image.mode == "RGBA" else image.convert("RGBA")
+    return Image.composite(rgba, empty, matte)
+
+
+class MatteCache:
+    """Thread-safe LRU of alpha mattes, bounded by stored bytes.
+
+    Mattes are kept as single-channel `L` data (1 byte/pixel), optionally
+    PNG-compressed, so re-rendering with a different background only pays for
+    the composite.
+    """
+
+    def __init__(self, max_bytes: int, *, compress: bool = False) -> None:
+        self.max_bytes = max(0, max_bytes)
+        self.compress = compress
+        self._entries: OrderedDict[str, tuple[tuple[int, int], bytes]] = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Image.Image | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+        size, payload = entry
+        if self.compress:
+            return Image.open(io.BytesIO(payload)).convert("L")
+        return Image.frombytes("L", size, payload)
+
+    def put(self, key: str, matte: Image.Image) -> None:
+        if self.max_bytes <= 0:
+            return
+        matte = matte if matte.mode == "L" else matte.convert("L")
+        if self.compress:
+            buffer = io.BytesIO()
+            matte.save(buffer, format="PNG", compress_level=1)
+            payload = buffer.getvalue()
+        else:
+            payload = matte.tobytes()
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous[1])
+            self._entries[key] = (matte.size, payload)
+            self._bytes += len(payload)
+            while self._bytes > self.max_bytes and self._entries:
+                _key, (_size, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._hits = 0
+            self._misses = 0
+
+    def stats(self) -> dict[str, int | bool]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "compressed": self.compress,
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+
+MATTE_CACHE = MatteCache(
+    get_settings().matte_cache_mb * 1024 * 1024, compress=get_settings().matte_cache_compress
+)
+
+
+# GrabCut cost grows quickly with pixel count, so it always works on a small copy.
+_GRABCUT_MAX_EDGES: dict[str, int] = {"full": 800, "balanced": 640, "fast": 400}
+_GRABCUT_ITERATIONS = 3
+
+
+class MattingBackend(ABC):
+    """Base class for matting backends; subclasses implement `compute`.
+
+    `matte`/`mattes` wrap the implementation with latency bookkeeping that is
+    surfaced through `diagnostics()`.
+    """
+
+    name = ""
+    provider = ""
+    # Whether results are worth keeping in `MATTE_CACHE` (cheap backends skip it).
+    cacheable = True
+    # Whether `compute` wants a subject bbox (e.g. a face-derived box) as a seed.
+    uses_subject_hint = False
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._total_ms = 0.0
+        self._last_ms = 0.0
+
+    def is_available(self) -> bool:
+        return True
+
+    def cache_tag(self) -> str:
+        return self.name
+
+    def warm_up(self) -> None:
+        """Load whatever the first `compute` would (modules, model sessions)."""
+
+        # Nothing to load by default.
+        return None
+
+    @abstractmethod
+    def compute(
+        self,
+        image: Image.Image,
+        *,
+        quality: str,
+        subject_bbox: tuple[int, int, int, int] | None = None,
+    ) -> Image.Image:
+        """Alpha matte (`L`, same size as `image`)."""
+
+    def compute_many(
+        self,
+        images: Sequence[Image.Image],
+        *,
+        quality: str,
+        batch_size: int | None = None,
+        subject_bboxes: Sequence[tuple[int, int, int, int] | None] | None = None,
+    ) -> list[Image.Image]:
+        hints = list(subject_bboxes) if subject_bboxes is not None else [None] * len(images)
+        return [
+            self.compute(image, quality=quality, subject_bbox=hint)
+            for image, hint in zip(images, hints, strict=True)
+        ]
+
+    def matte(
+        self,
+        image: Image.Image,
+        *,
+        quality: str,
+        subject_bbox: tuple[int, int, int, int] | None = None,
+    ) -> Image.Image:
+        start = time.perf_counter()
+        result = self.compute(image, quality=quality, subject_bbox=subject_bbox)
+        self._record((time.perf_counter() - start) * 1000.0, 1)
+        return result
+
+    def mattes(
+        self,
+        images: Sequence[Image.Image],
+        *,
+        quality: str,
+        batch_size: int | None = None,
+        subject_bboxes: Sequence[tuple[int, int, int, int] | None] | None = None,
+    ) -> list[Image.Image]:
+        if not images:
+            return []
+        start = time.perf_counter()
+        result = self.compute_many(
+            images, quality=quality, batch_size=batch_size, subject_bboxes=subject_bboxes
+        )
+        self._record((time.perf_counter() - start) * 1000.0, len(images))
+        return result
+
+    def _record(self, elapsed_ms: float, count: int) -> None:
+        with self._lock:
+            self._calls += count
+            self._total_ms += elapsed_ms
+            self._last_ms = elapsed_ms / count
+
+    def diagnostics(self) -> dict[str, object]:
+        with self._lock:
+            calls = self._calls
+            avg_ms = self._total_ms / calls if calls else 0.0
+            last_ms = self._last_ms
+        return {
+            "provider": self.provider,
+            "available": self.is_available(),
+            "calls": calls,
+            "avg_ms": round(avg_ms, 1),
+            "last_ms": round(last_ms, 1),
+        }
+
+
+class RembgBackend(MattingBackend):
+    name = "rembg"
+    provider = "rembg"
+
+    def is_available(self) -> bool:
+        return util.find_spec("rembg") is not None
+
+    def cache_tag(self) -> str:
+        return f"rembg-{get_settings().matting_model}"
+
+    def warm_up(self) -> None:
+        _rembg_session(get_settings().matting_model)
+
+    def compute(
+        self,
+        image: Image.Image,
+        *,
+        quality: str,
+        subject_bbox: tuple[int, int, int, int] | None = None,
+    ) -> Image.Image:
+        return compute_alpha_matte(image, quality=quality)
+
+    def compute_many(
+        self,
+        images: Sequence[Image.Image],
+        *,
+        quality: str,
+        batch_size: int | None = None,
+        subject_bboxes: Sequence[tuple[int, int, int, int] | None] | None = None,
+    ) -> list[Image.Image]:
+        return compute_alpha_mattes(images, quality=quality, batch_size=batch_size)
+
+
+class GrabCutBackend(MattingBackend):
+    """OpenCV GrabCut on a downscaled copy, seeded with the subject box.
+
+    Much lighter than an ONNX model and needs no model download; edges are
+    softer, so it suits previews and load shedding rather than final exports.
+    """
+
+    name = "grabcut"
+    provider = "opencv-grabcut"
+    uses_subject_hint = True
+
+    def is_available(self) -> bool:
+        return util.find_spec("cv2") is not None and util.find_spec("numpy") is not None
+
+    def warm_up(self) -> None:
+        self.compute(Image.new("RGB", (64, 64)), quality="fast")
+
+    def compute(
+        self,
+        image: Image.Image,
+        *,
+        quality: str,
+        subject_bbox: tuple[int, int, int, int] | None = None,
+    ) -> Image.Image:
+        try:
+            import cv2
+            import numpy as np
+        except Exception as exc:
+            raise ProcessingError(
+                "Background removal model unavailable.", code="background_removal_unavailable"
+            ) from exc
+
+        width, height = image.size
+        max_edge = _GRABCUT_MAX_EDGES.get(quality, _GRABCUT_MAX_EDGES["full"])
+        scale = min(1.0, max_edge / float(max(width, height)))
+        small = image.convert("RGB")
+        if scale < 1.0:
+            small = small.resize(
+                (max(1, int(round(width * scale))), max(1, int(round(height * scale)))),
+                Image.BILINEAR,
+            )
+        if subject_bbox is not None:
+            # The subject box covers head and shoulders; the body continues below it.
+            left, top, right, _bottom = subject_bbox
+            rect_box = (left * scale, top * scale, right * scale, float(small.height))
+        else:
+            rect_box = (small.width * 0.10, small.height * 0.05, small.width * 0.90, small.height)
+        x0 = max(1, int(rect_box[0]))
+        y0 = max(1, int(rect_box[1]))
+        x1 = min(small.width - 1, int(rect_box[2]))
+        y1 = min(small.height, int(rect_box[3]))
+        if x1 - x0 < 2 or y1 - y0 < 2:
+            return Image.new("L", image.size, 255)
+
+        mask = np.zeros((small.height, small.width), dtype=np.uint8)
+        bgd_model = np.zeros((1, 65), dtype=np.float64)
+        fgd_model = np.zeros((1, 65), dtype=np.float64)
+        bgr = cv2.cvtColor(np.asarray(small), cv2.COLOR_RGB2BGR)
+        try:
+            cv2.grabCut(
+                bgr,
+                mask,
+                (x0, y0, x1 - x0, y1 - y0),
+                bgd_model,
+                fgd_model,
+                _GRABCUT_ITERATIONS,
+                cv2.GC_INIT_WITH_RECT,
+            )
+        except Exception as exc:  # pragma: no cover - OpenCV internal
+            raise ProcessingError(
+                "Background removal failed.", code="background_removal_failed"
+            ) from exc
+        foreground = np.where((mask == cv2.GC_FGD) | (mask == cv2.GC_PR_FGD), 255, 0)
+        matte = Image.fromarray(foreground.astype(np.uint8), mode="L")
+        matte = matte.filter(ImageFilter.GaussianBlur(radius=1))
+        if matte.size != image.size:
+            matte = _refine_matte(matte, image)
+        return matte
+
+
+class NoopBackend(MattingBackend):
+    """Keeps every pixel (opaque matte). Useful for tests and benchmarks."""
+
+    name = "none"
+    provider = "noop"
+    cacheable = False
+
+    def compute(
+        self,
+        image: Image.Image,
+        *,
+        quality: str,
+        subject_bbox: tuple[int, int, int, int] | None = None,
+    ) -> Image.Image:
+        return Image.new("L", image.size, 255)
+
+
+MATTING_BACKENDS: dict[str, MattingBackend] = {}
+
+
+def register_backend(backend: MattingBackend) -> None:
+    MATTING_BACKENDS[backend.name] = backend
+
+
+def get_backend(name: str) -> MattingBackend:
+    backend = MATTING_BACKENDS.get(name.strip().lower())
+    if backend is None:
+        raise ProcessingError("Unknown matting backend.", code="unknown_matting_backend")
+    return backend
+
+
+def backends_diagnostics() -> dict[str, dict[str, object]]:
+    return {name: backend.diagnostics() for name, backend in MATTING_BACKENDS.items()}
+
+
+register_backend(RembgBackend())
+register_backend(GrabCutBackend())
+register_backend(NoopBackend())
@@ -0,0 +1,40 @@
+"""Process-local counters surfaced through `GET /api/metrics`."""
+
+from __future__ import annotations
+
+import threading
+
+
+def _key(name: str, labels: dict[str, str] | None) -> str:
+    if not labels:
+        return name
+    rendered = ",".join(f'{label}="{value}"' for label, value in sorted(labels.items()))
+    return f"{name}{{{rendered}}}"
+
+
+class Metrics:
+    """Thread-safe monotonic counters keyed by name and optional labels."""
+
+    def __init__(self) -> None:
+        self._counters: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, amount: int = 1, *, labels: dict[str, str] | None = None) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def value(self, name: str, *, labels: dict[str, str] | None = None) -> int:
+        with self._lock:
+            return self._counters.get(_key(name, labels), 0)
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return dict(sorted(self._counters.items()))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+
+
+METRICS = Metrics()
@@ -0,0 +1,104 @@
+"""Per-request pipeline context used for cooperative cancellation.
+
+Processing runs in worker threads, so it cannot be interrupted from the event
+loop. Instead the pipeline calls `PipelineContext.checkpoint(stage)` between
+stages; the API flips `cancel()` when the client disconnects, and a deadline
+stops work that has run past its time budget. Entry points take an explicit
+`ctx=` or fall back to the one `activate()`d on the current thread.
+
+Checkpoints double as stage boundaries: the time between one checkpoint and the
+next is attributed to the earlier stage (see `stage_timings`), and so is memory
+when a `MemoryProfiler` is attached.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import TYPE_CHECKING
+
+from ai_headshot_studio.errors import RequestCancelled
+from ai_headshot_studio.metrics import METRICS
+
+if TYPE_CHECKING:
+    from ai_headshot_studio.profiling import MemoryProfiler
+
+_CURRENT: ContextVar[PipelineContext | None] = ContextVar("pipeline_context", default=None)
+
+
+class PipelineContext:
+    def __init__(
+        self, *, timeout_s: float | None = None, memory: MemoryProfiler | None = None
+    ) -> None:
+        self.memory = memory
+        self.deadline = time.monotonic() + timeout_s if timeout_s and timeout_s > 0 else None
+        self._cancelled = threading.Event()
+        self._reason = ""
+        self._stage: str | None = None
+        self._stage_started = 0.0
+        self._timings: dict[str, float] = {}
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self, reason: str = "client_disconnected") -> None:
+        if not self._cancelled.is_set():
+            self._reason = reason
+            self._cancelled.set()
+
+    @contextmanager
+    def activate(self) -> Iterator[PipelineContext]:
+        token = _CURRENT.set(self)
+        try:
+            yield self
+        finally:
+            _CURRENT.reset(token)
+
+    def checkpoint(self, stage: str) -> None:
+        """Raise `RequestCancelled` if work on this request should stop before `stage`."""
+
+        if not self._cancelled.is_set():
+            if self.deadline is None or time.monotonic() < self.deadline:
+                self._enter(stage)
+                return
+            self.cancel("deadline_exceeded")
+        reason = self._reason
+        METRICS.inc("pipeline_cancelled_total", labels={"reason": reason, "stage": stage})
+        if reason == "deadline_exceeded":
+            raise RequestCancelled(
+                "Processing took too long and was stopped.", code="deadline_exceeded"
+            )
+        raise RequestCancelled("Request was cancelled by the client.", code="request_cancelled")
+
+    def _enter(self, stage: str) -> None:
+        now = time.perf_counter()
+        if self._stage is not None:
+            self._timings[self._stage] = (
+                self._timings.get(self._stage, 0.0) + now - self._stage_started
+            )
+        self._stage = stage
+        self._stage_started = now
+        if self.memory is not None:
+            self.memory.mark(stage)
+
+    def stage_timings(self) -> dict[str, float]:
+        """Milliseconds spent per stage so far, including the stage still running.
+
+        A stage entered more than once (e.g. `crop` per rendition) accumulates.
+        """
+
+        timings = dict(self._timings)
+        if self._stage is not None:
+            elapsed = time.perf_counter() - self._stage_started
+            timings[self._stage] = timings.get(self._stage, 0.0) + elapsed
+        return {stage: seconds * 1000.0 for stage, seconds in timings.items()}
+
+
+def current_context() -> PipelineContext:
+    """The active context, or a fresh one that never cancels."""
+
+    return _CURRENT.get() or PipelineContext()
@@ -1,13 +1,29 @@
 from __future__ import annotations
 
-import importlib
+import hashlib
 import io
 import math
 import string
-from dataclasses import dataclass
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass, replace
+from typing import cast
 
 from PIL import Image, ImageEnhance, ImageFilter, ImageOps
 
+from ai_headshot_studio.admission import MEMORY_BUDGET, estimate_pipeline_bytes
+from ai_headshot_studio.config import get_settings
+from ai_headshot_studio.errors import ProcessingError as ProcessingError  # public here too
+from ai_headshot_studio.errors import RequestCancelled
+from ai_headshot_studio.faces import detect_face
+from ai_headshot_studio.matting import (
+    MATTE_CACHE,
+    MATTE_QUALITIES,
+    MATTING_BACKENDS,
+    MattingBackend,
+    apply_matte,
+    get_backend,
+)
+from ai_headshot_studio.pipeline import PipelineContext, current_context
 from ai_headshot_studio.presets import PRESETS, STYLES
 
 MAX_UPLOAD_MB = 12
@@ -15,17 +31,94 @@ MAX_UPLOAD_BYTES = MAX_UPLOAD_MB * 1024 * 1024
 MAX_PIXELS = 20_000_000
 _ALPHA_THRESHOLD = 8
 _ALPHA_TABLE = [0 if i <= _ALPHA_THRESHOLD else 255 for i in range(256)]
+# Rows/columns thresholded per step when tightening the bbox edges.
+_MASK_EDGE_STRIP = 16
 _SKIN_MAX_SAMPLE_EDGE = 240
 _SKIN_MIN_PIXELS = 180
 _SKIN_CHROMA_WARNING_DELTA = 14.0
 _RECOMMENDED_MIN_OUTPUT_EDGE = 600
 _RECOMMENDED_MIN_LOSSY_QUALITY = 80
+MAX_RENDITIONS = 16
+# Lowest quality the `max_bytes` search may pick, and its encode budget
+# (one encode at the requested quality plus a binary search of 30..99).
+TARGET_MIN_QUALITY = 30
+_TARGET_MAX_ENCODES = 8
+# Smallest accepted `max_bytes`; below this even a tiny avatar won't fit.
+_TARGET_MIN_BYTES = 1024
+# `reducing_gap` per resize quality tier: Pillow box-reduces by an integer factor
+# until the image is within `gap` times the target, then runs the LANCZOS pass.
+# `None` keeps the single full-resolution LANCZOS resample.
+RESIZE_QUALITIES: dict[str, float | None] = {
+    "high": None,
+    "balanced": 3.0,
+    "fast": 2.0,
+}
 
 
-class ProcessingError(ValueError):
-    def __init__(self, message: str, code: str = "processing_error") -> None:
-        super().__init__(message)
-        self.code = code
+@dataclass(frozen=True)
+class EncodeProfile:
+    """Encoder effort settings applied by `to_bytes` for one named profile.
+
+    `jpeg_subsampling=None` leaves Pillow's default (4:2:0) in place.
+    """
+
+    png_compress_level: int
+    png_optimize: bool
+    webp_method: int
+    jpeg_optimize: bool
+    jpeg_progressive: bool = False
+    jpeg_subsampling: int | None = None
+
+
+# `smallest` is the historical behaviour: each encoder's slowest, tightest mode.
+ENCODE_PROFILES: dict[str, EncodeProfile] = {
+    "fast": EncodeProfile(
+        png_compress_level=1,
+        png_optimize=False,
+        webp_method=0,
+        jpeg_optimize=False,
+        jpeg_subsampling=2,
+    ),
+    "balanced": EncodeProfile(
+        png_compress_level=6,
+        png_optimize=False,
+        webp_method=4,
+        jpeg_optimize=True,
+    ),
+    "smallest": EncodeProfile(
+        png_compress_level=9,
+        png_optimize=True,
+        webp_method=6,
+        jpeg_optimize=True,
+    ),
+}
+
+
+# Pillow's JPEG `subsampling` values by chroma ratio.
+JPEG_SUBSAMPLING: dict[str, int] = {
+    "4:4:4": 0,
+    "4:2:2": 1,
+    "4:2:0": 2,
+}
+
+# Base quantization tables (luma, chroma), scaled by `jpeg_quality` like libjpeg's
+# own. `None` keeps libjpeg's standard (Annex K) tables. `robidoux` is the flatter
+# table ImageMagick and mozjpeg default to; it keeps more low-frequency detail
+# (skin gradients) per byte.
+_ROBIDOUX_TABLE = [
+    16, 16, 16, 18, 25, 37, 56, 85,
+    16, 17, 20, 27, 34, 40, 53, 75,
+    16, 20, 24, 31, 43, 62, 91, 135,
+    18, 27, 31, 40, 53, 74, 106, 156,
+    25, 34, 43, 53, 69, 94, 131, 189,
+    37, 40, 62, 74, 94, 124, 169, 238,
+    56, 53, 91, 106, 131, 169, 226, 311,
+    85, 75, 135, 156, 189, 238, 311, 418,
+]  # fmt: skip
+JPEG_QTABLES: dict[str, list[list[int]] | None] = {
+    "standard": None,
+    "robidoux": [_ROBIDOUX_TABLE, _ROBIDOUX_TABLE],
+}
 
 
 @dataclass(frozen=True)
@@ -43,6 +136,14 @@ class ProcessRequest:
     soften: float
     jpeg_quality: int
     output_format: str
+    resize_quality: str = "high"
+    matte_quality: str = "full"
+    matting_backend: str | None = None
+    encode_profile: str = "smallest"
+    max_bytes: int | None = None
+    jpeg_progressive: bool = False
+    jpeg_subsampling: str | None = None
+    jpeg_qtables: str | None = None
 
 
 @dataclass(frozen=True)
@@ -51,12 +152,49 @@ class ProcessWarning:
     message: str
 
 
+@dataclass(frozen=True)
+class MaskStats:
+    """Alpha-channel summary computed once and shared by framing and retouch.
+
+    `bbox` is the exact bounds of pixels above the alpha threshold; `opaque` marks
+    a fully opaque frame, which lets the skin-tone check skip the white composite.
+    """
+
+    size: tuple[int, int]
+    bbox: tuple[int, int, int, int] | None
+    opaque: bool
+
+    @classmethod
+    def opaque_frame(cls, size: tuple[int, int]) -> MaskStats:
+        width, height = size
+        return cls(size=size, bbox=(0, 0, width, height), opaque=True)
+
+
+@dataclass(frozen=True)
+class Rendition:
+    preset: str
+    output_format: str
+
+
+@dataclass(frozen=True)
+class RenditionResult:
+    rendition: Rendition
+    image: Image.Image
+    warnings: list[ProcessWarning]
+
+
 def validate_bytes(data: bytes) -> None:
     if len(data) > MAX_UPLOAD_BYTES:
         raise ProcessingError(f"File too large. Max {MAX_UPLOAD_MB}MB.", code="file_too_large")
 
 
-def load_image(data: bytes) -> Image.Image:
+def open_image(data: bytes) -> Image.Image:
+    """Read the header and sniff the format without decoding pixel data.
+
+    The returned image is lazy: dimensions are known, pixels are not loaded until
+    `decode_image`, so callers can budget memory in between.
+    """
+
     try:
         image = Image.open(io.BytesIO(data))
     except Image.DecompressionBombError as exc:  # pragma: no cover - PIL internal
@@ -73,7 +211,10 @@ def load_image(data: bytes) -> Image.Image:
     # Guard against decompression bombs: reject oversized dimensions before decoding.
     if image.width * image.height > MAX_PIXELS:
         raise ProcessingError("Image dimensions too large.", code="image_too_large")
+    return image
 
+
+def decode_image(image: Image.Image) -> Image.Image:
     try:
         image.load()
         image = ImageOps.exif_transpose(image)
@@ -86,45 +227,120 @@ def load_image(data: bytes) -> Image.Image:
     return image
 
 
+def load_image(data: bytes) -> Image.Image:
+    return decode_image(open_image(data))
+
+
+def _pipeline_bytes(images: Sequence[Image.Image], req: ProcessRequest) -> int:
+    return sum(
+        estimate_pipeline_bytes(image.width, image.height, remove_bg=req.remove_bg)
+        for image in images
+    )
+
+
 def to_rgba(image: Image.Image) -> Image.Image:
     if image.mode != "RGBA":
         return image.convert("RGBA")
     return image
 
 
-def remove_background(image: Image.Image) -> Image.Image:
+def normalize_matte_quality(value: str) -> str:
+    key = value.strip().lower()
+    if key not in MATTE_QUALITIES:
+        raise ProcessingError("Unsupported matte quality.", code="unsupported_matte_quality")
+    return key
+
+
+def normalize_matting_backend(value: str | None) -> str | None:
+    if value is None or not value.strip():
+        return None
+    return get_backend(value).name
+
+
+def resolve_matting_backend(name: str | None = None) -> MattingBackend:
+    """Return the requested backend, or the configured default when `name` is None."""
+
+    return get_backend(name or get_settings().matting_backend)
+
+
+def _fallback_backend(requested: str | None, failed: MattingBackend) -> MattingBackend | None:
+    # Only substitute when the caller didn't pick a backend explicitly.
+    if requested is not None:
+        return None
+    name = get_settings().matting_fallback
+    backend = MATTING_BACKENDS.get(name) if name else None
+    if backend is None or backend is failed or not backend.is_available():
+        return None
+    return backend
+
+
+def _run_matting(
+    images: Sequence[Image.Image],
+    *,
+    quality: str,
+    backend: str | None,
+    batch_size: int | None = None,
+) -> tuple[list[Image.Image], MattingBackend]:
+    """Matte `images` with the chosen backend, falling back when it is unavailable."""
+
+    primary = resolve_matting_backend(backend)
     try:
-        rembg = importlib.import_module("rembg")
-        remove = getattr(rembg, "remove", None)
-        if remove is None:
-            raise ProcessingError(
-                "Background removal model unavailable.", code="background_removal_unavailable"
-            )
-    except SystemExit as exc:  # pragma: no cover - runtime dependency
-        # Some `rembg` installs call `sys.exit(1)` when an ONNX backend is missing.
-        raise ProcessingError(
-            "Background removal model unavailable.", code="background_removal_unavailable"
-        ) from exc
-    except ProcessingError:
-        raise
-    except Exception as exc:  # pragma: no cover - runtime dependency
-        raise ProcessingError(
-            "Background removal model unavailable.", code="background_removal_unavailable"
-        ) from exc
+        return _matte_with(primary, images, quality=quality, batch_size=batch_size), primary
+    except ProcessingError as exc:
+        fallback = _fallback_backend(backend, primary)
+        if exc.code != "background_removal_unavailable" or fallback is None:
+            raise
+    return _matte_with(fallback, images, quality=quality, batch_size=batch_size), fallback
+
+
+def _matte_with(
+    matting: MattingBackend,
+    images: Sequence[Image.Image],
+    *,
+    quality: str,
+    batch_size: int | None,
+) -> list[Image.Image]:
+    hints = [face_subject_bbox(image) for image in images] if matting.uses_subject_hint else None
+    if len(images) == 1:
+        hint = hints[0] if hints is not None else None
+        return [matting.matte(images[0], quality=quality, subject_bbox=hint)]
+    return matting.mattes(images, quality=quality, batch_size=batch_size, subject_bboxes=hints)
+
+
+def upload_digest(data: bytes) -> str:
+    """Hash an upload once; the digest keys both the matte cache and request coalescing."""
+
+    return hashlib.sha256(data).hexdigest()
+
+
+def matte_cache_key(digest: str, *, quality: str, backend: str | None = None) -> str:
+    return f"{digest}:{resolve_matting_backend(backend).cache_tag()}:{quality}"
+
+
+def request_fingerprint(digest: str, req: ProcessRequest) -> str | None:
+    """Identify a render by upload digest and normalized settings (None if invalid)."""
 
     try:
-        result = remove(image)
-    except SystemExit as exc:  # pragma: no cover - runtime dependency
-        raise ProcessingError(
-            "Background removal model unavailable.", code="background_removal_unavailable"
-        ) from exc
-    except Exception as exc:  # pragma: no cover - runtime dependency
-        raise ProcessingError(
-            "Background removal model unavailable.", code="background_removal_unavailable"
-        ) from exc
-    if isinstance(result, Image.Image):
-        return result
-    return Image.open(io.BytesIO(result))
+        normalized = clamp_request(normalize_request(req))
+    except ProcessingError:
+        return None
+    return f"{digest}:{normalized!r}"
+
+
+def remove_background(
+    image: Image.Image,
+    *,
+    quality: str = "full",
+    cache_key: str | None = None,
+    backend: str | None = None,
+) -> Image.Image:
+    matte = MATTE_CACHE.get(cache_key) if cache_key is not None else None
+    if matte is None or matte.size != image.size:
+        mattes, used = _run_matting([image], quality=quality, backend=backend)
+        matte = mattes[0]
+        if cache_key is not None and used is resolve_matting_backend(backend) and used.cacheable:
+            MATTE_CACHE.put(cache_key, matte)
+    return apply_matte(image, matte)
 
 
 def normalize_hex_color(value: str | None) -> str | None:
@@ -179,6 +395,41 @@ def normalize_output_format(value: str) -> str:
     return fmt
 
 
+def normalize_encode_profile(value: str) -> str:
+    key = value.strip().lower()
+    if key not in ENCODE_PROFILES:
+        raise ProcessingError("Unsupported encode profile.", code="unsupported_encode_profile")
+    return key
+
+
+def normalize_max_bytes(value: int | None) -> int | None:
+    if value is None or value == 0:
+        return None
+    if value < _TARGET_MIN_BYTES:
+        raise ProcessingError(
+            f"max_bytes must be at least {_TARGET_MIN_BYTES}.", code="invalid_parameter"
+        )
+    return value
+
+
+def normalize_jpeg_subsampling(value: str | None) -> str | None:
+    if value is None or not value.strip():
+        return None
+    key = value.strip()
+    if key not in JPEG_SUBSAMPLING:
+        raise ProcessingError("Unsupported JPEG subsampling.", code="unsupported_subsampling")
+    return key
+
+
+def normalize_jpeg_qtables(value: str | None) -> str | None:
+    if value is None or not value.strip():
+        return None
+    key = value.strip().lower()
+    if key not in JPEG_QTABLES:
+        raise ProcessingError("Unsupported JPEG quantization tables.", code="unsupported_qtables")
+    return key
+
+
 def apply_adjustments(image: Image.Image, req: ProcessRequest) -> Image.Image:
     adjusted = image
     adjusted = ImageEnhance.Brightness(adjusted).enhance(req.brightness)
@@ -195,30 +446,97 @@ def crop_to_aspect(image: Image.Image, ratio: float, top_bias: float = 0.2) -> I
     return crop_to_aspect_focus(image, ratio=ratio, top_bias=top_bias, focus_bbox=None)
 
 
-def alpha_foreground_bbox(image: Image.Image) -> tuple[int, int, int, int] | None:
-    """Best-effort foreground bounds from alpha channel (when present).
+def _thresholded_bbox(alpha: Image.Image) -> tuple[int, int, int, int] | None:
+    # The raw non-zero bbox is cheap and bounds the thresholded one; only strips
+    # along its edges are thresholded, walking inward past faint (<= threshold) halo.
+    raw = alpha.getbbox()
+    if raw is None:
+        return None
+    left, top, right, bottom = raw
+    step = _MASK_EDGE_STRIP
+    while top < bottom:
+        found = (
+            alpha.crop((left, top, right, min(bottom, top + step))).point(_ALPHA_TABLE).getbbox()
+        )
+        if found is not None:
+            top += found[1]
+            break
+        top += step
+    else:
+        return None
+    while bottom > top:
+        start = max(top, bottom - step)
+        found = alpha.crop((left, start, right, bottom)).point(_ALPHA_TABLE).getbbox()
+        if found is not None:
+            bottom = start + found[3]
+            break
+        bottom = start
+    while left < right:
+        found = (
+            alpha.crop((left, top, min(right, left + step), bottom)).point(_ALPHA_TABLE).getbbox()
+        )
+        if found is not None:
+            left += found[0]
+            break
+        left += step
+    while right > left:
+        start = max(left, right - step)
+        found = alpha.crop((start, top, right, bottom)).point(_ALPHA_TABLE).getbbox()
+        if found is not None:
+            right = start + found[2]
+            break
+        right = start
+    return (left, top, right, bottom)
 
-    This is a lightweight framing helper that works well for transparent PNGs and
-    background-removed outputs. It is intentionally conservative: if alpha is
-    missing or empty, returns None.
+
+def _alpha_low(image: Image.Image) -> int:
+    low, _high = cast(tuple[int, int], image.getchannel("A").getextrema())
+    return low
+
+
+def mask_stats(image: Image.Image) -> MaskStats | None:
+    """Summarize the alpha channel once, or return None when there is no alpha.
+
+    The bbox is exact; only strips along the edges of the raw non-zero bounds are
+    thresholded at full resolution.
     """
 
     if "A" not in image.getbands():
         return None
     alpha = image.getchannel("A")
-    # Reduce faint edge noise by thresholding alpha before bbox.
-    mask = alpha.point(_ALPHA_TABLE)
-    bbox = mask.getbbox()
-    if not bbox:
+    low, high = cast(tuple[int, int], alpha.getextrema())
+    if low == 255:
+        return MaskStats.opaque_frame(image.size)
+    if high <= _ALPHA_THRESHOLD:
+        return MaskStats(size=image.size, bbox=None, opaque=False)
+
+    width, height = image.size
+    bbox = (0, 0, width, height) if low > _ALPHA_THRESHOLD else _thresholded_bbox(alpha)
+    return MaskStats(size=image.size, bbox=bbox, opaque=False)
+
+
+def alpha_foreground_bbox(
+    image: Image.Image, *, stats: MaskStats | None = None
+) -> tuple[int, int, int, int] | None:
+    """Best-effort foreground bounds from alpha channel (when present).
+
+    This is a lightweight framing helper that works well for transparent PNGs and
+    background-removed outputs. It is intentionally conservative: if alpha is
+    missing or empty, returns None. Pass precomputed `stats` to skip the alpha scan.
+    """
+
+    if stats is None:
+        stats = mask_stats(image)
+    if stats is None or stats.bbox is None:
         return None
-    left, top, right, bottom = bbox
+    left, top, right, bottom = stats.bbox
     if right <= left or bottom <= top:
         return None
     # Ignore tiny specks (e.g., compression artifacts) so we don't bias framing.
     bbox_area = (right - left) * (bottom - top)
     if bbox_area < int(image.width * image.height * 0.01):
         return None
-    return bbox
+    return stats.bbox
 
 
 def face_subject_bbox(image: Image.Image) -> tuple[int, int, int, int] | None:
@@ -228,60 +546,11 @@ def face_subject_bbox(image: Image.Image) -> tuple[int, int, int, int] | None:
     no face is found, returns None.
     """
 
-    try:
-        import cv2
-        import numpy as np
-    except Exception:
-        return None
-
     width, height = image.size
-    if width <= 0 or height <= 0:
+    face = detect_face(image)
+    if face is None:
         return None
-
-    # Downscale large inputs for speed and to avoid huge temporary arrays.
-    max_dim = 900
-    scale = 1.0
-    if max(width, height) > max_dim:
-        scale = max_dim / float(max(width, height))
-        scaled = image.resize(
-            (int(round(width * scale)), int(round(height * scale))), Image.BILINEAR
-        )
-    else:
-        scaled = image
-
-    try:
-        rgb = scaled.convert("RGB")
-        arr = np.array(rgb)
-        gray = cv2.cvtColor(arr, cv2.COLOR_RGB2GRAY)
-    except Exception:
-        return None
-
-    try:
-        cascade_path = getattr(getattr(cv2, "data", object()), "haarcascades", "")
-        cascade = cv2.CascadeClassifier(str(cascade_path) + "haarcascade_frontalface_default.xml")
-        faces = cascade.detectMultiScale(
-            gray,
-            scaleFactor=1.1,
-            minNeighbors=5,
-            flags=getattr(cv2, "CASCADE_SCALE_IMAGE", 0),
-            minSize=(max(24, int(min(gray.shape[0], gray.shape[1]) * 0.06)),) * 2,
-        )
-    except Exception:
-        return None
-
-    if faces is None or len(faces) == 0:
-        return None
-
-    # Choose the largest face as the primary subject.
-    x, y, w, h = max(faces, key=lambda item: int(item[2]) * int(item[3]))
-
-    # Map back to original resolution.
-    if scale != 1.0:
-        inv = 1.0 / scale
-        x = int(round(x * inv))
-        y = int(round(y * inv))
-        w = int(round(w * inv))
-        h = int(round(h * inv))
+    x, y, w, h = face
 
     # Expand face -> approximate head+shoulders subject bounds.
     pad_x = int(round(w * 0.60))
@@ -303,7 +572,9 @@ def face_subject_bbox(image: Image.Image) -> tuple[int, int, int, int] | None:
     return (left, top, right, bottom)
 
 
-def focus_bbox(image: Image.Image) -> tuple[int, int, int, int] | None:
+def focus_bbox(
+    image: Image.Image, *, stats: MaskStats | None = None
+) -> tuple[int, int, int, int] | None:
     """Return the best available focus bbox for crop framing.
 
     Priority:
@@ -311,7 +582,7 @@ def focus_bbox(image: Image.Image) -> tuple[int, int, int, int] | None:
     2) Optional face-derived subject bbox (best-effort for regular photos).
     """
 
-    return alpha_foreground_bbox(image) or face_subject_bbox(image)
+    return alpha_foreground_bbox(image, stats=stats) or face_subject_bbox(image)
 
 
 def crop_to_aspect_focus(
@@ -362,10 +633,20 @@ def crop_to_aspect_focus(
     return image.crop(box)
 
 
-def resize_if_needed(image: Image.Image, width: int | None, height: int | None) -> Image.Image:
+def normalize_resize_quality(value: str) -> str:
+    key = value.strip().lower()
+    if key not in RESIZE_QUALITIES:
+        raise ProcessingError("Unsupported resize quality.", code="unsupported_resize_quality")
+    return key
+
+
+def resize_if_needed(
+    image: Image.Image, width: int | None, height: int | None, *, quality: str = "high"
+) -> Image.Image:
     if width is None or height is None:
         return image
-    return image.resize((width, height), Image.LANCZOS)
+    reducing_gap = RESIZE_QUALITIES.get(quality)
+    return image.resize((width, height), Image.LANCZOS, reducing_gap=reducing_gap)
 
 
 def _retouch_is_neutral(req: ProcessRequest) -> bool:
@@ -397,10 +678,10 @@ def _coerce_focus_region(
     )
 
 
-def _rgb_view(image: Image.Image) -> Image.Image:
+def _rgb_view(image: Image.Image, *, opaque: bool = False) -> Image.Image:
     if image.mode == "RGB":
         return image
-    if image.mode in {"RGBA", "LA"}:
+    if image.mode in {"RGBA", "LA"} and not opaque:
         base = Image.new("RGB", image.size, (255, 255, 255))
         alpha = image.getchannel("A") if "A" in image.getbands() else None
         if alpha is not None:
@@ -413,10 +694,13 @@ def _sample_skin_chroma_shift(
     before: Image.Image,
     after: Image.Image,
     bbox: tuple[int, int, int, int] | None,
+    *,
+    opaque: bool = False,
 ) -> tuple[float, float, float, float] | None:
     region = _coerce_focus_region(before, bbox)
-    before_roi = _rgb_view(before).crop(region)
-    after_roi = _rgb_view(after).crop(region)
+    # Crop first so the white composite only touches the sampled region.
+    before_roi = _rgb_view(before.crop(region), opaque=opaque)
+    after_roi = _rgb_view(after.crop(region), opaque=opaque)
     if before_roi.width < 2 or before_roi.height < 2:
         return None
     if before_roi.size != after_roi.size:
@@ -480,8 +764,10 @@ def detect_skin_tone_warning(
     after: Image.Image,
     *,
     focus_bbox: tuple[int, int, int, int] | None,
+    mask: MaskStats | None = None,
 ) -> ProcessWarning | None:
-    chroma_stats = _sample_skin_chroma_shift(before, after, focus_bbox)
+    opaque = mask is not None and mask.opaque
+    chroma_stats = _sample_skin_chroma_shift(before, after, focus_bbox, opaque=opaque)
     if chroma_stats is None:
         return None
 
@@ -524,6 +810,13 @@ def normalize_request(req: ProcessRequest) -> ProcessRequest:
     output_format = normalize_output_format(req.output_format)
     style_key = req.style.strip().lower() if req.style else None
     background_hex = normalize_hex_color(req.background_hex)
+    resize_quality = normalize_resize_quality(req.resize_quality)
+    matte_quality = normalize_matte_quality(req.matte_quality)
+    matting_backend = normalize_matting_backend(req.matting_backend)
+    encode_profile = normalize_encode_profile(req.encode_profile)
+    max_bytes = normalize_max_bytes(req.max_bytes)
+    jpeg_subsampling = normalize_jpeg_subsampling(req.jpeg_subsampling)
+    jpeg_qtables = normalize_jpeg_qtables(req.jpeg_qtables)
 
     if background == "custom" and not background_hex:
         raise ProcessingError("Custom background color required.", code="missing_custom_color")
@@ -547,6 +840,14 @@ def normalize_request(req: ProcessRequest) -> ProcessRequest:
             soften=style.get("soften", req.soften),
             jpeg_quality=req.jpeg_quality,
             output_format=output_format,
+            resize_quality=resize_quality,
+            matte_quality=matte_quality,
+            matting_backend=matting_backend,
+            encode_profile=encode_profile,
+            max_bytes=max_bytes,
+            jpeg_progressive=req.jpeg_progressive,
+            jpeg_subsampling=jpeg_subsampling,
+            jpeg_qtables=jpeg_qtables,
         )
     return ProcessRequest(
         remove_bg=req.remove_bg,
@@ -562,6 +863,14 @@ def normalize_request(req: ProcessRequest) -> ProcessRequest:
         soften=req.soften,
         jpeg_quality=req.jpeg_quality,
         output_format=output_format,
+        resize_quality=resize_quality,
+        matte_quality=matte_quality,
+        matting_backend=matting_backend,
+        encode_profile=encode_profile,
+        max_bytes=max_bytes,
+        jpeg_progressive=req.jpeg_progressive,
+        jpeg_subsampling=jpeg_subsampling,
+        jpeg_qtables=jpeg_qtables,
     )
 
 
@@ -590,6 +899,14 @@ def clamp_request(req: ProcessRequest) -> ProcessRequest:
         soften=clamp(ensure_finite(req.soften, "soften"), 0.0, 1.0),
         jpeg_quality=int(clamp(float(req.jpeg_quality), 60, 100)),
         output_format=req.output_format,
+        resize_quality=req.resize_quality,
+        matte_quality=req.matte_quality,
+        matting_backend=req.matting_backend,
+        encode_profile=req.encode_profile,
+        max_bytes=req.max_bytes,
+        jpeg_progressive=req.jpeg_progressive,
+        jpeg_subsampling=req.jpeg_subsampling,
+        jpeg_qtables=req.jpeg_qtables,
     )
 
 
@@ -601,42 +918,357 @@ def ensure_preset(preset_key: str) -> tuple[float, int | None, int | None]:
     return preset.ratio, preset.width, preset.height
 
 
-def process_image_with_warnings(
-    data: bytes, req: ProcessRequest
-) -> tuple[Image.Image, list[ProcessWarning]]:
-    validate_bytes(data)
-    image = load_image(data)
-
-    req = clamp_request(normalize_request(req))
-
-    if req.remove_bg:
-        image = remove_background(image)
+def _prepare_image(
+    image: Image.Image,
+    req: ProcessRequest,
+    *,
+    data: bytes,
+    digest: str | None = None,
+    matte: Image.Image | None = None,
+    ctx: PipelineContext | None = None,
+) -> tuple[Image.Image, tuple[int, int, int, int] | None, list[ProcessWarning]]:
+    """Run the preset-independent stages: matting, focus, background and retouch."""
+
+    ctx = ctx or current_context()
+    ctx.checkpoint("matting")
+    if req.remove_bg and matte is not None:
+        image = apply_matte(image, matte)
+    elif req.remove_bg:
+        cache_key = matte_cache_key(
+            digest or upload_digest(data), quality=req.matte_quality, backend=req.matting_backend
+        )
+        image = remove_background(
+            image, quality=req.matte_quality, cache_key=cache_key, backend=req.matting_backend
+        )
 
-    crop_focus_bbox = focus_bbox(image)
+    ctx.checkpoint("framing")
+    # One alpha scan feeds both framing and the skin-tone check.
+    stats = mask_stats(image)
+    crop_focus_bbox = focus_bbox(image, stats=stats)
 
+    ctx.checkpoint("background")
     if req.remove_bg or req.background != "transparent":
         image = apply_background(to_rgba(image), req.background, req.background_hex)
+        if req.background.strip().lower() != "transparent":
+            stats = MaskStats.opaque_frame(image.size)
 
+    ctx.checkpoint("retouch")
     pre_adjust = image.copy()
     image = apply_adjustments(image, req)
     warnings: list[ProcessWarning] = []
     if not _retouch_is_neutral(req):
-        warning = detect_skin_tone_warning(pre_adjust, image, focus_bbox=crop_focus_bbox)
+        warning = detect_skin_tone_warning(
+            pre_adjust, image, focus_bbox=crop_focus_bbox, mask=stats
+        )
         if warning is not None:
             warnings.append(warning)
+    return image, crop_focus_bbox, warnings
 
-    ratio, width, height = ensure_preset(req.preset)
-    image = crop_to_aspect_focus(
-        image, ratio=ratio, top_bias=req.top_bias, focus_bbox=crop_focus_bbox
-    )
-    image = resize_if_needed(image, width=width, height=height)
+
+def _crop_for_preset(
+    image: Image.Image,
+    preset: str,
+    *,
+    top_bias: float,
+    crop_focus_bbox: tuple[int, int, int, int] | None,
+    resize_quality: str = "high",
+) -> Image.Image:
+    ratio, width, height = ensure_preset(preset)
+    image = crop_to_aspect_focus(image, ratio=ratio, top_bias=top_bias, focus_bbox=crop_focus_bbox)
+    return resize_if_needed(image, width=width, height=height, quality=resize_quality)
+
+
+def _output_warnings(image: Image.Image, req: ProcessRequest) -> list[ProcessWarning]:
+    warnings: list[ProcessWarning] = []
     low_res_warning = detect_low_output_resolution_warning(image)
     if low_res_warning is not None:
         warnings.append(low_res_warning)
     low_quality_warning = detect_low_lossy_quality_warning(req)
     if low_quality_warning is not None:
         warnings.append(low_quality_warning)
-    return image, warnings
+    return warnings
+
+
+def process_image_with_warnings(
+    data: bytes,
+    req: ProcessRequest,
+    *,
+    digest: str | None = None,
+    ctx: PipelineContext | None = None,
+) -> tuple[Image.Image, list[ProcessWarning]]:
+    """Run the full pipeline; pass `digest` (from `upload_digest`) to skip re-hashing."""
+
+    ctx = ctx or current_context()
+    validate_bytes(data)
+    image = open_image(data)
+    # Hold a share of the memory budget from decode until the output is cropped.
+    with MEMORY_BUDGET.reserve(_pipeline_bytes([image], req)):
+        ctx.checkpoint("decode")
+        image = decode_image(image)
+
+        req = clamp_request(normalize_request(req))
+        image, crop_focus_bbox, warnings = _prepare_image(
+            image, req, data=data, digest=digest, ctx=ctx
+        )
+        ctx.checkpoint("crop")
+        image = _crop_for_preset(
+            image,
+            req.preset,
+            top_bias=req.top_bias,
+            crop_focus_bbox=crop_focus_bbox,
+            resize_quality=req.resize_quality,
+        )
+    return image, warnings + _output_warnings(image, req)
+
+
+def _process_opened(
+    opened: dict[int, Image.Image],
+    items: Sequence[bytes],
+    req: ProcessRequest,
+    outcomes: list[tuple[Image.Image, list[ProcessWarning]] | ProcessingError | None],
+    *,
+    settings_error: ProcessingError | None,
+    batch_size: int | None,
+    ctx: PipelineContext,
+) -> None:
+    decoded: dict[int, Image.Image] = {}
+    for index, opened_image in opened.items():
+        ctx.checkpoint("decode")
+        try:
+            image = decode_image(opened_image)
+        except ProcessingError as exc:
+            outcomes[index] = exc
+            continue
+        if settings_error is not None:
+            outcomes[index] = settings_error
+            continue
+        decoded[index] = image
+
+    mattes: dict[int, Image.Image] = {}
+    digests: dict[int, str] = {}
+    if req.remove_bg and decoded:
+        pending: dict[int, str] = {}
+        for index, image in decoded.items():
+            digests[index] = upload_digest(items[index])
+            key = matte_cache_key(
+                digests[index], quality=req.matte_quality, backend=req.matting_backend
+            )
+            cached = MATTE_CACHE.get(key)
+            if cached is not None and cached.size == image.size:
+                mattes[index] = cached
+            else:
+                pending[index] = key
+        ctx.checkpoint("matting")
+        try:
+            computed, used = (
+                _run_matting(
+                    [decoded[index] for index in pending],
+                    quality=req.matte_quality,
+                    backend=req.matting_backend,
+                    batch_size=batch_size,
+                )
+                if pending
+                else ([], resolve_matting_backend(req.matting_backend))
+            )
+        except ProcessingError as exc:
+            for index in pending:
+                outcomes[index] = exc
+                del decoded[index]
+        else:
+            cache_results = used is resolve_matting_backend(req.matting_backend) and used.cacheable
+            for (index, key), matte in zip(pending.items(), computed, strict=True):
+                if cache_results:
+                    MATTE_CACHE.put(key, matte)
+                mattes[index] = matte
+
+    for index, image in decoded.items():
+        try:
+            prepared, crop_focus_bbox, warnings = _prepare_image(
+                image,
+                req,
+                data=items[index],
+                digest=digests.get(index),
+                matte=mattes.get(index),
+                ctx=ctx,
+            )
+            result = _crop_for_preset(
+                prepared,
+                req.preset,
+                top_bias=req.top_bias,
+                crop_focus_bbox=crop_focus_bbox,
+                resize_quality=req.resize_quality,
+            )
+        except RequestCancelled:
+            raise
+        except ProcessingError as exc:
+            outcomes[index] = exc
+            continue
+        outcomes[index] = (result, warnings + _output_warnings(result, req))
+
+
+def process_images_with_warnings(
+    items: Sequence[bytes],
+    req: ProcessRequest,
+    *,
+    batch_size: int | None = None,
+    ctx: PipelineContext | None = None,
+) -> list[tuple[Image.Image, list[ProcessWarning]] | ProcessingError]:
+    """Process several uploads with the same settings, batching background removal.
+
+    Returns one entry per input, in order: the result, or the `ProcessingError`
+    that item failed with (so callers can keep going). Mattes missing from the
+    cache are computed together in one `MattingBackend.mattes` call on the request's
+    backend (see `_run_matting`), which falls back to the configured fallback
+    backend when it is unavailable. Cancellation via `ctx` aborts the whole call
+    with `RequestCancelled`.
+    """
+
+    ctx = ctx or current_context()
+    outcomes: list[tuple[Image.Image, list[ProcessWarning]] | ProcessingError | None]
+    outcomes = [None] * len(items)
+    settings_error: ProcessingError | None = None
+    try:
+        req = clamp_request(normalize_request(req))
+    except ProcessingError as exc:
+        settings_error = exc
+
+    opened: dict[int, Image.Image] = {}
+    for index, data in enumerate(items):
+        try:
+            validate_bytes(data)
+            opened[index] = open_image(data)
+        except ProcessingError as exc:
+            outcomes[index] = exc
+
+    # One reservation for the whole chunk: per-item shares taken one at a time
+    # could deadlock two batches that each hold part of the budget.
+    with MEMORY_BUDGET.reserve(_pipeline_bytes(list(opened.values()), req)):
+        _process_opened(
+            opened,
+            items,
+            req,
+            outcomes,
+            settings_error=settings_error,
+            batch_size=batch_size,
+            ctx=ctx,
+        )
+    # Callers pair outcomes with inputs by position, so every slot must be filled.
+    results: list[tuple[Image.Image, list[ProcessWarning]] | ProcessingError] = []
+    for index, item in enumerate(outcomes):
+        if item is None:
+            raise RuntimeError(f"batch item {index} produced no outcome")
+        results.append(item)
+    return results
+
+
+def parse_renditions(value: str) -> list[Rendition]:
+    """Parse `preset:format` pairs separated by commas or whitespace.
+
+    Keys are normalized and duplicates dropped (first occurrence wins), so the
+    returned order matches the caller's order.
+    """
+
+    tokens = [token for token in value.replace(",", " ").split() if token]
+    if not tokens:
+        raise ProcessingError("At least one rendition is required.", code="invalid_renditions")
+    renditions: list[Rendition] = []
+    for token in tokens:
+        preset, sep, fmt = token.partition(":")
+        if not sep or not preset.strip() or not fmt.strip():
+            raise ProcessingError(
+                f"Invalid rendition {token!r}. Use preset:format.", code="invalid_renditions"
+            )
+        rendition = Rendition(
+            preset=preset.strip().lower(), output_format=normalize_output_format(fmt)
+        )
+        ensure_preset(rendition.preset)
+        if rendition not in renditions:
+            renditions.append(rendition)
+    if len(renditions) > MAX_RENDITIONS:
+        raise ProcessingError(
+            f"Too many renditions. Max {MAX_RENDITIONS}.", code="too_many_renditions"
+        )
+    return renditions
+
+
+def process_renditions(
+    data: bytes,
+    req: ProcessRequest,
+    renditions: Sequence[Rendition],
+    *,
+    digest: str | None = None,
+    ctx: PipelineContext | None = None,
+) -> list[RenditionResult]:
+    """Render several preset/format pairs from a single decode.
+
+    Decode, background removal, focus detection and retouch run once; only the
+    crop/resize step runs per preset (shared across formats of the same preset).
+    `req.preset` and `req.output_format` are ignored in favour of each rendition.
+    Callers encode each result with `to_bytes(result.image, result.rendition.output_format)`.
+    """
+
+    if not renditions:
+        raise ProcessingError("At least one rendition is required.", code="invalid_renditions")
+    if len(renditions) > MAX_RENDITIONS:
+        raise ProcessingError(
+            f"Too many renditions. Max {MAX_RENDITIONS}.", code="too_many_renditions"
+        )
+    normalized = [
+        Rendition(
+            preset=item.preset.strip().lower(),
+            output_format=normalize_output_format(item.output_format),
+        )
+        for item in renditions
+    ]
+    for item in normalized:
+        ensure_preset(item.preset)
+    validate_bytes(data)
+    image = open_image(data)
+    ctx = ctx or current_context()
+    with MEMORY_BUDGET.reserve(_pipeline_bytes([image], req)):
+        ctx.checkpoint("decode")
+        return _render_renditions(decode_image(image), data, digest, req, normalized, ctx)
+
+
+def _render_renditions(
+    image: Image.Image,
+    data: bytes,
+    digest: str | None,
+    req: ProcessRequest,
+    normalized: Sequence[Rendition],
+    ctx: PipelineContext,
+) -> list[RenditionResult]:
+    first = normalized[0]
+    req = clamp_request(
+        normalize_request(replace(req, preset=first.preset, output_format=first.output_format))
+    )
+
+    image, crop_focus_bbox, shared_warnings = _prepare_image(
+        image, req, data=data, digest=digest, ctx=ctx
+    )
+
+    cropped: dict[str, Image.Image] = {}
+    results: list[RenditionResult] = []
+    for item in normalized:
+        if item.preset not in cropped:
+            ctx.checkpoint("crop")
+            cropped[item.preset] = _crop_for_preset(
+                image,
+                item.preset,
+                top_bias=req.top_bias,
+                crop_focus_bbox=crop_focus_bbox,
+                resize_quality=req.resize_quality,
+            )
+        rendered = cropped[item.preset]
+        item_req = replace(req, preset=item.preset, output_format=item.output_format)
+        results.append(
+            RenditionResult(
+                rendition=item,
+                image=rendered,
+                warnings=list(shared_warnings) + _output_warnings(rendered, item_req),
+            )
+        )
+    return results
 
 
 def process_image(data: bytes, req: ProcessRequest) -> Image.Image:
@@ -644,23 +1276,43 @@ def process_image(data: bytes, req: ProcessRequest) -> Image.Image:
     return image
 
 
-def to_bytes(image: Image.Image, output_format: str, jpeg_quality: int = 92) -> bytes:
-    buffer = io.BytesIO()
+def encode_image(
+    image: Image.Image,
+    output_format: str,
+    jpeg_quality: int = 92,
+    *,
+    profile: str = "smallest",
+    max_bytes: int | None = None,
+    progressive: bool = False,
+    subsampling: str | None = None,
+    qtables: str | None = None,
+) -> tuple[bytes, int | None]:
+    """Encode `image` and return `(payload, quality)`; quality is None for PNG.
+
+    With `max_bytes`, JPEG/WebP quality is binary-searched downwards from
+    `jpeg_quality` (never below `TARGET_MIN_QUALITY`) for the highest quality
+    whose payload fits, in at most `_TARGET_MAX_ENCODES` encodes. PNG is lossless,
+    so it either fits or fails. Raises `target_size_unreachable` when nothing fits.
+
+    `progressive`, `subsampling` (a `JPEG_SUBSAMPLING` key) and `qtables` (a
+    `JPEG_QTABLES` key) apply to JPEG only and override the profile's settings.
+    """
+
     fmt = output_format.lower()
     if fmt not in {"png", "jpeg", "webp"}:
         raise ProcessingError("Unsupported output format.", code="unsupported_output_format")
+    settings = ENCODE_PROFILES[normalize_encode_profile(profile)]
+    chroma = normalize_jpeg_subsampling(subsampling)
+    tables = JPEG_QTABLES[normalize_jpeg_qtables(qtables) or "standard"]
     if fmt == "jpeg":
-        if image.mode in {"RGBA", "LA"}:
+        # Only the opacity matters here, so read the alpha extrema, not a full mask scan.
+        if image.mode in {"RGBA", "LA"} and _alpha_low(image) < 255:
             background = Image.new("RGB", image.size, (255, 255, 255))
             background.paste(image, mask=image.split()[-1])
             image = background
         else:
             image = image.convert("RGB")
-        image.save(buffer, format="JPEG", quality=jpeg_quality, optimize=True)
     elif fmt == "webp":
-        from collections.abc import Callable
-        from typing import cast
-
         try:
             from PIL import features
         except Exception as exc:
@@ -669,13 +1321,102 @@ def to_bytes(image: Image.Image, output_format: str, jpeg_quality: int = 92) ->
         check = cast(Callable[[str], bool], getattr(features, "check", lambda _key: False))
         if not bool(check("webp")):
             raise ProcessingError("WebP encoder unavailable.", code="webp_unavailable")
-        try:
-            image.save(buffer, format="WEBP", quality=jpeg_quality, method=6)
-        except Exception as exc:  # pragma: no cover - encoder availability varies by build
-            raise ProcessingError("WebP encoder unavailable.", code="webp_unavailable") from exc
-    else:
-        image.save(buffer, format="PNG", optimize=True)
-    return buffer.getvalue()
+
+    # One buffer is rewound and reused across the quality search.
+    buffer = io.BytesIO()
+
+    def encode(quality: int) -> bytes:
+        buffer.seek(0)
+        buffer.truncate()
+        if fmt == "jpeg":
+            options: dict[str, object] = {
+                "quality": quality,
+                "optimize": settings.jpeg_optimize,
+                "progressive": progressive or settings.jpeg_progressive,
+            }
+            if chroma is not None:
+                options["subsampling"] = JPEG_SUBSAMPLING[chroma]
+            elif settings.jpeg_subsampling is not None:
+                options["subsampling"] = settings.jpeg_subsampling
+            if tables is not None:
+                options["qtables"] = tables
+            image.save(buffer, format="JPEG", **options)
+        elif fmt == "webp":
+            try:
+                image.save(buffer, format="WEBP", quality=quality, method=settings.webp_method)
+            except Exception as exc:  # pragma: no cover - encoder availability varies by build
+                raise ProcessingError("WebP encoder unavailable.", code="webp_unavailable") from exc
+        else:
+            image.save(
+                buffer,
+                format="PNG",
+                compress_level=settings.png_compress_level,
+                optimize=settings.png_optimize,
+            )
+        return buffer.getvalue()
+
+    payload = encode(jpeg_quality)
+    if not max_bytes or len(payload) <= max_bytes:
+        return payload, None if fmt == "png" else jpeg_quality
+    if fmt != "png":
+        best: tuple[bytes, int] | None = None
+        low, high = TARGET_MIN_QUALITY, jpeg_quality - 1
+        for _ in range(_TARGET_MAX_ENCODES - 1):
+            if low > high:
+                break
+            quality = (low + high) // 2
+            candidate = encode(quality)
+            if len(candidate) <= max_bytes:
+                best = (candidate, quality)
+                low = quality + 1
+            else:
+                high = quality - 1
+        if best is not None:
+            return best
+    raise ProcessingError(
+        f"Output cannot be encoded within {max_bytes} bytes.", code="target_size_unreachable"
+    )
+
+
+def to_bytes(
+    image: Image.Image,
+    output_format: str,
+    jpeg_quality: int = 92,
+    *,
+    profile: str = "smallest",
+    max_bytes: int | None = None,
+    progressive: bool = False,
+    subsampling: str | None = None,
+    qtables: str | None = None,
+) -> bytes:
+    payload, _quality = encode_image(
+        image,
+        output_format,
+        jpeg_quality,
+        profile=profile,
+        max_bytes=max_bytes,
+        progressive=progressive,
+        subsampling=subsampling,
+        qtables=qtables,
+    )
+    return payload
+
+
+def encode_result(
+    image: Image.Image, req: ProcessRequest, output_format: str | None = None
+) -> tuple[bytes, int | None]:
+    """Encode a pipeline result with every output option carried by `req`."""
+
+    return encode_image(
+        image,
+        output_format or req.output_format,
+        req.jpeg_quality,
+        profile=req.encode_profile,
+        max_bytes=req.max_bytes,
+        progressive=req.jpeg_progressive,
+        subsampling=req.jpeg_subsampling,
+        qtables=req.jpeg_qtables,
+    )
 
 
 def available_presets() -> list[dict[str, str | float | int | None]]:
@@ -0,0 +1,221 @@
+"""Opt-in profiling of pipeline stages and individual requests.
+
+`MemoryProfiler` is attached to a `PipelineContext` and sampled at each stage
+checkpoint. It records two views per stage, because neither is complete alone:
+
+- `py_bytes`: peak Python-heap growth seen by `tracemalloc` (bytes objects,
+  encode buffers, numpy arrays). Pillow allocates pixel buffers with plain
+  `malloc`, so image copies are invisible here.
+- `rss_bytes`: peak growth of the process resident set size, polled from a side
+  thread. This does see image buffers, but it is process-wide: with concurrent
+  requests other work is counted too.
+
+`tracemalloc` peaks are process-wide too, and marking a stage resets them, so
+only one `MemoryProfiler` measures at a time; one entered while another is
+active stays inactive and records nothing. Profiling slows every Python
+allocation while `tracemalloc` is on; it is meant for the benchmark suite and
+for debugging one request at a time.
+
+`CallProfiler` runs the calling thread under `cProfile` and saves a pstats file,
+for reproducing one slow request after the fact.
+"""
+
+from __future__ import annotations
+
+import cProfile
+import os
+import threading
+import tracemalloc
+from pathlib import Path
+from types import TracebackType
+
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+# Held by the one MemoryProfiler that is measuring (peaks are process-wide).
+_memory_profile_lock = threading.Lock()
+
+
+def current_rss() -> int | None:
+    """Resident set size of this process in bytes, or None where /proc is unavailable."""
+
+    try:
+        with open("/proc/self/statm", encoding="ascii") as handle:
+            pages = int(handle.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE")
+
+
+def _start_tracing() -> None:
+    global _tracing_users
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _tracing_users += 1
+
+
+def _stop_tracing() -> None:
+    global _tracing_users
+    with _tracing_lock:
+        _tracing_users = max(0, _tracing_users - 1)
+        if _tracing_users == 0 and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+class MemoryProfiler:
+    """Peak Python-heap and RSS growth per stage; use as a context manager.
+
+    When another profiler is already measuring, this one stays inactive (`active`
+    is False) and records nothing.
+    """
+
+    def __init__(self, *, interval_s: float = 0.001) -> None:
+        self.interval_s = interval_s
+        self.active = False
+        self.peak_rss = 0
+        self._stages: dict[str, dict[str, int]] = {}
+        self._stage: str | None = None
+        self._py_base = 0
+        self._rss_base = 0
+        self._rss_peak = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def __enter__(self) -> MemoryProfiler:
+        if not _memory_profile_lock.acquire(blocking=False):
+            return self
+        self.active = True
+        _start_tracing()
+        self._thread = threading.Thread(target=self._poll, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        if not self.active:
+            return
+        try:
+            self._close_stage()
+            self._stop.set()
+            if self._thread is not None:
+                self._thread.join()
+            _stop_tracing()
+        finally:
+            _memory_profile_lock.release()
+
+    def _sample_rss(self) -> None:
+        rss = current_rss()
+        if rss is None:
+            return
+        with self._lock:
+            self._rss_peak = max(self._rss_peak, rss)
+            self.peak_rss = max(self.peak_rss, rss)
+
+    def _poll(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            self._sample_rss()
+
+    def _close_stage(self) -> None:
+        if self._stage is None:
+            return
+        self._sample_rss()
+        py_bytes = 0
+        if tracemalloc.is_tracing():
+            _current, peak = tracemalloc.get_traced_memory()
+            py_bytes = max(0, peak - self._py_base)
+        with self._lock:
+            rss_bytes = max(0, self._rss_peak - self._rss_base)
+        previous = self._stages.get(self._stage, {"py_bytes": 0, "rss_bytes": 0})
+        self._stages[self._stage] = {
+            "py_bytes": max(previous["py_bytes"], py_bytes),
+            "rss_bytes": max(previous["rss_bytes"], rss_bytes),
+        }
+        self._stage = None
+
+    def mark(self, stage: str) -> None:
+        """Close the running stage and start measuring `stage`."""
+
+        if not self.active:
+            return
+        self._close_stage()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            self._py_base = tracemalloc.get_traced_memory()[0]
+        rss = current_rss() or 0
+        with self._lock:
+            self._rss_base = rss
+            self._rss_peak = rss
+            self.peak_rss = max(self.peak_rss, rss)
+        self._stage = stage
+
+    def stages(self) -> dict[str, dict[str, int]]:
+        """Per-stage peaks so far, including the stage still running."""
+
+        self._close_stage_snapshot()
+        return {stage: dict(values) for stage, values in self._stages.items()}
+
+    def _close_stage_snapshot(self) -> None:
+        stage = self._stage
+        if stage is None:
+            return
+        py_base, rss_base = self._py_base, self._rss_base
+        self._close_stage()
+        # Keep measuring the running stage from its original baseline.
+        self._stage, self._py_base, self._rss_base = stage, py_base, rss_base
+
+    def header_value(self) -> str:
+        """Compact `stage=py/rss` list (bytes) plus the overall RSS peak, for a debug header."""
+
+        parts = [
+            f"{stage}={values['py_bytes']}/{values['rss_bytes']}"
+            for stage, values in self.stages().items()
+        ]
+        parts.append(f"peak_rss={self.peak_rss}")
+        return ", ".join(parts)
+
+
+# Only one cProfile session may run per process (Python 3.12+ enforces it).
+_call_profile_lock = threading.Lock()
+
+
+class CallProfiler:
+    """`cProfile` the calling thread; the stats are written to `path` on exit, even on error.
+
+    When another request is already being profiled this one runs unprofiled and `saved`
+    stays False.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.saved = False
+        self._profile: cProfile.Profile | None = None
+
+    def __enter__(self) -> CallProfiler:
+        if _call_profile_lock.acquire(blocking=False):
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        if self._profile is None:
+            return
+        try:
+            self._profile.disable()
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            partial = self.path.with_name(self.path.name + ".tmp")
+            self._profile.dump_stats(partial)
+            os.replace(partial, self.path)
+            self.saved = True
+        finally:
+            self._profile = None
+            _call_profile_lock.release()
@@ -0,0 +1,147 @@
+"""Per-client rate limiting weighted by estimated render work.
+
+Each client (the `X-API-Key` header, else the connecting IP) has a token bucket
+of work units. A unit is one megapixel of input, and background removal makes
+an image cost `REMOVE_BG_COST` times more. A request pays for all of its images
+up front, before any of them is rendered. When the bucket can't cover the cost,
+the API answers 429 with `Retry-After` set to when it will. A cost above the
+burst is clamped to it, so an oversized (but MAX_PIXELS-valid) request still
+runs once the client's bucket is full.
+
+Buckets live in this process only: with several workers each one limits on its
+own, so a client gets up to `workers x rate`. Keys are stored hashed, and the
+least recently seen clients are forgotten beyond `max_clients` (a forgotten
+client starts again with a full bucket).
+
+Admitted work is then queued per client (`LaneScheduler` serves clients in a
+lane round-robin), so one client's batch can't monopolise the slots either.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import IO
+
+from PIL import Image
+
+from ai_headshot_studio.config import get_settings
+
+# Background removal dominates a render: matting inference plus the extra copies.
+REMOVE_BG_COST = 4.0
+# Floor per image so floods of tiny (or unreadable) uploads still cost something.
+MIN_IMAGE_WORK = 0.1
+
+
+def estimate_work(width: int, height: int, *, remove_bg: bool = False) -> float:
+    """Work units for one image: megapixels, times `REMOVE_BG_COST` with background removal."""
+
+    megapixels = max(0, width) * max(0, height) / 1_000_000
+    return max(MIN_IMAGE_WORK, megapixels) * (REMOVE_BG_COST if remove_bg else 1.0)
+
+
+def image_work(fp: IO[bytes], *, remove_bg: bool = False) -> float:
+    """Estimate from the image header only; the file position is restored."""
+
+    position = fp.tell()
+    try:
+        with Image.open(fp) as image:
+            width, height = image.size
+    except Exception:
+        # Rejected later by the pipeline; charge the floor.
+        width = height = 0
+    finally:
+        fp.seek(position)
+    return estimate_work(width, height, remove_bg=remove_bg)
+
+
+def client_key(api_key: str | None, host: str | None) -> str:
+    """Bucket key: a hash of the API key when one is sent, else the client IP."""
+
+    if api_key:
+        digest = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+        return f"key:{digest}"
+    return f"ip:{host or 'unknown'}"
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float) -> None:
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter:
+    """Token buckets of `burst` work units refilled at `rate` units per second.
+
+    `rate=0` disables limiting.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        *,
+        max_clients: int = 10_000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.rate = max(0.0, rate)
+        self.burst = max(MIN_IMAGE_WORK, burst)
+        self.max_clients = max(1, max_clients)
+        self._clock = clock
+        self._buckets: OrderedDict[str, _Bucket] = OrderedDict()
+        self._admitted = 0
+        self._limited = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def acquire(self, client: str, cost: float) -> float:
+        """Charge `cost` to `client`; returns 0 if admitted, else seconds until it would be."""
+
+        if not self.enabled:
+            return 0.0
+        cost = min(max(0.0, cost), self.burst)
+        now = self._clock()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = _Bucket(self.burst, now)
+                self._buckets[client] = bucket
+                while len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+                elapsed = max(0.0, now - bucket.updated)
+                bucket.tokens = min(self.burst, bucket.tokens + elapsed * self.rate)
+                bucket.updated = now
+            if bucket.tokens >= cost:
+                bucket.tokens -= cost
+                self._admitted += 1
+                return 0.0
+            self._limited += 1
+            return (cost - bucket.tokens) / self.rate
+
+    def stats(self) -> dict[str, object]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "rate": self.rate,
+                "burst": self.burst,
+                "clients": len(self._buckets),
+                "admitted": self._admitted,
+                "limited": self._limited,
+            }
+
+
+RATE_LIMITER = RateLimiter(
+    get_settings().rate_limit_rate,
+    get_settings().rate_limit_burst,
+    max_clients=get_settings().rate_limit_clients,
+)
@@ -0,0 +1,264 @@
+"""Priority lanes for CPU-bound work.
+
+Rendering runs on worker threads, and without a scheduler a large `/api/batch`
+competes equally with an editor's `/api/process` calls. `LaneScheduler` caps how
+many renders run at once (`slots`) and, when work is queued, hands each freed
+slot to a lane by weighted fair sharing (stride scheduling): with the default
+weights `interactive=8,batch=2,background=1`, a saturated server runs eight
+interactive renders for every two batch items and one warm-up step. No lane
+starves, and an idle lane banks no credit while it is empty.
+
+- `interactive`: `/api/process`.
+- `batch`: `/api/batch` items and `/api/renditions`.
+- `background`: startup warm-up.
+
+Batches take a slot per chunk of images, so interactive work interleaves
+between chunks rather than waiting for a whole batch. Within a lane, waiters
+are grouped by client and served round-robin, so one client queueing a large
+batch doesn't push everyone else's requests behind all of its chunks. Async callers wait in the
+event loop (`async with run(lane)`), so queued requests don't hold worker
+threads; sync callers use `slot(lane)`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from collections.abc import AsyncIterator, Callable, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from typing import TypeVar
+
+from ai_headshot_studio.config import get_settings
+from ai_headshot_studio.metrics import METRICS
+
+T = TypeVar("T")
+
+LANES = ("interactive", "batch", "background")
+DEFAULT_LANE_WEIGHTS = {"interactive": 8, "batch": 2, "background": 1}
+# Recent samples kept per lane for the latency percentiles in `stats()`.
+_LATENCY_WINDOW = 512
+
+
+def parse_lane_weights(value: str) -> dict[str, int]:
+    """Parse `interactive=8,batch=2,background=1`; unknown lanes and bad entries are ignored."""
+
+    weights = dict(DEFAULT_LANE_WEIGHTS)
+    for item in value.split(","):
+        lane, _, raw = item.partition("=")
+        lane = lane.strip().lower()
+        if lane not in weights:
+            continue
+        try:
+            weights[lane] = max(1, int(raw))
+        except ValueError:
+            continue
+    return weights
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100.0 * len(ordered)) - 1))
+    return round(ordered[index], 1)
+
+
+class _Waiter:
+    __slots__ = ("wake", "client", "granted", "enqueued")
+
+    def __init__(self, wake: Callable[[], None], client: str = "") -> None:
+        self.wake = wake
+        self.client = client
+        self.granted = False
+        self.enqueued = time.perf_counter()
+
+
+class _FairQueue:
+    """FIFO per client; `popleft` takes one waiter from each client in turn."""
+
+    def __init__(self) -> None:
+        self._clients: OrderedDict[str, deque[_Waiter]] = OrderedDict()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, waiter: _Waiter) -> None:
+        self._clients.setdefault(waiter.client, deque()).append(waiter)
+        self._size += 1
+
+    def popleft(self) -> _Waiter:
+        client, queue = next(iter(self._clients.items()))
+        waiter = queue.popleft()
+        if queue:
+            self._clients.move_to_end(client)
+        else:
+            del self._clients[client]
+        self._size -= 1
+        return waiter
+
+    def remove(self, waiter: _Waiter) -> None:
+        queue = self._clients[waiter.client]
+        queue.remove(waiter)
+        if not queue:
+            del self._clients[waiter.client]
+        self._size -= 1
+
+
+class _Lane:
+    def __init__(self, weight: int) -> None:
+        self.weight = weight
+        self.stride = 1.0 / weight
+        self.pass_value = 0.0
+        self.queue = _FairQueue()
+        self.running = 0
+        self.completed = 0
+        self.wait_ms: deque[float] = deque(maxlen=_LATENCY_WINDOW)
+        self.run_ms: deque[float] = deque(maxlen=_LATENCY_WINDOW)
+
+
+class LaneScheduler:
+    """Counting semaphore of `slots` whose waiters are served per lane by weight."""
+
+    def __init__(self, slots: int, weights: dict[str, int] | None = None) -> None:
+        self.slots = max(1, slots)
+        weights = weights or DEFAULT_LANE_WEIGHTS
+        self._lanes = {lane: _Lane(max(1, weights.get(lane, 1))) for lane in LANES}
+        self._busy = 0
+        # Pass value of the last dispatch; lanes that were idle restart from here.
+        self._clock = 0.0
+        self._lock = threading.Lock()
+
+    def _lane(self, lane: str) -> _Lane:
+        try:
+            return self._lanes[lane]
+        except KeyError:
+            raise ValueError(f"unknown lane {lane!r}") from None
+
+    def _grant(self, lane: _Lane, waiter: _Waiter) -> None:
+        waiter.granted = True
+        self._busy += 1
+        lane.running += 1
+        lane.wait_ms.append((time.perf_counter() - waiter.enqueued) * 1000.0)
+        self._clock = lane.pass_value
+        lane.pass_value += lane.stride
+
+    def _enqueue(self, name: str, waiter: _Waiter) -> bool:
+        """Grant immediately (returns True) or queue `waiter`. Caller holds the lock."""
+
+        lane = self._lane(name)
+        idle = all(not queued.queue for queued in self._lanes.values())
+        if idle and self._busy < self.slots:
+            self._grant(lane, waiter)
+            return True
+        if not lane.queue:
+            lane.pass_value = max(lane.pass_value, self._clock)
+        lane.queue.append(waiter)
+        return False
+
+    def _dispatch(self) -> list[_Waiter]:
+        woken: list[_Waiter] = []
+        while self._busy < self.slots:
+            ready = [lane for lane in self._lanes.values() if lane.queue]
+            if not ready:
+                break
+            lane = min(ready, key=lambda item: item.pass_value)
+            waiter = lane.queue.popleft()
+            self._grant(lane, waiter)
+            woken.append(waiter)
+        return woken
+
+    def release(self, name: str, run_ms: float) -> None:
+        with self._lock:
+            lane = self._lane(name)
+            self._busy = max(0, self._busy - 1)
+            lane.running = max(0, lane.running - 1)
+            lane.completed += 1
+            lane.run_ms.append(run_ms)
+            woken = self._dispatch()
+        METRICS.inc("lane_tasks_total", labels={"lane": name})
+        for waiter in woken:
+            waiter.wake()
+
+    def _cancel(self, name: str, waiter: _Waiter) -> bool:
+        """Drop a queued waiter; returns True if it had already been granted a slot."""
+
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._lane(name).queue.remove(waiter)
+            return False
+
+    @asynccontextmanager
+    async def run(self, lane: str, client: str = "") -> AsyncIterator[None]:
+        """Wait in the event loop for a slot in `lane`, then hold it for the block."""
+
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+
+        def resolve() -> None:
+            if not ready.done():
+                ready.set_result(None)
+
+        def wake() -> None:
+            loop.call_soon_threadsafe(resolve)
+
+        waiter = _Waiter(wake, client)
+        with self._lock:
+            granted = self._enqueue(lane, waiter)
+        if not granted:
+            try:
+                await ready
+            except asyncio.CancelledError:
+                if self._cancel(lane, waiter):
+                    self.release(lane, 0.0)
+                raise
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(lane, (time.perf_counter() - start) * 1000.0)
+
+    @contextmanager
+    def slot(self, lane: str, client: str = "") -> Iterator[None]:
+        """Blocking variant of `run` for worker threads."""
+
+        event = threading.Event()
+        waiter = _Waiter(event.set, client)
+        with self._lock:
+            granted = self._enqueue(lane, waiter)
+        if not granted:
+            event.wait()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(lane, (time.perf_counter() - start) * 1000.0)
+
+    def call(self, lane: str, fn: Callable[[], T]) -> T:
+        with self.slot(lane):
+            return fn()
+
+    def stats(self) -> dict[str, object]:
+        with self._lock:
+            lanes: dict[str, object] = {}
+            for name, lane in self._lanes.items():
+                waits, runs = list(lane.wait_ms), list(lane.run_ms)
+                lanes[name] = {
+                    "weight": lane.weight,
+                    "queued": len(lane.queue),
+                    "running": lane.running,
+                    "completed": lane.completed,
+                    "wait_ms": {"p50": _percentile(waits, 50), "p95": _percentile(waits, 95)},
+                    "run_ms": {"p50": _percentile(runs, 50), "p95": _percentile(runs, 95)},
+                }
+            return {"slots": self.slots, "busy": self._busy, "lanes": lanes}
+
+
+SCHEDULER = LaneScheduler(
+    get_settings().worker_slots or os.cpu_count() or 1,
+    parse_lane_weights(get_settings().lane_weights),
+)
@@ -0,0 +1,222 @@
+"""Preload-and-fork serving: load models once, share them across worker processes.
+
+`uvicorn --workers N` starts each worker as a fresh interpreter, so every worker
+imports rembg/onnxruntime and OpenCV and builds its own matting session: N copies
+of the same read-only memory. Here the parent does that work once, binds the
+listening socket, then `fork()`s the workers. The children share the parent's
+pages copy-on-write until they write to them; `gc.freeze()` before forking keeps
+the collector from touching (and so copying) every preloaded object.
+
+What the parent preloads has to survive `fork()`:
+
+- Pillow plugins, numpy, OpenCV and rembg/onnxruntime are imported, and the
+  health diagnostics are cached. Nothing that starts threads runs in the parent:
+  OpenCV's pool starts on first detection, so the face detector warms up in each
+  worker.
+- The rembg session is only built in the parent when ONNX Runtime runs inline
+  (`AI_HEADSHOT_MATTING_THREADS=1`), because its thread pool does not survive
+  `fork()`. With one ONNX thread per worker the processes supply the parallelism,
+  so that is also the setting that avoids oversubscribing cores. Otherwise each
+  worker builds its own session during its warm-up.
+
+Run with `python -m ai_headshot_studio.serve --workers 4`. POSIX only.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import importlib
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+from collections.abc import Callable
+from importlib import util
+from types import FrameType
+from typing import cast
+
+from PIL import Image
+
+from ai_headshot_studio.config import get_settings
+from ai_headshot_studio.errors import ProcessingError
+from ai_headshot_studio.matting import get_backend
+from ai_headshot_studio.warmup import Warmup, WarmupStep
+
+logger = logging.getLogger(__name__)
+
+# A worker that dies sooner than this after starting is treated as a crash loop.
+MIN_WORKER_UPTIME_S = 1.0
+
+
+def _import_available(*modules: str) -> Callable[[], None]:
+    def load() -> None:
+        for module in modules:
+            if util.find_spec(module) is not None:
+                importlib.import_module(module)
+
+    return load
+
+
+def preload_steps() -> list[WarmupStep]:
+    """Fork-safe warm-up for the parent: imports, caches and, when safe, the rembg session."""
+
+    from ai_headshot_studio.app import warm_diagnostics
+
+    settings = get_settings()
+    steps: list[WarmupStep] = [
+        ("imaging", Image.init),
+        ("modules", _import_available("numpy", "cv2")),
+    ]
+    for name in dict.fromkeys(filter(None, (settings.matting_backend, settings.matting_fallback))):
+        try:
+            backend = get_backend(name)
+        except ProcessingError:
+            continue
+        if backend.name != "rembg" or not backend.is_available():
+            continue
+        if settings.matting_threads == 1:
+            steps.append(("matting:rembg", backend.warm_up))
+        else:
+            steps.append(("modules:rembg", _import_available("onnxruntime", "rembg")))
+    steps.append(("diagnostics", warm_diagnostics))
+    return steps
+
+
+def bind_socket(host: str, port: int, *, backlog: int = 2048) -> socket.socket:
+    """Listening TCP socket shared by every worker (the kernel spreads accepts)."""
+
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Prefork:
+    """Fork `workers` children running `target` and keep them running until signalled.
+
+    A worker that exits non-zero is replaced, unless it died within
+    `min_uptime_s` of starting, which stops the whole group instead of
+    fork-looping. A worker that exits cleanly is not replaced.
+    """
+
+    def __init__(
+        self,
+        target: Callable[[], None],
+        *,
+        workers: int,
+        min_uptime_s: float = MIN_WORKER_UPTIME_S,
+    ) -> None:
+        self.target = target
+        self.workers = max(1, workers)
+        self.min_uptime_s = min_uptime_s
+        self._children: dict[int, float] = {}
+        self._stopping = False
+
+    def _spawn(self) -> int:
+        pid = os.fork()
+        if pid == 0:
+            # Child: default signal handling (the server installs its own) and never
+            # return into the parent's stack.
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                self.target()
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        self._children[pid] = time.monotonic()
+        return pid
+
+    def stop(self, signum: int = signal.SIGTERM, _frame: FrameType | None = None) -> None:
+        self._stopping = True
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> int:
+        """Supervise the workers; returns the exit code for the parent."""
+
+        previous = {sig: signal.signal(sig, self.stop) for sig in (signal.SIGTERM, signal.SIGINT)}
+        exit_code = 0
+        try:
+            for _ in range(self.workers):
+                self._spawn()
+            while self._children:
+                try:
+                    pid, status = os.wait()
+                except ChildProcessError:
+                    break
+                started = self._children.pop(pid, None)
+                if started is None:
+                    continue
+                code = os.waitstatus_to_exitcode(status)
+                if self._stopping or code == 0:
+                    continue
+                if time.monotonic() - started < self.min_uptime_s:
+                    logger.error("worker %d exited with %d during startup; stopping", pid, code)
+                    exit_code = 1
+                    self.stop()
+                    continue
+                logger.warning("worker %d exited with %d; restarting", pid, code)
+                self._spawn()
+        finally:
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+        return exit_code
+
+
+def serve(*, host: str, port: int, workers: int, log_level: str = "info") -> int:
+    import uvicorn
+
+    from ai_headshot_studio.app import app
+
+    warmup = Warmup()
+    warmup.run(preload_steps())
+    steps = cast(dict[str, dict[str, object]], warmup.snapshot()["steps"])
+    for name, step in steps.items():
+        logger.info("preload %s: %s ms%s", name, step["ms"], "" if step["ok"] else " (failed)")
+
+    sock = bind_socket(host, port)
+    # Keep preloaded objects out of the collector so it doesn't dirty shared pages.
+    gc.collect()
+    gc.freeze()
+
+    def run_worker() -> None:
+        config = uvicorn.Config(app, host=host, port=port, log_level=log_level)
+        uvicorn.Server(config).run(sockets=[sock])
+
+    logger.info("serving on %s:%d with %d forked workers", host, port, workers)
+    try:
+        return Prefork(run_worker, workers=workers).run()
+    finally:
+        sock.close()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Preload models, then fork uvicorn workers.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+    # The parent logs before any uvicorn worker configures logging.
+    logging.basicConfig(level=args.log_level.upper(), format="%(levelname)s:     %(message)s")
+    return serve(host=args.host, port=args.port, workers=args.workers, log_level=args.log_level)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
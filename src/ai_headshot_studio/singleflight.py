@@ -0,0 +1,72 @@
+"""Single-flight coalescing of identical concurrent requests.
+
+When several callers ask for the same work at the same time (same upload bytes,
+same normalized settings), only the first one runs it; the others await its
+result. Nothing is kept once the call completes, so this complements rather than
+replaces result caching.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Awaitable, Callable
+from typing import Generic, TypeVar
+
+from ai_headshot_studio.errors import RequestCancelled
+from ai_headshot_studio.metrics import METRICS
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+    """Per-event-loop registry of in-flight calls keyed by a caller-chosen string."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._inflight: dict[str, asyncio.Future[T]] = {}
+
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    async def run(self, key: str, fn: Callable[[], Awaitable[T]]) -> tuple[T, bool]:
+        """Return `(result, coalesced)`; `coalesced` is True when another call did the work.
+
+        A follower re-runs the work itself if the leader was cancelled because its own
+        client went away, so one disconnect never fails the other requests.
+        """
+
+        while True:
+            existing = self._inflight.get(key)
+            if existing is None:
+                return await self._lead(key, fn), False
+            try:
+                result = await asyncio.shield(existing)
+            except RequestCancelled as exc:
+                if exc.code != "request_cancelled":
+                    raise
+                continue
+            except asyncio.CancelledError:
+                if not existing.cancelled():
+                    raise
+                continue
+            METRICS.inc("requests_coalesced_total", labels={"endpoint": self.name})
+            return result, True
+
+    async def _lead(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        future: asyncio.Future[T] = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            # Mark the exception as retrieved when nobody was waiting on it.
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
@@ -0,0 +1,215 @@
+"""Pass uploads and encoded results to pool worker processes through shared memory.
+
+A `ProcessPoolExecutor` pickles every argument and return value and pushes it
+through a pipe. For a 12 MB upload and a multi-megabyte result that is a
+serialize, a pipe transfer in 64 KiB chunks and a deserialize, each way. Here
+the bytes go into a `multiprocessing.shared_memory` segment instead and only its
+name and size (`ShmRef`) cross the pipe.
+
+Ownership is explicit:
+
+- The upload segment is created and unlinked by the API process; the worker
+  only attaches to it.
+- The result segment is created by the worker and handed over. The API process
+  copies it out and unlinks it (`take_bytes`). If the caller gives up on a
+  render, the result is unlinked when it arrives.
+- Every segment name starts with the renderer's prefix, so `sweep` removes
+  whatever a killed worker left behind when the renderer closes.
+
+Workers share the API process's resource tracker (it is started before the pool),
+so every segment stays registered there until it is unlinked. If the API process
+dies, the tracker unlinks whatever is left.
+"""
+
+from __future__ import annotations
+
+import os
+import uuid
+from collections.abc import Callable
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+from types import TracebackType
+from typing import Any, cast
+
+from ai_headshot_studio.processing import (
+    ProcessRequest,
+    ProcessWarning,
+    encode_result,
+    process_image_with_warnings,
+)
+
+TRANSPORTS = ("shm", "pickle")
+# Where POSIX shared memory segments appear on Linux.
+_SHM_DIR = Path("/dev/shm")
+
+
+@dataclass(frozen=True)
+class ShmRef:
+    """Picklable handle to bytes in a shared memory segment."""
+
+    name: str
+    size: int
+
+
+@dataclass(frozen=True)
+class RenderedImage:
+    payload: bytes
+    size: tuple[int, int]
+    quality: int | None
+    warnings: list[ProcessWarning]
+
+
+def _buffer(shm: shared_memory.SharedMemory) -> memoryview:
+    return cast(memoryview, shm.buf)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    return shared_memory.SharedMemory(name=name)
+
+
+def put_bytes(data: bytes, *, prefix: str) -> tuple[shared_memory.SharedMemory, ShmRef]:
+    """Copy `data` into a new segment owned by the caller (close and unlink it when done)."""
+
+    name = f"{prefix}-{uuid.uuid4().hex[:16]}"
+    shm = shared_memory.SharedMemory(name=name, create=True, size=max(1, len(data)))
+    _buffer(shm)[: len(data)] = data
+    return shm, ShmRef(name=name, size=len(data))
+
+
+def read_bytes(ref: ShmRef) -> bytes:
+    """Copy the referenced bytes out, leaving the segment in place."""
+
+    shm = _attach(ref.name)
+    try:
+        return bytes(_buffer(shm)[: ref.size])
+    finally:
+        shm.close()
+
+
+def take_bytes(ref: ShmRef) -> bytes:
+    """Copy the referenced bytes out and unlink the segment (ownership moves to the caller)."""
+
+    shm = _attach(ref.name)
+    try:
+        return bytes(_buffer(shm)[: ref.size])
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def unlink(ref: ShmRef) -> None:
+    try:
+        shm = _attach(ref.name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+def sweep(prefix: str) -> int:
+    """Unlink every segment named `prefix-*`; returns how many were left over (Linux only)."""
+
+    names = [path.name for path in _SHM_DIR.glob(f"{prefix}-*")]
+    for name in names:
+        unlink(ShmRef(name=name, size=0))
+    return len(names)
+
+
+def process_pool(workers: int, **kwargs: Any) -> ProcessPoolExecutor:
+    """A `ProcessPoolExecutor` whose workers share this process's resource tracker."""
+
+    # Started before the workers exist, so forked workers inherit it instead of each
+    # starting their own (which would never see the API process unlink a segment).
+    resource_tracker.ensure_running()
+    return ProcessPoolExecutor(max_workers=max(1, workers), **kwargs)
+
+
+def _render(
+    data: bytes, req: ProcessRequest
+) -> tuple[bytes, tuple[int, int], int | None, list[ProcessWarning]]:
+    result, warnings = process_image_with_warnings(data, req)
+    payload, quality = encode_result(result, req)
+    return payload, result.size, quality, warnings
+
+
+def render_shm(
+    ref: ShmRef, req: ProcessRequest, prefix: str
+) -> tuple[ShmRef, tuple[int, int], int | None, list[ProcessWarning]]:
+    """Worker side: read the upload from `ref`, render, return the payload as a new segment."""
+
+    payload, size, quality, warnings = _render(read_bytes(ref), req)
+    shm, out = put_bytes(payload, prefix=prefix)
+    shm.close()  # The API process unlinks it.
+    return out, size, quality, warnings
+
+
+def render_pickle(
+    data: bytes, req: ProcessRequest
+) -> tuple[bytes, tuple[int, int], int | None, list[ProcessWarning]]:
+    """Worker side of the pickling transport, for comparison."""
+
+    return _render(data, req)
+
+
+def _discard_result(
+    future: Future[tuple[ShmRef, tuple[int, int], int | None, list[ProcessWarning]]],
+) -> None:
+    if not future.cancelled() and future.exception() is None:
+        unlink(future.result()[0])
+
+
+class ProcessPoolRenderer:
+    """Run `/api/process`-style renders in worker processes.
+
+    `transport="shm"` moves uploads and payloads through shared memory;
+    `"pickle"` sends them as plain arguments and return values.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        *,
+        transport: str = "shm",
+        initializer: Callable[[], object] | None = None,
+    ) -> None:
+        if transport not in TRANSPORTS:
+            raise ValueError(f"transport must be one of {TRANSPORTS}")
+        self.transport = transport
+        self.prefix = f"ahs-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._pool = process_pool(workers, initializer=initializer)
+
+    def render(self, data: bytes, req: ProcessRequest) -> RenderedImage:
+        if self.transport == "pickle":
+            payload, size, quality, warnings = self._pool.submit(render_pickle, data, req).result()
+            return RenderedImage(payload, size, quality, warnings)
+
+        shm, ref = put_bytes(data, prefix=self.prefix)
+        try:
+            future = self._pool.submit(render_shm, ref, req, self.prefix)
+            try:
+                out, size, quality, warnings = future.result()
+            except BaseException:
+                # The caller stops waiting; whatever the worker still produces is dropped.
+                future.add_done_callback(_discard_result)
+                raise
+        finally:
+            shm.close()
+            shm.unlink()
+        return RenderedImage(take_bytes(out), size, quality, warnings)
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        sweep(self.prefix)
+
+    def __enter__(self) -> ProcessPoolRenderer:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self.close()
@@ -0,0 +1,134 @@
+"""Startup warm-up and readiness.
+
+Importing the app stays cheap: heavy optional modules (rembg and onnxruntime,
+OpenCV, numpy) are imported on first use. Without a warm-up the first request
+that needs them pays for it, several seconds for a rembg session. `Warmup` runs
+those first uses at startup, one named step at a time, records how long each
+took, and reports ready once it is done. `/api/ready` reflects that state, while
+`/api/health` stays a liveness check that answers as soon as the app is up.
+
+A failing step (say, a missing optional dependency) is recorded and skipped; it
+does not hold readiness back, because requests would fail the same way later.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Callable, Sequence
+
+from PIL import Image
+
+from ai_headshot_studio.config import get_settings
+from ai_headshot_studio.errors import ProcessingError
+from ai_headshot_studio.faces import detect_face, validate_detector
+from ai_headshot_studio.matting import get_backend
+
+WARMUP_MODES = ("background", "blocking", "off")
+
+WarmupStep = tuple[str, Callable[[], object]]
+
+
+class Warmup:
+    """Runs warm-up steps once and tracks readiness: pending, running, then ready."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._state = "pending"
+        self._steps: dict[str, dict[str, object]] = {}
+        self._elapsed_ms = 0.0
+        self._thread: threading.Thread | None = None
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return self._state == "ready"
+
+    def run(self, steps: Sequence[WarmupStep]) -> None:
+        """Run `steps` in order on the calling thread, then mark ready."""
+
+        with self._lock:
+            self._state = "running"
+            self._steps = {}
+        start = time.perf_counter()
+        for name, step in steps:
+            step_start = time.perf_counter()
+            outcome: dict[str, object] = {"ok": True}
+            try:
+                step()
+            except KeyboardInterrupt:
+                raise
+            except BaseException as exc:
+                # SystemExit too: a dependency that exits on import is a failed step.
+                # Its `code` is the exit status, so only string codes are reported.
+                code = getattr(exc, "code", None)
+                error = code if isinstance(code, str) else type(exc).__name__
+                outcome = {"ok": False, "error": error}
+            outcome["ms"] = round((time.perf_counter() - step_start) * 1000.0, 1)
+            with self._lock:
+                self._steps[name] = outcome
+        with self._lock:
+            self._elapsed_ms = (time.perf_counter() - start) * 1000.0
+            self._state = "ready"
+
+    def start(self, steps: Sequence[WarmupStep], mode: str = "background") -> None:
+        """Run `steps` per `mode`: on a daemon thread, right here, or not at all."""
+
+        if mode == "off":
+            self.run([])
+        elif mode == "blocking":
+            self.run(steps)
+        else:
+            self._thread = threading.Thread(
+                target=self.run, args=(steps,), name="warmup", daemon=True
+            )
+            self._thread.start()
+
+    def wait(self, timeout_s: float | None = None) -> bool:
+        """Block until warm-up finishes (or `timeout_s` passes); returns `ready`."""
+
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout_s)
+        return self.ready
+
+    def snapshot(self) -> dict[str, object]:
+        with self._lock:
+            return {
+                "state": self._state,
+                "elapsed_ms": round(self._elapsed_ms, 1),
+                "steps": {name: dict(outcome) for name, outcome in self._steps.items()},
+            }
+
+
+WARMUP = Warmup()
+
+
+def _warm_imaging() -> None:
+    # Registers every Pillow codec plugin up front instead of on the first upload.
+    Image.init()
+
+
+def _warm_face_detector() -> None:
+    # Imports OpenCV and numpy and loads the configured detector model.
+    detect_face(Image.new("RGB", (160, 160), (128, 128, 128)))
+    # A typo'd detector name still frames with Haar; fail the step so it shows up.
+    validate_detector(get_settings().face_detector)
+
+
+def default_steps() -> list[WarmupStep]:
+    """Warm-up steps for the configured matting backend(s) and face detector."""
+
+    settings = get_settings()
+    steps: list[WarmupStep] = [
+        ("imaging", _warm_imaging),
+        ("face_detector", _warm_face_detector),
+    ]
+    for name in dict.fromkeys(filter(None, (settings.matting_backend, settings.matting_fallback))):
+        try:
+            backend = get_backend(name)
+        except ProcessingError:
+            continue
+        if backend.is_available():
+            steps.append((f"matting:{backend.name}", backend.warm_up))
+    return steps
@@ -5,6 +5,7 @@ import json
 import zipfile
 from types import SimpleNamespace
 
+import pytest
 from fastapi.testclient import TestClient
 from PIL import Image
 
@@ -36,6 +37,11 @@ def test_health_includes_diagnostics() -> None:
     assert data["limits"]["max_batch_total_bytes"] == 72 * 1024 * 1024
     assert "background_removal" in data["features"]
     assert data["features"]["background_removal"]["mode"] == "local"
+    backends = data["features"]["background_removal"]["backends"]
+    assert {"rembg", "grabcut", "none"} <= set(backends)
+    assert {"calls", "avg_ms", "last_ms"} <= set(backends["none"])
+    assert data["memory_budget"]["reserved_bytes"] == 0
+    assert data["memory_budget"]["limit_bytes"] > 0
 
 
 def test_presets_returns_presets_and_styles() -> None:
@@ -151,7 +157,7 @@ def test_process_rejects_unsupported_image_format() -> None:
 def test_process_includes_warning_headers_when_present(monkeypatch) -> None:
     payload = make_image()
 
-    def fake_process_with_warnings(_data, _req):
+    def fake_process_with_warnings(_data, _req, **_kwargs):
         image = Image.new("RGB", (600, 600), (120, 140, 160))
         warning = SimpleNamespace(code="skin_tone_shift_warning")
         return image, [warning]
@@ -336,3 +342,408 @@ def test_batch_rejects_total_size_limit() -> None:
     finally:
         app_module.MAX_BATCH_TOTAL_BYTES = old_bytes
         app_module.MAX_BATCH_TOTAL_MB = old_mb
+
+
+def test_renditions_returns_zip_with_each_preset_and_format() -> None:
+    payload = make_image()
+    response = client.post(
+        "/api/renditions",
+        files={"image": ("headshot.png", payload, "image/png")},
+        data={
+            "renditions": "avatar-400:jpeg, avatar-400:png, passport-2x2:jpeg",
+            "background": "white",
+        },
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/zip")
+    assert response.headers["x-renditions-count"] == "3"
+
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        names = archive.namelist()
+        assert "headshot-avatar-400.jpg" in names
+        assert "headshot-avatar-400.png" in names
+        assert "headshot-passport-2x2.jpg" in names
+        sample = Image.open(io.BytesIO(archive.read("headshot-passport-2x2.jpg")))
+        assert sample.size == (600, 600)
+        # avatar-400 is below the recommended output edge, so a report is included.
+        report = json.loads(archive.read("warnings.json").decode("utf-8"))
+        assert report["items_with_warnings"] == 2
+
+
+def test_renditions_rejects_malformed_pairs() -> None:
+    response = client.post(
+        "/api/renditions",
+        files={"image": ("headshot.png", make_image(), "image/png")},
+        data={"renditions": "avatar-400"},
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"]["code"] == "invalid_renditions"
+
+
+def test_batch_groups_uploads_for_background_removal(monkeypatch) -> None:
+    import ai_headshot_studio.app as app_module
+
+    calls: list[int] = []
+
+    def fake_process_images(items, _req, *, batch_size=None):
+        calls.append(len(items))
+        return [(Image.new("RGB", (600, 600), (120, 140, 160)), []) for _ in items]
+
+    monkeypatch.setattr(app_module, "process_images_with_warnings", fake_process_images)
+    response = client.post(
+        "/api/batch",
+        files=[("images", (f"{name}.png", make_image(), "image/png")) for name in "abc"],
+        data={
+            "remove_bg": "true",
+            "background": "white",
+            "preset": "passport-2x2",
+            "format": "jpeg",
+        },
+    )
+    assert response.status_code == 200
+    assert response.headers["x-batch-count"] == "3"
+    assert calls == [3]
+
+
+def test_process_returns_503_when_memory_budget_is_exhausted(monkeypatch) -> None:
+    from ai_headshot_studio import processing
+    from ai_headshot_studio.admission import MemoryBudget
+
+    budget = MemoryBudget(1024 * 1024, timeout_s=0.0)
+    monkeypatch.setattr(processing, "MEMORY_BUDGET", budget)
+    with budget.reserve(1024 * 1024):
+        response = client.post(
+            "/api/process",
+            files={"image": ("test.png", make_image(), "image/png")},
+            data={"preset": "portrait-4x5", "format": "png"},
+        )
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "2"
+    assert response.json()["detail"]["code"] == "server_busy"
+    assert budget.stats()["rejected"] == 1
+
+    response = client.post(
+        "/api/process",
+        files={"image": ("test.png", make_image(), "image/png")},
+        data={"preset": "portrait-4x5", "format": "png"},
+    )
+    assert response.status_code == 200
+    assert budget.stats()["reserved_bytes"] == 0
+
+
+def test_batch_returns_503_when_memory_budget_is_exhausted(monkeypatch) -> None:
+    from ai_headshot_studio import processing
+    from ai_headshot_studio.admission import MemoryBudget
+
+    budget = MemoryBudget(1024 * 1024, timeout_s=0.0)
+    monkeypatch.setattr(processing, "MEMORY_BUDGET", budget)
+    with budget.reserve(1024 * 1024):
+        response = client.post(
+            "/api/batch",
+            files=[("images", ("a.png", make_image(), "image/png"))],
+            data={"preset": "portrait-4x5", "format": "png", "continue_on_error": "true"},
+        )
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "2"
+    assert response.json()["detail"]["code"] == "server_busy"
+
+
+def test_process_stops_when_client_disconnects(monkeypatch) -> None:
+    import time
+
+    from starlette.requests import Request
+
+    import ai_headshot_studio.app as app_module
+    from ai_headshot_studio.metrics import METRICS
+    from ai_headshot_studio.pipeline import current_context
+
+    def slow_process(_data, _req, **_kwargs):
+        ctx = current_context()
+        deadline = time.monotonic() + 5
+        while not ctx.cancelled and time.monotonic() < deadline:
+            time.sleep(0.01)
+        ctx.checkpoint("matting")
+        raise AssertionError("checkpoint should have stopped processing")
+
+    async def disconnected(_self) -> bool:
+        return True
+
+    labels = {"reason": "client_disconnected", "stage": "matting"}
+    before = METRICS.value("pipeline_cancelled_total", labels=labels)
+    monkeypatch.setattr(app_module, "process_image_with_warnings", slow_process)
+    monkeypatch.setattr(Request, "is_disconnected", disconnected)
+    response = client.post(
+        "/api/process",
+        files={"image": ("test.png", make_image(), "image/png")},
+        data={"preset": "portrait-4x5", "format": "png"},
+    )
+    assert response.status_code == 499
+    assert response.json()["detail"]["code"] == "request_cancelled"
+
+    metrics = client.get("/api/metrics").json()["counters"]
+    key = 'pipeline_cancelled_total{reason="client_disconnected",stage="matting"}'
+    assert metrics[key] == before + 1
+
+
+def test_identical_concurrent_process_requests_are_coalesced(monkeypatch) -> None:
+    import asyncio
+    import time
+
+    import httpx
+
+    import ai_headshot_studio.app as app_module
+    from ai_headshot_studio.metrics import METRICS
+
+    calls: list[int] = []
+    real = app_module._process_and_encode
+
+    def slow_process(data, digest, req, ctx, profile_to=None):
+        calls.append(1)
+        time.sleep(0.3)
+        return real(data, digest, req, ctx, profile_to)
+
+    monkeypatch.setattr(app_module, "_process_and_encode", slow_process)
+    labels = {"endpoint": "process"}
+    before = METRICS.value("requests_coalesced_total", labels=labels)
+    upload = make_image(400, 500)
+
+    async def post_all() -> list[httpx.Response]:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+
+            def post(fmt_case: str) -> object:
+                return http.post(
+                    "/api/process",
+                    files={"image": ("test.png", upload, "image/png")},
+                    data={"preset": "portrait-4x5", "format": fmt_case},
+                )
+
+            # " PNG" normalizes to the same request as "png".
+            return await asyncio.gather(post("png"), post(" PNG"), post("jpeg"))
+
+    responses = asyncio.run(post_all())
+    assert [response.status_code for response in responses] == [200, 200, 200]
+    assert responses[0].content == responses[1].content
+    assert len(calls) == 2
+    assert METRICS.value("requests_coalesced_total", labels=labels) == before + 1
+
+
+def test_process_accepts_encode_profile_and_rejects_unknown() -> None:
+    payload = make_image(400, 500)
+    data = {"remove_bg": "false", "preset": "portrait-4x5", "format": "png"}
+    fast = client.post(
+        "/api/process",
+        files={"image": ("input.png", payload, "image/png")},
+        data={**data, "encode_profile": "fast"},
+    )
+    assert fast.status_code == 200
+
+    bad = client.post(
+        "/api/process",
+        files={"image": ("input.png", payload, "image/png")},
+        data={**data, "encode_profile": "tiny"},
+    )
+    assert bad.status_code == 400
+    assert bad.json()["detail"]["code"] == "unsupported_encode_profile"
+
+
+def test_process_max_bytes_reports_chosen_quality() -> None:
+    source = Image.effect_noise((600, 750), 60).convert("RGB")
+    buf = io.BytesIO()
+    source.save(buf, format="PNG")
+    files = {"image": ("input.png", buf.getvalue(), "image/png")}
+    data = {"remove_bg": "false", "preset": "portrait-4x5", "format": "jpeg"}
+
+    uncapped = client.post("/api/process", files=files, data=data)
+    assert uncapped.status_code == 200
+    assert uncapped.headers["x-output-quality"] == "92"
+
+    cap = len(uncapped.content) // 2
+    capped = client.post("/api/process", files=files, data={**data, "max_bytes": str(cap)})
+    assert capped.status_code == 200
+    assert len(capped.content) <= cap
+    assert int(capped.headers["x-output-quality"]) < 92
+
+    too_small = client.post("/api/process", files=files, data={**data, "max_bytes": "10"})
+    assert too_small.status_code == 400
+    assert too_small.json()["detail"]["code"] == "invalid_parameter"
+
+
+def test_process_accepts_progressive_jpeg_options() -> None:
+    response = client.post(
+        "/api/process",
+        files={"image": ("input.png", make_image(400, 500), "image/png")},
+        data={
+            "remove_bg": "false",
+            "preset": "portrait-4x5",
+            "format": "jpeg",
+            "jpeg_progressive": "true",
+            "jpeg_subsampling": "4:4:4",
+            "jpeg_qtables": "robidoux",
+        },
+    )
+    assert response.status_code == 200
+    with Image.open(io.BytesIO(response.content)) as decoded:
+        assert decoded.info.get("progressive")
+
+    bad = client.post(
+        "/api/process",
+        files={"image": ("input.png", make_image(400, 500), "image/png")},
+        data={"preset": "portrait-4x5", "format": "jpeg", "jpeg_subsampling": "4:1:1"},
+    )
+    assert bad.status_code == 400
+    assert bad.json()["detail"]["code"] == "unsupported_subsampling"
+
+
+def test_process_reports_stage_memory_when_debug_enabled(monkeypatch) -> None:
+    from ai_headshot_studio import app as app_module
+    from ai_headshot_studio.config import Settings
+
+    files = {"image": ("input.png", make_image(300, 400), "image/png")}
+    data = {"remove_bg": "false", "preset": "portrait-4x5", "format": "jpeg"}
+    assert "x-debug-memory" not in client.post("/api/process", files=files, data=data).headers
+
+    monkeypatch.setattr(app_module, "get_settings", lambda: Settings(debug_memory=True))
+    response = client.post("/api/process", files=files, data=data)
+    assert response.status_code == 200
+    header = response.headers["x-debug-memory"]
+    assert header.startswith("decode=")
+    assert "encode=" in header
+    assert "peak_rss=" in header
+
+
+def test_process_saves_profile_only_with_matching_token(monkeypatch, tmp_path) -> None:
+    import pstats
+
+    from ai_headshot_studio import app as app_module
+    from ai_headshot_studio.config import Settings
+
+    settings = Settings(profile_dir=str(tmp_path), profile_token="s3cret")
+    monkeypatch.setattr(app_module, "get_settings", lambda: settings)
+    files = {"image": ("input.png", make_image(300, 400), "image/png")}
+    data = {"remove_bg": "false", "preset": "portrait-4x5", "format": "jpeg"}
+
+    wrong = client.post(
+        "/api/process", files=files, data=data, headers={"X-Profile-Token": "guess"}
+    )
+    assert wrong.status_code == 200
+    assert "x-profile" not in wrong.headers
+    assert list(tmp_path.iterdir()) == []
+
+    response = client.post(
+        "/api/process",
+        files=files,
+        data=data,
+        headers={"X-Profile-Token": "s3cret", "X-Request-Id": "../slow photo 42"},
+    )
+    assert response.status_code == 200
+    assert response.headers["x-profile"] == "slow-photo-42.prof"
+    stats = pstats.Stats(str(tmp_path / "slow-photo-42.prof"))
+    functions = {name for _file, _line, name in stats.stats}
+    assert "process_image_with_warnings" in functions
+
+
+def test_ready_flips_after_startup_warmup(monkeypatch) -> None:
+    from ai_headshot_studio import app as app_module
+    from ai_headshot_studio import warmup
+    from ai_headshot_studio.config import Settings
+
+    settings = Settings(matting_backend="none", warmup="blocking")
+    monkeypatch.setattr(app_module, "get_settings", lambda: settings)
+    monkeypatch.setattr(warmup, "get_settings", lambda: settings)
+    monkeypatch.setattr(app_module, "WARMUP", warmup.Warmup())
+
+    cold = client.get("/api/ready")
+    assert cold.status_code == 503
+    assert cold.json()["status"] == "warming_up"
+    assert client.get("/api/health").status_code == 200
+
+    with TestClient(app) as started:
+        response = started.get("/api/ready")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["status"] == "ready"
+    assert {"imaging", "face_detector", "matting:none", "diagnostics"} <= set(
+        body["warmup"]["steps"]
+    )
+
+
+def test_metrics_report_per_lane_scheduler_stats() -> None:
+    response = client.post(
+        "/api/process",
+        files={"image": ("input.png", make_image(300, 400), "image/png")},
+        data={"remove_bg": "false", "preset": "avatar-400", "format": "jpeg"},
+    )
+    assert response.status_code == 200
+    scheduler = client.get("/api/metrics").json()["scheduler"]
+    assert scheduler["slots"] >= 1
+    assert set(scheduler["lanes"]) == {"interactive", "batch", "background"}
+    interactive = scheduler["lanes"]["interactive"]
+    assert interactive["completed"] >= 1
+    assert {"queued", "running", "wait_ms", "run_ms", "weight"} <= set(interactive)
+
+
+def test_rate_limit_returns_429_with_retry_after_per_client(monkeypatch) -> None:
+    import ai_headshot_studio.app as app_module
+    from ai_headshot_studio.ratelimit import RateLimiter
+
+    # 0.12 MP per image; the burst covers one render with background removal.
+    limiter = RateLimiter(0.1, 0.5)
+    monkeypatch.setattr(app_module, "RATE_LIMITER", limiter)
+
+    def post(api_key: str) -> object:
+        return client.post(
+            "/api/process",
+            files={"image": ("input.png", make_image(300, 400), "image/png")},
+            data={"remove_bg": "true", "matting_backend": "none", "preset": "avatar-400"},
+            headers={"X-API-Key": api_key},
+        )
+
+    assert post("partner").status_code == 200
+    limited = post("partner")
+    assert limited.status_code == 429
+    assert limited.json()["detail"]["code"] == "rate_limited"
+    assert int(limited.headers["Retry-After"]) >= 1
+    assert post("editor").status_code == 200
+
+    metrics = client.get("/api/metrics").json()
+    assert metrics["rate_limit"]["limited"] == 1
+    assert metrics["rate_limit"]["clients"] == 2
+    assert "partner" not in json.dumps(metrics)
+
+
+@pytest.mark.parametrize(
+    "endpoint,field,invalid,valid",
+    [
+        ("process", "image", {"preset": "no-such-preset"}, {"preset": "avatar-400"}),
+        ("batch", "images", {"format": "gif"}, {"preset": "avatar-400"}),
+        (
+            "renditions",
+            "image",
+            {"renditions": "no-such-preset:png"},
+            {"renditions": "avatar-400:png"},
+        ),
+    ],
+)
+def test_invalid_requests_are_rejected_before_charging(
+    monkeypatch, endpoint, field, invalid, valid
+) -> None:
+    import ai_headshot_studio.app as app_module
+    from ai_headshot_studio.ratelimit import RateLimiter
+
+    # The burst covers exactly one valid request for a 0.12 MP upload.
+    limiter = RateLimiter(0.01, 0.13)
+    monkeypatch.setattr(app_module, "RATE_LIMITER", limiter)
+
+    def post(data: dict[str, str]) -> object:
+        return client.post(
+            f"/api/{endpoint}",
+            files={field: ("input.png", make_image(300, 400), "image/png")},
+            data=data,
+            headers={"X-API-Key": "partner"},
+        )
+
+    for _ in range(3):
+        assert post(invalid).status_code == 400
+    assert post(valid).status_code == 200
+    assert post(valid).status_code == 429
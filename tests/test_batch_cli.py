@@ -67,3 +67,24 @@ def test_batch_cli_continue_on_error_emits_errors_json_and_zip(tmp_path) -> None
     assert report["succeeded"] == 1
     assert report["failed"] == 1
     assert zip_path.exists()
+
+
+def test_batch_cli_renditions_write_each_preset_and_format(tmp_path) -> None:
+    input_dir = tmp_path / "inputs"
+    output_dir = tmp_path / "outputs"
+    input_dir.mkdir()
+    (input_dir / "a.png").write_bytes(make_image_bytes())
+
+    result = run_cli(
+        [
+            "--input",
+            str(input_dir),
+            "--output",
+            str(output_dir),
+            "--renditions",
+            "avatar-400:jpeg,avatar-400:png,passport-2x2:jpeg",
+        ]
+    )
+    assert result.returncode == 0
+    outputs = sorted(path.name for path in output_dir.iterdir() if path.is_file())
+    assert outputs == ["a-avatar-400.jpg", "a-avatar-400.png", "a-passport-2x2.jpg"]
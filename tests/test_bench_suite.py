@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+
+def test_bench_suite_writes_per_stage_json(tmp_path) -> None:
+    out = tmp_path / "bench.json"
+    proc = subprocess.run(
+        [
+            sys.executable,
+            "scripts/bench_suite.py",
+            "--sizes",
+            "0.05",
+            "--iters",
+            "1",
+            "--warmup",
+            "0",
+            "--json",
+            str(out),
+        ],
+        check=False,
+        capture_output=True,
+        text=True,
+    )
+    assert proc.returncode == 0, proc.stderr
+
+    report = json.loads(out.read_text(encoding="utf-8"))
+    names = [item["name"] for item in report["scenarios"]]
+    assert "exif-0.05mp-portrait-4x5-plain-jpeg" in names
+    assert "alpha-0.05mp-passport-2x2-studio-png-matte" in names
+    for item in report["scenarios"]:
+        assert item["output_bytes"] > 0
+        assert item["total_ms"]["p50"] > 0
+        assert {"decode", "matting", "framing", "crop", "encode"} <= set(item["stages_ms"])
+
+
+def _report(p50: float, output_bytes: int = 1000, spread: float = 0.5) -> dict[str, object]:
+    return {
+        "scenarios": [
+            {
+                "name": "face-1mp-portrait-4x5-plain-jpeg",
+                "total_ms": {"p50": p50, "p95": p50 * 1.1, "spread": spread},
+                "output_bytes": output_bytes,
+                "peak_rss_bytes": 100_000_000,
+            }
+        ]
+    }
+
+
+def _compare(tmp_path, baseline: dict[str, object], current: dict[str, object]):
+    base_path = tmp_path / "baseline.json"
+    current_path = tmp_path / "current.json"
+    base_path.write_text(json.dumps(baseline), encoding="utf-8")
+    current_path.write_text(json.dumps(current), encoding="utf-8")
+    return subprocess.run(
+        [
+            sys.executable,
+            "scripts/bench_suite.py",
+            "--compare",
+            str(base_path),
+            "--results",
+            str(current_path),
+        ],
+        check=False,
+        capture_output=True,
+        text=True,
+    )
+
+
+def test_bench_compare_flags_regressions_beyond_noise(tmp_path) -> None:
+    within_noise = _compare(tmp_path, _report(100.0), _report(108.0))
+    assert within_noise.returncode == 0, within_noise.stdout
+    assert " ok" in within_noise.stdout
+
+    slower = _compare(tmp_path, _report(100.0), _report(130.0))
+    assert slower.returncode == 1
+    assert "regressed (latency)" in slower.stdout
+
+    # The same slowdown is tolerated when the samples are that noisy.
+    noisy = _compare(tmp_path, _report(100.0, spread=12.0), _report(130.0, spread=12.0))
+    assert noisy.returncode == 0, noisy.stdout
+
+    bigger = _compare(tmp_path, _report(100.0), _report(100.0, output_bytes=1100))
+    assert bigger.returncode == 1
+    assert "regressed (bytes)" in bigger.stdout
+
+
+@pytest.mark.bench
+def test_bench_suite_has_no_regressions_against_baseline(tmp_path) -> None:
+    """Opt-in gate: `pytest -m bench` after saving a baseline with
+    `python scripts/bench_suite.py --fixtures face,alpha --sizes 1 --save-baseline PATH`."""
+
+    baseline = Path(os.environ.get("AI_HEADSHOT_BENCH_BASELINE", "bench-baseline.json"))
+    if not baseline.is_file():
+        pytest.skip(f"No benchmark baseline at {baseline}")
+    proc = subprocess.run(
+        [
+            sys.executable,
+            "scripts/bench_suite.py",
+            "--fixtures",
+            "face,alpha",
+            "--sizes",
+            "1",
+            "--compare",
+            str(baseline),
+            "--max-slowdown",
+            os.environ.get("AI_HEADSHOT_BENCH_MAX_SLOWDOWN", "0.10"),
+        ],
+        check=False,
+        capture_output=True,
+        text=True,
+    )
+    assert proc.returncode == 0, proc.stdout + proc.stderr
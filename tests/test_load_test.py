@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import json
+import subprocess
+import sys
+
+
+def run_load_test(args: list[str]) -> subprocess.CompletedProcess[str]:
+    return subprocess.run(
+        [sys.executable, "scripts/load_test.py", *args],
+        check=False,
+        capture_output=True,
+        text=True,
+    )
+
+
+def test_load_test_reports_latency_statuses_and_loop_lag(tmp_path) -> None:
+    out = tmp_path / "load.json"
+    proc = run_load_test(
+        [
+            "--requests",
+            "4",
+            "--duration",
+            "60",
+            "--concurrency",
+            "2",
+            "--mix",
+            "process:avatar-400:jpeg=3,batch2:square:png=1",
+            "--megapixels",
+            "0.1",
+            "--json",
+            str(out),
+        ]
+    )
+    assert proc.returncode == 0, proc.stderr
+
+    report = json.loads(out.read_text(encoding="utf-8"))
+    assert report["requests"] == 4
+    assert report["statuses"] == {"200": 4}
+    assert report["error_codes"] == {}
+    assert report["latency_ms"]["count"] == 4
+    assert set(report["latency_ms_by_kind"]) <= {"process:avatar-400:jpeg", "batch2:square:png"}
+    assert report["event_loop_lag_ms"]["count"] > 0
+    assert report["settings"]["mode"] == "closed@2"
+
+
+def test_load_test_rejects_bad_mix() -> None:
+    proc = run_load_test(["--mix", "upload:square"])
+    assert proc.returncode != 0
+    assert "Invalid --mix" in proc.stderr
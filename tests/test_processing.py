@@ -1,14 +1,16 @@
 from __future__ import annotations
 
 import io
+from types import SimpleNamespace
 
 import pytest
-from PIL import Image, features
+from PIL import Image, ImageChops, ImageDraw, ImageStat, features
 
 from ai_headshot_studio.app import build_output_headers
 from ai_headshot_studio.processing import (
     ProcessingError,
     ProcessRequest,
+    Rendition,
     alpha_foreground_bbox,
     available_styles,
     crop_to_aspect,
@@ -16,10 +18,15 @@ from ai_headshot_studio.processing import (
     detect_low_lossy_quality_warning,
     detect_low_output_resolution_warning,
     detect_skin_tone_warning,
+    encode_image,
+    encode_result,
     focus_bbox,
     load_image,
+    parse_renditions,
     process_image,
     process_image_with_warnings,
+    process_renditions,
+    resize_if_needed,
     to_bytes,
 )
 
@@ -194,6 +201,48 @@ def test_alpha_foreground_bbox_detects_non_empty_alpha() -> None:
     assert bbox is not None
 
 
+@pytest.mark.parametrize(
+    "size,box",
+    [
+        ((120, 120), (40, 30, 80, 90)),
+        ((1601, 2003), (237, 411, 1299, 2003)),
+        ((4000, 3000), (1, 2, 3999, 17)),
+    ],
+)
+def test_mask_stats_bbox_matches_full_resolution_threshold(size, box) -> None:
+    from ai_headshot_studio.processing import mask_stats
+
+    alpha = Image.new("L", size, 0)
+    ImageDraw.Draw(alpha).ellipse(box, fill=255)
+    # Faint edge noise below the threshold must not grow the bbox.
+    ImageDraw.Draw(alpha).rectangle((0, 0, size[0] - 1, 0), fill=6)
+    image = Image.new("RGB", size, (200, 150, 120))
+    image.putalpha(alpha)
+
+    expected = alpha.point(lambda v: 255 if v > 8 else 0).getbbox()
+    stats = mask_stats(image)
+    assert stats is not None
+    assert stats.bbox == expected
+    assert not stats.opaque
+
+
+def test_mask_stats_short_circuits_opaque_and_empty_alpha() -> None:
+    from ai_headshot_studio.processing import mask_stats
+
+    assert mask_stats(Image.new("RGB", (10, 10))) is None
+    opaque = mask_stats(Image.new("RGBA", (30, 20), (1, 2, 3, 255)))
+    assert opaque is not None and opaque.opaque and opaque.bbox == (0, 0, 30, 20)
+    empty = mask_stats(Image.new("RGBA", (30, 20), (1, 2, 3, 5)))
+    assert empty is not None and empty.bbox is None and not empty.opaque
+    assert alpha_foreground_bbox(Image.new("RGBA", (30, 20), (1, 2, 3, 5))) is None
+
+
+def test_to_bytes_jpeg_matches_for_opaque_rgba() -> None:
+    image = Image.new("RGBA", (64, 48), (200, 120, 40, 255))
+    rgb = to_bytes(image.convert("RGB"), "jpeg", 90)
+    assert to_bytes(image, "jpeg", 90) == rgb
+
+
 def test_focus_bbox_uses_face_bbox_when_alpha_missing(monkeypatch: pytest.MonkeyPatch) -> None:
     import ai_headshot_studio.processing as processing
 
@@ -223,7 +272,7 @@ def test_process_image_passes_focus_bbox_to_crop(monkeypatch: pytest.MonkeyPatch
     )
 
     expected = (12, 34, 56, 78)
-    monkeypatch.setattr(processing, "focus_bbox", lambda _img: expected)
+    monkeypatch.setattr(processing, "focus_bbox", lambda _img, **_kwargs: expected)
 
     captured: dict[str, object] = {}
 
@@ -335,12 +384,12 @@ def test_process_image_with_warnings_includes_low_lossy_quality_warning() -> Non
 
 
 def test_remove_background_maps_system_exit_on_import(monkeypatch: pytest.MonkeyPatch) -> None:
-    import ai_headshot_studio.processing as processing
+    import ai_headshot_studio.matting as matting
 
     def boom(_name: str):
         raise SystemExit(1)
 
-    monkeypatch.setattr(processing.importlib, "import_module", boom)
+    monkeypatch.setattr(matting.importlib, "import_module", boom)
 
     data = make_image(800, 1000)
     req = ProcessRequest(
@@ -364,14 +413,14 @@ def test_remove_background_maps_system_exit_on_import(monkeypatch: pytest.Monkey
 
 
 def test_remove_background_maps_system_exit_on_call(monkeypatch: pytest.MonkeyPatch) -> None:
-    import ai_headshot_studio.processing as processing
+    import ai_headshot_studio.matting as matting
 
     class FakeRembg:
         @staticmethod
         def remove(_image: Image.Image):
             raise SystemExit(1)
 
-    monkeypatch.setattr(processing.importlib, "import_module", lambda _name: FakeRembg())
+    monkeypatch.setattr(matting.importlib, "import_module", lambda _name: FakeRembg())
 
     data = make_image(800, 1000)
     req = ProcessRequest(
@@ -454,3 +503,1051 @@ def test_to_bytes_webp_is_feature_detected() -> None:
     payload = to_bytes(image, "webp")
     # WebP containers are RIFF.
     assert payload.startswith(b"RIFF")
+
+
+def test_parse_renditions_normalizes_and_dedupes() -> None:
+    renditions = parse_renditions("Avatar-400:JPEG, avatar-400:jpeg avatar-800:webp")
+    assert renditions == [
+        Rendition(preset="avatar-400", output_format="jpeg"),
+        Rendition(preset="avatar-800", output_format="webp"),
+    ]
+
+
+def test_parse_renditions_rejects_unknown_preset() -> None:
+    with pytest.raises(ProcessingError) as exc:
+        parse_renditions("avatar-999:jpeg")
+    assert exc.value.code == "unknown_preset"
+
+
+def test_process_renditions_decodes_once(monkeypatch: pytest.MonkeyPatch) -> None:
+    import ai_headshot_studio.processing as processing
+
+    calls = {"load": 0, "focus": 0}
+    real_decode = processing.decode_image
+
+    def counting_load(image: Image.Image) -> Image.Image:
+        calls["load"] += 1
+        return real_decode(image)
+
+    def counting_focus(image: Image.Image, **_kwargs: object) -> None:
+        calls["focus"] += 1
+        return None
+
+    monkeypatch.setattr(processing, "decode_image", counting_load)
+    monkeypatch.setattr(processing, "focus_bbox", counting_focus)
+
+    req = ProcessRequest(
+        remove_bg=False,
+        background="white",
+        background_hex=None,
+        preset="portrait-4x5",
+        style=None,
+        top_bias=0.2,
+        brightness=1.0,
+        contrast=1.0,
+        color=1.0,
+        sharpness=1.0,
+        soften=0.0,
+        jpeg_quality=92,
+        output_format="png",
+    )
+    results = process_renditions(
+        make_image(1200, 1600),
+        req,
+        [
+            Rendition(preset="avatar-400", output_format="jpeg"),
+            Rendition(preset="avatar-400", output_format="png"),
+            Rendition(preset="portrait-4x5", output_format="jpeg"),
+        ],
+    )
+    assert calls == {"load": 1, "focus": 1}
+    assert [item.image.size for item in results] == [(400, 400), (400, 400), (1200, 1500)]
+    # Formats of the same preset share one crop/resize.
+    assert results[0].image is results[1].image
+    assert any(w.code == "low_output_resolution_warning" for w in results[0].warnings)
+    assert not results[2].warnings
+
+
+@pytest.mark.parametrize("quality", ["balanced", "fast"])
+def test_resize_if_needed_fast_tiers_stay_visually_equivalent(quality: str) -> None:
+    gradient = Image.linear_gradient("L").resize((2400, 3000))
+    noise = Image.effect_noise((2400, 3000), 48)
+    source = Image.merge("RGB", (ImageChops.add(gradient, noise, scale=2.0), gradient, noise))
+
+    reference = resize_if_needed(source, 400, 400, quality="high")
+    result = resize_if_needed(source, 400, 400, quality=quality)
+    assert result.size == (400, 400)
+    mean_diff = ImageStat.Stat(ImageChops.difference(reference, result)).mean
+    assert max(mean_diff) < 1.5
+
+
+def test_process_rejects_unknown_resize_quality() -> None:
+    req = ProcessRequest(
+        remove_bg=False,
+        background="white",
+        background_hex=None,
+        preset="avatar-400",
+        style=None,
+        top_bias=0.2,
+        brightness=1.0,
+        contrast=1.0,
+        color=1.0,
+        sharpness=1.0,
+        soften=0.0,
+        jpeg_quality=92,
+        output_format="png",
+        resize_quality="ultra",
+    )
+    with pytest.raises(ProcessingError) as exc:
+        process_image(make_image(800, 800), req)
+    assert exc.value.code == "unsupported_resize_quality"
+
+
+def _ellipse_mask(size: tuple[int, int]) -> Image.Image:
+    mask = Image.new("L", size, 0)
+    width, height = size
+    ImageDraw.Draw(mask).ellipse((width * 0.2, height * 0.15, width * 0.8, height * 0.95), fill=255)
+    return mask
+
+
+def test_remove_background_bounded_matte_infers_small_and_refines_edges(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    import ai_headshot_studio.matting as matting
+    import ai_headshot_studio.processing as processing
+
+    seen: list[tuple[int, int]] = []
+
+    class FakeRembg:
+        @staticmethod
+        def remove(image: Image.Image, only_mask: bool = False) -> Image.Image:
+            assert only_mask
+            seen.append(image.size)
+            return _ellipse_mask(image.size)
+
+    monkeypatch.setattr(matting.importlib, "import_module", lambda _name: FakeRembg())
+
+    source = Image.new("RGB", (1600, 2000), (40, 60, 200))
+    source.paste((230, 190, 160), mask=_ellipse_mask(source.size))
+    result = processing.remove_background(source, quality="fast")
+
+    assert seen == [(512, 640)]
+    assert result.mode == "RGBA"
+    assert result.size == source.size
+
+    expected = _ellipse_mask(source.size)
+    refined_diff = ImageStat.Stat(ImageChops.difference(result.getchannel("A"), expected)).mean[0]
+    upsampled = _ellipse_mask(seen[0]).resize(source.size, Image.BILINEAR)
+    bilinear_diff = ImageStat.Stat(ImageChops.difference(upsampled, expected)).mean[0]
+    assert refined_diff < bilinear_diff
+
+
+def test_remove_background_full_quality_passes_original_image(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    import ai_headshot_studio.matting as matting
+    import ai_headshot_studio.processing as processing
+
+    seen: list[tuple[int, int]] = []
+
+    class FakeRembg:
+        @staticmethod
+        def remove(image: Image.Image) -> Image.Image:
+            seen.append(image.size)
+            return image.convert("RGBA")
+
+    monkeypatch.setattr(matting.importlib, "import_module", lambda _name: FakeRembg())
+    processing.remove_background(Image.new("RGB", (1600, 2000)), quality="full")
+    assert seen == [(1600, 2000)]
+
+
+def test_background_changes_reuse_cached_matte(monkeypatch: pytest.MonkeyPatch) -> None:
+    import ai_headshot_studio.matting as matting
+    import ai_headshot_studio.processing as processing
+
+    calls: list[tuple[int, int]] = []
+
+    class FakeRembg:
+        @staticmethod
+        def remove(image: Image.Image) -> Image.Image:
+            calls.append(image.size)
+            cutout = image.convert("RGBA")
+            cutout.putalpha(_ellipse_mask(image.size))
+            return cutout
+
+    monkeypatch.setattr(matting.importlib, "import_module", lambda _name: FakeRembg())
+    monkeypatch.setattr(processing, "MATTE_CACHE", matting.MatteCache(8 * 1024 * 1024))
+
+    data = make_image(400, 500)
+    results = []
+    for background, background_hex in [("white", None), ("blue", None), ("custom", "#123456")]:
+        req = ProcessRequest(
+            remove_bg=True,
+            background=background,
+            background_hex=background_hex,
+            preset="portrait-4x5",
+            style=None,
+            top_bias=0.2,
+            brightness=1.0,
+            contrast=1.0,
+            color=1.0,
+            sharpness=1.0,
+            soften=0.0,
+            jpeg_quality=92,
+            output_format="png",
+        )
+        results.append(process_image(data, req))
+
+    assert calls == [(400, 500)]
+    assert processing.MATTE_CACHE.stats()["hits"] == 2
+    # The backdrop differs, the subject cut-out does not.
+    assert results[0].getpixel((0, 0)) != results[1].getpixel((0, 0))
+    assert results[0].getpixel((200, 250)) == results[1].getpixel((200, 250))
+
+
+def test_precomputed_upload_digest_keys_the_matte_cache(monkeypatch: pytest.MonkeyPatch) -> None:
+    import ai_headshot_studio.matting as matting
+    import ai_headshot_studio.processing as processing
+
+    class FakeRembg:
+        @staticmethod
+        def remove(image: Image.Image) -> Image.Image:
+            cutout = image.convert("RGBA")
+            cutout.putalpha(_ellipse_mask(image.size))
+            return cutout
+
+    monkeypatch.setattr(matting.importlib, "import_module", lambda _name: FakeRembg())
+    monkeypatch.setattr(processing, "MATTE_CACHE", matting.MatteCache(8 * 1024 * 1024))
+    data = make_image(400, 500)
+    digest = processing.upload_digest(data)
+    hashed: list[bytes] = []
+    real_digest = processing.upload_digest
+
+    def counting_digest(payload: bytes) -> str:
+        hashed.append(payload)
+        return real_digest(payload)
+
+    monkeypatch.setattr(processing, "upload_digest", counting_digest)
+    req = ProcessRequest(
+        remove_bg=True,
+        background="white",
+        background_hex=None,
+        preset="portrait-4x5",
+        style=None,
+        top_bias=0.2,
+        brightness=1.0,
+        contrast=1.0,
+        color=1.0,
+        sharpness=1.0,
+        soften=0.0,
+        jpeg_quality=92,
+        output_format="png",
+    )
+    process_image_with_warnings(data, req, digest=digest)
+    process_renditions(data, req, [Rendition(preset="square", output_format="png")], digest=digest)
+
+    assert hashed == []
+    key = processing.matte_cache_key(digest, quality="full")
+    assert processing.MATTE_CACHE.get(key) is not None
+    assert processing.request_fingerprint(digest, req) is not None
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_matte_cache_round_trips_and_evicts_by_bytes(compress: bool) -> None:
+    from ai_headshot_studio.matting import MatteCache
+
+    cache = MatteCache(2 * 100 * 100, compress=compress)
+    first = _ellipse_mask((100, 100))
+    cache.put("a", first)
+    cache.put("b", _ellipse_mask((100, 100)))
+    restored = cache.get("a")
+    assert restored is not None
+    assert restored.mode == "L"
+    assert restored.tobytes() == first.tobytes()
+    cache.put("c", Image.new("L", (100, 100), 255))
+    if compress:
+        # PNG-compressed mattes are far smaller, so nothing is evicted.
+        assert cache.stats()["entries"] == 3
+    else:
+        # "b" is least recently used once "a" was read back.
+        assert cache.get("b") is None
+        assert cache.stats()["entries"] == 2
+
+
+@pytest.fixture
+def fake_onnx_rembg(monkeypatch: pytest.MonkeyPatch):
+    """Fake rembg exposing a u2net-style ONNX session; records input batch shapes."""
+
+    np = pytest.importorskip("numpy")
+    import ai_headshot_studio.matting as matting
+    import ai_headshot_studio.processing as processing
+
+    state: dict[str, object] = {"shapes": [], "batch_dim": "batch_size", "error": None}
+
+    class FakeInner:
+        def get_inputs(self) -> list[SimpleNamespace]:
+            return [SimpleNamespace(name="input.1", shape=[state["batch_dim"], 3, 320, 320])]
+
+        def run(self, _outputs: object, feeds: dict[str, object]) -> list[object]:
+            batch = feeds["input.1"]
+            batch_dim = state["batch_dim"]
+            if isinstance(batch_dim, int) and batch.shape[0] != batch_dim:
+                raise AssertionError("fixed batch dimension")
+            if state["error"] is not None:
+                raise state["error"]
+            state["shapes"].append(batch.shape)
+            out = np.zeros((batch.shape[0], 1, 320, 320), dtype=np.float32)
+            out[:, :, 60:300, 80:240] = 1.0
+            return [out]
+
+    class FakeRembg:
+        @staticmethod
+        def remove(image: Image.Image, **_kwargs: object) -> Image.Image:
+            raise AssertionError("batched path should not call remove()")
+
+        @staticmethod
+        def new_session(_model: str, **_kwargs: object) -> SimpleNamespace:
+            return SimpleNamespace(inner_session=FakeInner())
+
+    monkeypatch.setattr(matting.importlib, "import_module", lambda _name: FakeRembg())
+    monkeypatch.setattr(processing, "MATTE_CACHE", matting.MatteCache(8 * 1024 * 1024))
+    matting._rembg_session.cache_clear()
+    yield state
+    matting._rembg_session.cache_clear()
+
+
+def test_compute_alpha_mattes_runs_one_inference_per_batch(fake_onnx_rembg) -> None:
+    from ai_headshot_studio.matting import compute_alpha_mattes
+
+    images = [Image.new("RGB", (400 + index * 10, 500), (200, 180, 160)) for index in range(5)]
+    mattes = compute_alpha_mattes(images, model="u2net", batch_size=4)
+    assert fake_onnx_rembg["shapes"] == [(4, 3, 320, 320), (1, 3, 320, 320)]
+    assert [matte.size for matte in mattes] == [image.size for image in images]
+    assert all(matte.mode == "L" for matte in mattes)
+    assert mattes[0].getpixel((200, 250)) == 255
+    assert mattes[0].getpixel((5, 5)) == 0
+
+
+def test_compute_alpha_mattes_falls_back_for_fixed_batch_models(fake_onnx_rembg) -> None:
+    from ai_headshot_studio.matting import compute_alpha_mattes
+    from ai_headshot_studio.metrics import METRICS
+
+    labels = {"reason": "fixed_batch"}
+    before = METRICS.value("matting_batch_fallback_total", labels=labels)
+    fake_onnx_rembg["batch_dim"] = 1
+    images = [Image.new("RGB", (300, 300)) for _ in range(3)]
+    mattes = compute_alpha_mattes(images, model="u2net", batch_size=4)
+    assert fake_onnx_rembg["shapes"] == [(1, 3, 320, 320)] * 3
+    assert len(mattes) == 3
+    assert METRICS.value("matting_batch_fallback_total", labels=labels) == before + 1
+
+
+def test_compute_alpha_mattes_surfaces_inference_errors(fake_onnx_rembg) -> None:
+    from ai_headshot_studio.matting import compute_alpha_mattes
+
+    fake_onnx_rembg["error"] = MemoryError("out of memory")
+    with pytest.raises(ProcessingError) as exc:
+        compute_alpha_mattes([Image.new("RGB", (300, 300))] * 2, model="u2net", batch_size=4)
+    assert exc.value.code == "background_removal_unavailable"
+    assert isinstance(exc.value.__cause__, MemoryError)
+    assert fake_onnx_rembg["shapes"] == []
+
+
+def test_process_images_with_warnings_batches_matting_and_keeps_item_errors(
+    fake_onnx_rembg,
+) -> None:
+    from ai_headshot_studio.processing import process_images_with_warnings
+
+    req = ProcessRequest(
+        remove_bg=True,
+        background="white",
+        background_hex=None,
+        preset="passport-2x2",
+        style=None,
+        top_bias=0.2,
+        brightness=1.0,
+        contrast=1.0,
+        color=1.0,
+        sharpness=1.0,
+        soften=0.0,
+        jpeg_quality=92,
+        output_format="png",
+    )
+    items = [make_image(800, 1000), b"not an image", make_image(900, 1200)]
+    outcomes = process_images_with_warnings(items, req, batch_size=4)
+    assert fake_onnx_rembg["shapes"] == [(2, 3, 320, 320)]
+    assert isinstance(outcomes[1], ProcessingError)
+    assert outcomes[1].code == "invalid_image"
+    for outcome in (outcomes[0], outcomes[2]):
+        assert not isinstance(outcome, ProcessingError)
+        assert outcome[0].size == (600, 600)
+
+
+def _backend_request(**overrides: object) -> ProcessRequest:
+    fields: dict[str, object] = {
+        "remove_bg": True,
+        "background": "white",
+        "background_hex": None,
+        "preset": "portrait-4x5",
+        "style": None,
+        "top_bias": 0.2,
+        "brightness": 1.0,
+        "contrast": 1.0,
+        "color": 1.0,
+        "sharpness": 1.0,
+        "soften": 0.0,
+        "jpeg_quality": 92,
+        "output_format": "png",
+    }
+    fields.update(overrides)
+    return ProcessRequest(**fields)  # type: ignore[arg-type]
+
+
+def test_none_matting_backend_skips_rembg(monkeypatch) -> None:
+    from ai_headshot_studio import matting
+
+    def fail_import() -> None:
+        raise AssertionError("rembg should not be imported")
+
+    monkeypatch.setattr(matting, "_rembg_remove", fail_import)
+    result = process_image(make_image(800, 1000), _backend_request(matting_backend="none"))
+    assert result.size == (800, 1000)
+    assert result.convert("RGBA").getchannel("A").getextrema() == (255, 255)
+
+
+def test_unknown_matting_backend_is_rejected() -> None:
+    with pytest.raises(ProcessingError) as exc:
+        process_image(make_image(800, 1000), _backend_request(matting_backend="sam"))
+    assert exc.value.code == "unknown_matting_backend"
+
+
+def test_matting_falls_back_when_default_backend_is_unavailable(monkeypatch) -> None:
+    from ai_headshot_studio import matting, processing
+    from ai_headshot_studio.config import Settings
+
+    class StubBackend(matting.MattingBackend):
+        name = "stub"
+        provider = "test-stub"
+
+        def compute(self, image, *, quality="full", subject_bbox=None):
+            return Image.new("L", image.size, 255)
+
+    def unavailable() -> None:
+        raise ProcessingError("rembg missing", code="background_removal_unavailable")
+
+    monkeypatch.setattr(matting, "_rembg_remove", unavailable)
+    monkeypatch.setitem(matting.MATTING_BACKENDS, "stub", StubBackend())
+    monkeypatch.setattr(processing, "get_settings", lambda: Settings(matting_fallback="stub"))
+    monkeypatch.setattr(processing, "MATTE_CACHE", matting.MatteCache(1024 * 1024))
+
+    result = process_image(make_image(800, 1000), _backend_request())
+    assert result.size == (800, 1000)
+    assert matting.MATTING_BACKENDS["stub"].diagnostics()["calls"] == 1
+
+    # An explicit backend choice is honoured and never silently substituted.
+    with pytest.raises(ProcessingError) as exc:
+        process_image(make_image(800, 1000), _backend_request(matting_backend="rembg"))
+    assert exc.value.code == "background_removal_unavailable"
+
+
+class _FakeCascade:
+    def __init__(self, hits: list[list[tuple[int, int, int, int]]]) -> None:
+        self.hits = hits
+        self.calls: list[tuple[tuple[int, ...], float]] = []
+
+    def detectMultiScale(self, gray, scaleFactor, **_kwargs):  # noqa: N802, N803
+        self.calls.append((gray.shape, scaleFactor))
+        return self.hits.pop(0) if self.hits else []
+
+
+def test_detect_face_refines_coarse_hit_on_a_region(monkeypatch) -> None:
+    from ai_headshot_studio import faces
+
+    # Coarse pass at 400px long edge (scale 0.2), then a refine on the region only.
+    cascade = _FakeCascade([[(150, 100, 60, 60)], [(40, 40, 130, 130)]])
+    monkeypatch.setattr(faces, "_haar_cascade", lambda: cascade)
+    image = Image.new("RGB", (2000, 1600), (120, 140, 160))
+
+    face = faces.detect_face(image, detect_size=400, refine_size=900, scale_factor=1.2)
+
+    (coarse_shape, factor), (roi_shape, _) = cascade.calls
+    assert coarse_shape == (320, 400)
+    assert factor == 1.2
+    # A 300px face plus half a face of margin per side, at the 900px scale (0.45).
+    assert roi_shape == (270, 270)
+    assert face == (689, 439, 289, 289)
+
+
+def test_detect_face_runs_one_full_pass_when_coarse_misses(monkeypatch) -> None:
+    from ai_headshot_studio import faces
+
+    cascade = _FakeCascade([[], [(90, 90, 45, 45)]])
+    monkeypatch.setattr(faces, "_haar_cascade", lambda: cascade)
+    image = Image.new("L", (1800, 1800), 128)
+
+    assert faces.detect_face(image, detect_size=400, refine_size=900) == (180, 180, 90, 90)
+    assert [shape for shape, _ in cascade.calls] == [(400, 400), (900, 900)]
+
+
+def test_detect_face_uses_yunet_model_from_settings(monkeypatch, tmp_path) -> None:
+    import numpy as np
+
+    from ai_headshot_studio import faces
+    from ai_headshot_studio.config import Settings
+
+    created: list[str] = []
+    sizes: list[tuple[int, int]] = []
+
+    class FakeYuNet:
+        def setInputSize(self, size):  # noqa: N802
+            sizes.append(size)
+
+        def detect(self, bgr):
+            assert bgr.shape[2] == 3
+            return 1, np.array([[10, 20, 30, 30] + [0] * 10 + [0.9], [50, 60, 80, 100] + [0] * 11])
+
+    class FakeFactory:
+        @staticmethod
+        def create(model, config, size, *args):
+            created.append(model)
+            return FakeYuNet()
+
+    model = tmp_path / "face_detection_yunet.onnx"
+    model.write_bytes(b"onnx")
+    settings = Settings(face_detector="yunet", face_model=str(model))
+    monkeypatch.setattr(faces, "get_settings", lambda: settings)
+    monkeypatch.setattr(faces, "_cv2", lambda: SimpleNamespace(FaceDetectorYN=FakeFactory))
+    monkeypatch.setattr(faces, "_haar_cascade", lambda: pytest.fail("haar should not run"))
+
+    image = Image.new("RGB", (800, 600), (120, 140, 160))
+    assert faces.detect_face(image) == (100, 120, 160, 200)
+    assert faces.detect_face(image) == (100, 120, 160, 200)
+    assert created == [str(model)]
+    assert sizes == [(400, 300), (400, 300)]
+    assert faces.active_detector() == "yunet"
+
+
+def test_detect_face_falls_back_to_haar_without_yunet_model(monkeypatch, tmp_path) -> None:
+    pytest.importorskip("cv2")
+    from ai_headshot_studio import app as app_module
+    from ai_headshot_studio import faces
+    from ai_headshot_studio.config import Settings
+
+    settings = Settings(face_detector="yunet", face_model=str(tmp_path / "missing.onnx"))
+    monkeypatch.setattr(faces, "get_settings", lambda: settings)
+    monkeypatch.setattr(app_module, "get_settings", lambda: settings)
+    cascade = _FakeCascade([[(40, 40, 100, 100)]])
+    monkeypatch.setattr(faces, "_haar_cascade", lambda: cascade)
+
+    image = Image.new("L", (400, 400), 128)
+    assert faces.detect_face(image) == (40, 40, 100, 100)
+    assert faces.active_detector() == "haar"
+
+    details = app_module.face_framing_diagnostics.__wrapped__()
+    assert details["available"] is True
+    assert details["detector"] == "haar"
+    assert details["fallback"] is True
+    assert details["model"] == "missing.onnx"
+
+
+def test_unknown_face_detector_frames_with_haar_and_is_reported(monkeypatch) -> None:
+    pytest.importorskip("cv2")
+    from ai_headshot_studio import app as app_module
+    from ai_headshot_studio import faces, warmup
+    from ai_headshot_studio.config import Settings
+
+    settings = Settings(face_detector="yunett")
+    for module in (faces, app_module, warmup):
+        monkeypatch.setattr(module, "get_settings", lambda: settings)
+    monkeypatch.setattr(faces, "_haar_cascade", lambda: _FakeCascade([[(40, 40, 100, 100)]]))
+
+    assert faces.detect_face(Image.new("L", (400, 400), 128)) == (40, 40, 100, 100)
+    assert faces.active_detector() == "haar"
+    with pytest.raises(ProcessingError) as exc:
+        faces.validate_detector(settings.face_detector)
+    assert exc.value.code == "unknown_detector"
+
+    details = app_module.face_framing_diagnostics.__wrapped__()
+    assert details["detector"] == "haar"
+    assert details["fallback"] is True
+    assert details["error"] == "unknown_detector"
+
+    state = warmup.Warmup()
+    state.run([("face_detector", warmup._warm_face_detector)])
+    steps = state.snapshot()["steps"]
+    assert steps["face_detector"]["error"] == "unknown_detector"
+
+
+def test_memory_budget_queues_until_release_and_rejects_after_timeout() -> None:
+    import threading
+
+    from ai_headshot_studio.admission import MemoryBudget
+
+    budget = MemoryBudget(100, timeout_s=5.0)
+    held = budget.acquire(80)
+    admitted = threading.Event()
+
+    def waiter() -> None:
+        with budget.reserve(50):
+            admitted.set()
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    assert not admitted.wait(0.05)
+    assert budget.stats()["waiting"] == 1
+    budget.release(held)
+    thread.join(timeout=5)
+    assert admitted.is_set()
+
+    # Oversized requests are clamped to the budget so they still run alone.
+    with budget.reserve(10_000) as amount:
+        assert amount == 100
+        with pytest.raises(ProcessingError) as exc:
+            budget.acquire(1, timeout_s=0.01)
+        assert exc.value.code == "server_busy"
+    assert budget.stats()["reserved_bytes"] == 0
+    assert budget.stats()["rejected"] == 1
+
+
+def test_pipeline_reserves_memory_before_decoding(monkeypatch) -> None:
+    import ai_headshot_studio.processing as processing
+    from ai_headshot_studio.admission import MemoryBudget, estimate_pipeline_bytes
+
+    budget = MemoryBudget(1 << 40)
+    monkeypatch.setattr(processing, "MEMORY_BUDGET", budget)
+    seen: list[int] = []
+    real_decode = processing.decode_image
+
+    def spying_decode(image: Image.Image) -> Image.Image:
+        seen.append(int(budget.stats()["reserved_bytes"]))
+        return real_decode(image)
+
+    monkeypatch.setattr(processing, "decode_image", spying_decode)
+    process_image(make_image(800, 1000), _backend_request(remove_bg=False))
+    assert seen == [estimate_pipeline_bytes(800, 1000)]
+    assert budget.stats()["reserved_bytes"] == 0
+
+
+def test_admission_and_timeout_settings_are_read_from_env(monkeypatch) -> None:
+    from ai_headshot_studio.config import get_settings
+
+    monkeypatch.setenv("AI_HEADSHOT_MEMORY_BUDGET_MB", "256")
+    monkeypatch.setenv("AI_HEADSHOT_ADMISSION_TIMEOUT_S", "2.5")
+    monkeypatch.setenv("AI_HEADSHOT_REQUEST_TIMEOUT_S", "0")
+    get_settings.cache_clear()
+    try:
+        settings = get_settings()
+        assert settings.memory_budget_mb == 256
+        assert settings.admission_timeout_s == 2.5
+        assert settings.request_timeout_s == 0.0
+    finally:
+        get_settings.cache_clear()
+
+
+def test_pipeline_checkpoints_stop_before_the_next_stage(monkeypatch) -> None:
+    import ai_headshot_studio.processing as processing
+    from ai_headshot_studio.errors import RequestCancelled
+    from ai_headshot_studio.pipeline import PipelineContext
+
+    ctx = PipelineContext()
+    stages: list[str] = []
+
+    def cancelling_focus(image: Image.Image, **_kwargs: object) -> None:
+        stages.append("framing")
+        ctx.cancel()
+
+    monkeypatch.setattr(processing, "focus_bbox", cancelling_focus)
+    monkeypatch.setattr(processing, "apply_background", lambda *_a: pytest.fail("ran"))
+    with pytest.raises(RequestCancelled) as exc:
+        process_image_with_warnings(
+            make_image(400, 500), _backend_request(remove_bg=False), ctx=ctx
+        )
+    assert exc.value.code == "request_cancelled"
+    assert stages == ["framing"]
+
+    expired = PipelineContext(timeout_s=1e-9)
+    with pytest.raises(RequestCancelled) as exc:
+        expired.checkpoint("decode")
+    assert exc.value.code == "deadline_exceeded"
+
+
+def test_batch_cancellation_aborts_instead_of_failing_items() -> None:
+    from ai_headshot_studio.errors import RequestCancelled
+    from ai_headshot_studio.pipeline import PipelineContext
+    from ai_headshot_studio.processing import process_images_with_warnings
+
+    ctx = PipelineContext()
+    ctx.cancel()
+    with ctx.activate(), pytest.raises(RequestCancelled):
+        process_images_with_warnings(
+            [make_image(300, 300), make_image(300, 300)], _backend_request(remove_bg=False)
+        )
+
+
+def test_single_flight_reruns_when_the_leader_client_disconnects() -> None:
+    import asyncio
+
+    from ai_headshot_studio.errors import RequestCancelled
+    from ai_headshot_studio.singleflight import SingleFlight
+
+    flights: SingleFlight[str] = SingleFlight("test")
+    runs: list[str] = []
+
+    async def leader() -> str:
+        runs.append("leader")
+        await asyncio.sleep(0.05)
+        raise RequestCancelled("gone", code="request_cancelled")
+
+    async def follower() -> str:
+        runs.append("follower")
+        return "done"
+
+    async def scenario() -> tuple[object, tuple[str, bool]]:
+        first = asyncio.create_task(flights.run("key", leader))
+        await asyncio.sleep(0)
+        second = await flights.run("key", follower)
+        return await asyncio.gather(first, return_exceptions=True), second
+
+    (leader_outcome,), follower_outcome = asyncio.run(scenario())
+    assert isinstance(leader_outcome, RequestCancelled)
+    assert follower_outcome == ("done", False)
+    assert runs == ["leader", "follower"]
+    assert flights.inflight() == 0
+
+
+@pytest.mark.parametrize("fmt", ["png", "jpeg", "webp"])
+def test_to_bytes_encode_profiles_round_trip(fmt: str) -> None:
+    if fmt == "webp" and not features.check("webp"):
+        pytest.skip("WebP encoder unavailable")
+    gradient = Image.linear_gradient("L").resize((160, 200))
+    image = Image.merge("RGB", (gradient, gradient.transpose(Image.FLIP_TOP_BOTTOM), gradient))
+
+    sizes = {}
+    for profile in ("fast", "balanced", "smallest"):
+        payload = to_bytes(image, fmt, 90, profile=profile)
+        with Image.open(io.BytesIO(payload)) as decoded:
+            assert decoded.size == image.size
+        sizes[profile] = len(payload)
+    assert to_bytes(image, fmt, 90) == to_bytes(image, fmt, 90, profile="smallest")
+    if fmt == "png":
+        assert sizes["smallest"] <= sizes["fast"]
+
+
+def test_to_bytes_rejects_unknown_encode_profile() -> None:
+    with pytest.raises(ProcessingError) as exc:
+        to_bytes(Image.new("RGB", (8, 8)), "png", profile="tiny")
+    assert exc.value.code == "unsupported_encode_profile"
+
+
+def _textured(width: int, height: int) -> Image.Image:
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 40)
+    return Image.merge("RGB", (gradient, noise, ImageChops.add(gradient, noise, scale=2.0)))
+
+
+@pytest.mark.parametrize("fmt", ["jpeg", "webp"])
+def test_encode_image_max_bytes_picks_highest_fitting_quality(fmt: str, monkeypatch) -> None:
+    if fmt == "webp" and not features.check("webp"):
+        pytest.skip("WebP encoder unavailable")
+    image = _textured(320, 400)
+    full, quality = encode_image(image, fmt, 92)
+    assert quality == 92
+    cap = len(full) // 2
+
+    saves: list[int] = []
+    original_save = Image.Image.save
+
+    def counting_save(self, fp, format=None, **params):  # noqa: A002
+        saves.append(params["quality"])
+        return original_save(self, fp, format=format, **params)
+
+    monkeypatch.setattr(Image.Image, "save", counting_save)
+    payload, chosen = encode_image(image, fmt, 92, max_bytes=cap)
+    monkeypatch.undo()
+
+    assert chosen is not None and chosen < 92
+    assert len(payload) <= cap
+    assert len(saves) <= 8
+    # One step up no longer fits, so the search found the highest quality.
+    assert len(encode_image(image, fmt, chosen + 1)[0]) > cap
+    with Image.open(io.BytesIO(payload)) as decoded:
+        assert decoded.size == image.size
+
+
+def test_encode_image_max_bytes_unreachable_and_png() -> None:
+    image = _textured(320, 400)
+    with pytest.raises(ProcessingError) as exc:
+        encode_image(image, "jpeg", 92, max_bytes=1024)
+    assert exc.value.code == "target_size_unreachable"
+
+    png, quality = encode_image(image, "png", max_bytes=10_000_000)
+    assert quality is None
+    with pytest.raises(ProcessingError) as exc:
+        encode_image(image, "png", max_bytes=len(png) - 1)
+    assert exc.value.code == "target_size_unreachable"
+
+
+def test_encode_image_jpeg_progressive_subsampling_and_qtables() -> None:
+    from PIL import JpegImagePlugin
+
+    image = _textured(160, 200)
+    baseline, _ = encode_image(image, "jpeg", 90)
+    payload, _ = encode_image(
+        image, "jpeg", 90, progressive=True, subsampling="4:4:4", qtables="robidoux"
+    )
+    with Image.open(io.BytesIO(baseline)) as plain, Image.open(io.BytesIO(payload)) as tuned:
+        assert not plain.info.get("progressive")
+        assert tuned.info.get("progressive")
+        assert JpegImagePlugin.get_sampling(plain) == 2
+        assert JpegImagePlugin.get_sampling(tuned) == 0
+        assert tuned.quantization != plain.quantization
+
+    with pytest.raises(ProcessingError) as exc:
+        encode_image(image, "jpeg", 90, subsampling="4:1:1")
+    assert exc.value.code == "unsupported_subsampling"
+    with pytest.raises(ProcessingError) as exc:
+        encode_image(image, "jpeg", 90, qtables="photoshop")
+    assert exc.value.code == "unsupported_qtables"
+
+
+def test_encode_result_uses_request_jpeg_options() -> None:
+    from PIL import JpegImagePlugin
+
+    req = ProcessRequest(
+        remove_bg=False,
+        background="white",
+        background_hex=None,
+        preset="portrait-4x5",
+        style=None,
+        top_bias=0.2,
+        brightness=1.0,
+        contrast=1.0,
+        color=1.0,
+        sharpness=1.0,
+        soften=0.0,
+        jpeg_quality=88,
+        output_format="png",
+        jpeg_progressive=True,
+        jpeg_subsampling="4:2:2",
+    )
+    payload, quality = encode_result(_textured(160, 200), req, "jpeg")
+    assert quality == 88
+    with Image.open(io.BytesIO(payload)) as decoded:
+        assert decoded.format == "JPEG"
+        assert decoded.info.get("progressive")
+        assert JpegImagePlugin.get_sampling(decoded) == 1
+
+
+def test_pipeline_context_records_stage_timings() -> None:
+    from ai_headshot_studio.pipeline import PipelineContext
+
+    ctx = PipelineContext()
+    assert ctx.stage_timings() == {}
+    result, _warnings = process_image_with_warnings(
+        make_image(300, 400), _backend_request(matting_backend="none"), ctx=ctx
+    )
+    ctx.checkpoint("encode")
+    to_bytes(result, "jpeg")
+    timings = ctx.stage_timings()
+    assert list(timings) == [
+        "decode",
+        "matting",
+        "framing",
+        "background",
+        "retouch",
+        "crop",
+        "encode",
+    ]
+    assert all(ms >= 0 for ms in timings.values())
+
+
+def test_memory_profiler_records_peaks_per_stage() -> None:
+    from ai_headshot_studio.pipeline import PipelineContext
+    from ai_headshot_studio.profiling import MemoryProfiler
+
+    with MemoryProfiler() as profiler:
+        ctx = PipelineContext(memory=profiler)
+        ctx.checkpoint("decode")
+        chunk = bytearray(4 * 1024 * 1024)
+        ctx.checkpoint("encode")
+        del chunk
+        stages = profiler.stages()
+
+    assert list(stages) == ["decode", "encode"]
+    assert stages["decode"]["py_bytes"] >= 4 * 1024 * 1024
+    assert stages["encode"]["py_bytes"] < 4 * 1024 * 1024
+    assert profiler.header_value().startswith("decode=")
+
+
+def test_memory_profiler_measures_one_request_at_a_time() -> None:
+    from ai_headshot_studio.pipeline import PipelineContext
+    from ai_headshot_studio.profiling import MemoryProfiler
+
+    with MemoryProfiler() as first, MemoryProfiler() as second:
+        assert first.active and not second.active
+        PipelineContext(memory=second).checkpoint("decode")
+        PipelineContext(memory=first).checkpoint("decode")
+        assert second.stages() == {}
+        assert list(first.stages()) == ["decode"]
+    with MemoryProfiler() as third:
+        assert third.active
+
+
+def test_warmup_records_failed_steps_and_still_becomes_ready() -> None:
+    from ai_headshot_studio.warmup import Warmup
+
+    def broken() -> None:
+        raise ProcessingError("Background removal model unavailable.", code="model_missing")
+
+    warmup = Warmup()
+    assert not warmup.ready
+    warmup.start([("ok", lambda: None), ("broken", broken)], mode="background")
+    assert warmup.wait(timeout_s=5.0)
+    steps = warmup.snapshot()["steps"]
+    assert steps["ok"]["ok"] is True
+    assert steps["broken"] == {"ok": False, "error": "model_missing", "ms": steps["broken"]["ms"]}
+
+
+def test_warmup_survives_rembg_that_exits_on_import(monkeypatch: pytest.MonkeyPatch) -> None:
+    import ai_headshot_studio.matting as matting
+    from ai_headshot_studio.warmup import Warmup
+
+    def exiting_import(name: str) -> object:
+        if name == "rembg":
+            raise SystemExit(1)
+        raise ImportError(name)
+
+    monkeypatch.setattr(matting.importlib, "import_module", exiting_import)
+    matting._rembg_session.cache_clear()
+    try:
+        warmup = Warmup()
+        warmup.start(
+            [
+                ("matting:rembg", matting.get_backend("rembg").warm_up),
+                ("exits", lambda: exit(2)),
+                ("after", lambda: None),
+            ],
+            mode="background",
+        )
+        assert warmup.wait(timeout_s=10.0)
+    finally:
+        matting._rembg_session.cache_clear()
+    steps = warmup.snapshot()["steps"]
+    assert steps["matting:rembg"]["error"] == "background_removal_unavailable"
+    assert steps["exits"]["error"] == "SystemExit"
+    assert steps["after"]["ok"] is True
+
+
+def test_lane_scheduler_shares_slots_by_weight() -> None:
+    import threading
+    import time
+
+    from ai_headshot_studio.scheduler import LaneScheduler
+
+    scheduler = LaneScheduler(1, {"interactive": 3, "batch": 1, "background": 1})
+    order: list[str] = []
+    threads = []
+
+    def worker(lane: str) -> None:
+        with scheduler.slot(lane):
+            order.append(lane)
+
+    with scheduler.slot("background"):
+        for lane in ["batch"] * 4 + ["interactive"] * 6:
+            thread = threading.Thread(target=worker, args=(lane,))
+            thread.start()
+            threads.append(thread)
+            queued = len(threads)
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                lanes = scheduler.stats()["lanes"]
+                if lanes["batch"]["queued"] + lanes["interactive"]["queued"] == queued:
+                    break
+                time.sleep(0.001)
+    for thread in threads:
+        thread.join(5)
+
+    assert sorted(order) == sorted(["batch"] * 4 + ["interactive"] * 6)
+    assert order[:4].count("interactive") == 3
+    assert order[:8].count("interactive") == 6
+    stats = scheduler.stats()
+    assert stats["busy"] == 0
+    assert stats["lanes"]["interactive"]["completed"] == 6
+    assert stats["lanes"]["batch"]["wait_ms"]["p95"] > 0
+
+
+def test_lane_scheduler_drops_cancelled_async_waiters() -> None:
+    import asyncio
+
+    from ai_headshot_studio.scheduler import LaneScheduler
+
+    scheduler = LaneScheduler(1)
+
+    async def scenario() -> dict[str, object]:
+        async with scheduler.run("batch"):
+            waiter = asyncio.create_task(scheduler.run("interactive").__aenter__())
+            await asyncio.sleep(0.01)
+            assert scheduler.stats()["lanes"]["interactive"]["queued"] == 1
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+        return scheduler.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["busy"] == 0
+    assert stats["lanes"]["interactive"]["queued"] == 0
+
+
+def test_lane_scheduler_round_robins_clients_within_a_lane() -> None:
+    import threading
+    import time
+
+    from ai_headshot_studio.scheduler import LaneScheduler
+
+    scheduler = LaneScheduler(1)
+    order: list[str] = []
+    threads = []
+
+    def worker(client: str) -> None:
+        with scheduler.slot("batch", client):
+            order.append(client)
+
+    with scheduler.slot("batch"):
+        for client in ["bulk"] * 4 + ["editor"] * 2:
+            thread = threading.Thread(target=worker, args=(client,))
+            thread.start()
+            threads.append(thread)
+            queued = len(threads)
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                if scheduler.stats()["lanes"]["batch"]["queued"] == queued:
+                    break
+                time.sleep(0.001)
+    for thread in threads:
+        thread.join(5)
+
+    assert order == ["bulk", "editor", "bulk", "editor", "bulk", "bulk"]
+
+
+def test_rate_limiter_charges_work_and_refills_over_time() -> None:
+    from ai_headshot_studio.ratelimit import REMOVE_BG_COST, RateLimiter, estimate_work
+
+    assert estimate_work(2000, 1500) == pytest.approx(3.0)
+    assert estimate_work(2000, 1500, remove_bg=True) == pytest.approx(3.0 * REMOVE_BG_COST)
+
+    now = [0.0]
+    limiter = RateLimiter(2.0, 10.0, max_clients=2, clock=lambda: now[0])
+    assert limiter.acquire("a", 8.0) == 0.0
+    assert limiter.acquire("a", 6.0) == pytest.approx(2.0)  # 4 short at 2 units/s
+    assert limiter.acquire("b", 6.0) == 0.0  # other clients have their own bucket
+    now[0] = 2.0
+    assert limiter.acquire("a", 6.0) == 0.0
+    # Costs above the burst are clamped, so they run once the bucket is full.
+    now[0] = 100.0
+    assert limiter.acquire("a", 500.0) == 0.0
+
+    limiter.acquire("c", 1.0)
+    stats = limiter.stats()
+    assert stats["clients"] == 2  # least recently seen client forgotten
+    assert stats["limited"] == 1
+    assert RateLimiter(0.0, 10.0).acquire("a", 1e9) == 0.0
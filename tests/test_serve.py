@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from ai_headshot_studio import serve
+from ai_headshot_studio.config import Settings
+
+
+def test_prefork_runs_each_worker_in_its_own_process(tmp_path) -> None:
+    def target() -> None:
+        (tmp_path / str(os.getpid())).write_text("ok", encoding="utf-8")
+
+    assert serve.Prefork(target, workers=3).run() == 0
+    pids = {int(path.name) for path in tmp_path.iterdir()}
+    assert len(pids) == 3
+    assert os.getpid() not in pids
+
+
+def test_prefork_stops_instead_of_respawning_a_crashing_worker(tmp_path) -> None:
+    def target() -> None:
+        (tmp_path / str(os.getpid())).write_text("started", encoding="utf-8")
+        raise RuntimeError("boom")
+
+    assert serve.Prefork(target, workers=2, min_uptime_s=30.0).run() == 1
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_preload_builds_rembg_session_only_when_onnx_runs_inline(monkeypatch) -> None:
+    from ai_headshot_studio.matting import get_backend
+
+    monkeypatch.setattr(get_backend("rembg"), "is_available", lambda: True)
+
+    monkeypatch.setattr(serve, "get_settings", lambda: Settings(matting_threads=0))
+    names = [name for name, _step in serve.preload_steps()]
+    assert names == ["imaging", "modules", "modules:rembg", "diagnostics"]
+
+    monkeypatch.setattr(serve, "get_settings", lambda: Settings(matting_threads=1))
+    names = [name for name, _step in serve.preload_steps()]
+    assert "matting:rembg" in names
+    assert "modules:rembg" not in names
+
+
+def test_serve_memory_reports_pss_for_a_process_tree(tmp_path) -> None:
+    tree = subprocess.Popen(
+        [sys.executable, "-c", "import os, time; os.fork(); time.sleep(30)"],
+    )
+    try:
+        time.sleep(0.5)
+        out = tmp_path / "memory.json"
+        proc = subprocess.run(
+            [sys.executable, "scripts/serve_memory.py", "--pid", str(tree.pid), "--json", str(out)],
+            check=False,
+            capture_output=True,
+            text=True,
+        )
+    finally:
+        children = open(f"/proc/{tree.pid}/task/{tree.pid}/children").read().split()
+        for pid in [tree.pid, *map(int, children)]:
+            os.kill(pid, signal.SIGKILL)
+        tree.wait()
+    assert proc.returncode == 0, proc.stderr
+    (row,) = json.loads(out.read_text(encoding="utf-8"))
+    assert row["processes"] == 2
+    assert 0 < row["pss"] < row["rss"]
@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import sys
+
+
+def test_startup_report_lists_package_imports_and_warmup_steps(tmp_path) -> None:
+    out = tmp_path / "startup.json"
+    proc = subprocess.run(
+        [sys.executable, "scripts/startup_report.py", "--top", "3", "--warmup", "--json", str(out)],
+        check=False,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "AI_HEADSHOT_MATTING_BACKEND": "none"},
+    )
+    assert proc.returncode == 0, proc.stderr
+    report = json.loads(out.read_text(encoding="utf-8"))
+
+    imports = report["import"]
+    assert imports["total_ms"] > 0
+    assert len(imports["top_self"]) == 3
+    modules = {row["module"] for row in imports["package"]}
+    assert {"ai_headshot_studio.app", "ai_headshot_studio.processing"} <= modules
+
+    assert report["warmup"]["state"] == "ready"
+    assert {"imaging", "face_detector", "matting:none", "diagnostics"} <= set(
+        report["warmup"]["steps"]
+    )
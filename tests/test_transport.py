@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from ai_headshot_studio import transport
+from ai_headshot_studio.processing import ProcessRequest
+
+
+def _request() -> ProcessRequest:
+    return ProcessRequest(
+        remove_bg=False,
+        background="white",
+        background_hex=None,
+        preset="avatar-400",
+        style=None,
+        top_bias=0.2,
+        brightness=1.0,
+        contrast=1.0,
+        color=1.0,
+        sharpness=1.0,
+        soften=0.0,
+        jpeg_quality=85,
+        output_format="jpeg",
+    )
+
+
+def _segments(prefix: str) -> list[Path]:
+    return list(Path("/dev/shm").glob(f"{prefix}-*"))
+
+
+def test_take_bytes_hands_over_and_unlinks_the_segment() -> None:
+    shm, ref = transport.put_bytes(b"headshot" * 1000, prefix="ahs-test")
+    shm.close()
+    assert transport.read_bytes(ref) == b"headshot" * 1000
+    assert transport.take_bytes(ref) == b"headshot" * 1000
+    with pytest.raises(FileNotFoundError):
+        transport.read_bytes(ref)
+
+
+def test_renderer_transports_return_identical_results() -> None:
+    from io import BytesIO
+
+    buf = BytesIO()
+    Image.new("RGB", (500, 600), (120, 140, 160)).save(buf, format="PNG")
+    results = {}
+    for name in transport.TRANSPORTS:
+        with transport.ProcessPoolRenderer(1, transport=name) as renderer:
+            results[name] = renderer.render(buf.getvalue(), _request())
+            prefix = renderer.prefix
+        assert _segments(prefix) == []
+
+    assert results["shm"].payload == results["pickle"].payload
+    assert results["shm"].size == (400, 400)
+    assert results["shm"].quality == 85
+
+
+def test_renderer_close_sweeps_orphaned_segments() -> None:
+    renderer = transport.ProcessPoolRenderer(1)
+    shm, _ref = transport.put_bytes(b"orphan", prefix=renderer.prefix)
+    shm.close()
+    assert len(_segments(renderer.prefix)) == 1
+    renderer.close()
+    assert _segments(renderer.prefix) == []
+
+
+def test_bench_transport_compares_pickle_and_shm(tmp_path) -> None:
+    out = tmp_path / "transport.json"
+    proc = subprocess.run(
+        [sys.executable, "scripts/bench_transport.py", "--sizes", "1", "--iters", "2"]
+        + ["--json", str(out)],
+        check=False,
+        capture_output=True,
+        text=True,
+    )
+    assert proc.returncode == 0, proc.stderr
+    assert "leaked" not in proc.stderr
+    (row,) = json.loads(out.read_text(encoding="utf-8"))["echo"]
+    assert row["pickle"]["p50_ms"] > 0
+    assert row["shm"]["p50_ms"] > 0
+    assert row["leftover_segments"] == 0